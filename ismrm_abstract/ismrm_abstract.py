@@ -12,6 +12,8 @@ The export to HTML feature requires the `pandoc` binary.
 The export to PDF feature requires both `pandoc` and `wkhtmltopdf` binaries.
 The VCS capabilities are managed through `git`, which should be installed
 and set up separately.
+The checks are also available as a library through `validate()` (no side
+effects) and `build()` (fixed version and exports).
 """
 
 #    Copyright (C) 2015-2018 Riccardo Metere <riccardo@metere.it>
@@ -52,6 +54,23 @@ import argparse  # Parser for command-line options, arguments and subcommands
 import subprocess  # Subprocess management
 import shlex  # Simple lexical analysis
 import re  # Regular expression operations
+import signal  # Set handlers for asynchronous events
+import threading  # Thread-based parallelism
+import time  # Time access and conversions
+import json  # JSON encoder and decoder
+import math  # Mathematical functions
+import statistics  # Mathematical statistics functions
+import collections  # Container datatypes
+import mmap  # Memory-mapped file support
+import concurrent.futures  # Launching parallel tasks
+import hashlib  # Secure hashes and message digests
+import struct  # Interpret bytes as packed binary data
+import zlib  # Compression compatible with gzip
+import unicodedata  # Unicode character database
+import zipfile  # Work with ZIP archives
+import socket  # Low-level networking interface
+import contextlib  # Utilities for with-statement contexts
+import html.parser  # Simple HTML and XHTML parser
 
 # :: External Imports
 
@@ -105,6 +124,7 @@ D_LIMITS = dict((
     ('wc_fig', 100),  # Max word count in figure captions
     ('n_figs', 5),  # Max number of figures
     ('fig_size', 2e6),  # Max figure size in bytes
+    ('n_refs', 0),  # Max number of references (0 for no limit)
 ))
 
 # :: external tools
@@ -117,7 +137,7 @@ TOOLS = dict((
      'wkhtmltopdf --page-size A4 --orientation portrait --print-media-type'
      ' --margin-bottom 15mm --margin-left 15mm'
      ' --margin-right 15mm --margin-top 15mm '
-     ' --javascript-delay 2000'
+     ' --javascript-delay 2000 {local_access_str}'
      # ' --image-dpi {figs_dpi} --title "{title}"'
      ' {html_filepath} {pdf_filepath}'),
     ('vcs',
@@ -126,9 +146,149 @@ TOOLS = dict((
 _MD2HTML_MULTI_CSS = '--css='
 D_LOG = '.{name}.{source}.log'
 
+# :: external tools execution control
+D_TIMEOUT = dict((
+    ('md2html', 120),  # Max seconds for a `pandoc` run
+    ('html2pdf', 300),  # Max seconds for a `wkhtmltopdf` run
+    ('vcs', 60),  # Max seconds for a `git` run
+))
+D_RETRIES = 2  # Max number of retries for transient failures
+D_BACKOFF = 1.0  # Initial delay (in seconds) before retrying
+_KILL_GRACE = 2.0  # Seconds between SIGTERM and SIGKILL
+_POLL_INTERVAL = 0.1  # Seconds between checks for timeout/cancellation
+
+# :: persistent cache and stage timings history
+D_CACHE_DIRPATH = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+    'ismrm_abstract')
+D_HISTORY_FILEPATH = os.path.join(D_CACHE_DIRPATH, 'history.jsonl')
+D_HISTORY_MAX = 1000  # Max number of timing records retained
+D_WC_CACHE_FILEPATH = os.path.join(D_CACHE_DIRPATH, 'wc_history.json')
+D_TOOLCHAIN_FILEPATH = os.path.join(D_CACHE_DIRPATH, 'toolchain.json')
+D_TOOLCHAIN_STAMP = os.path.join(D_CACHE_DIRPATH, 'toolchain.{tool}.stamp')
+
+# :: external tools capability probes: (version option, help option, flags)
+TOOL_PROBES = dict((
+    ('md2html',
+     ('--version', '--help',
+      ('--embed-resources', '--self-contained', '--mathjax'))),
+    ('html2pdf',
+     ('--version', '--extended-help',
+      ('--enable-local-file-access', '--javascript-delay',
+       '--print-media-type'))),
+    ('vcs',
+     ('--version', None, ())),
+))
+_PROBE_TIMEOUT = 10  # Max seconds for a capability probe
+_WHICH_CACHE = {}
+_TOOLCHAIN_CACHE = {}
+
 # :: gliph for marking
 GLIPH = '⋆'
 
+# :: library API results
+Document = collections.namedtuple(
+    'Document', ('filepath', 'text', 'blocks', 'wc_partial', 'wc_total',
+                 'figs'))
+Check = collections.namedtuple(
+    'Check', ('label', 'value', 'limit', 'passed', 'text'))
+Result = collections.namedtuple(
+    'Result', ('document', 'title', 'checks', 'passed', 'timings',
+               'outputs', 'notes'))
+_DOCUMENT_CACHE_SIZE = 64  # Max number of parsed documents kept warm
+
+# :: declarative checks
+RulePlan = collections.namedtuple(
+    'RulePlan', ('name', 'skip', 'sections', 'steps'))
+_RULES_METRICS = ('wc_counted', 'wc_total', 'n_sections', 'n_figs')
+_RULES_CACHE_SIZE = 16  # Max number of compiled rules kept warm
+_LIST_ITEM_PATTERN = re.compile(r'\s*(?:[0-9]+[.)]|[-*+])\s')
+# reference-style figures: `[![alt][n]][n]` (matched from the last `][`)
+_FIG_REF_PATTERN = re.compile(r'\]\[(?P<ref>[0-9]+)\]\]\[(?P=ref)\]')
+_FIG_REF_URI_PATTERN = re.compile(r'\[(?P<ref>[0-9]+)\]:(?P<uri>.*)')
+
+# :: scanners benchmark (pathological inputs)
+D_BENCH_SIZE = 2 ** 20  # Approximate size of each input in characters
+D_BENCH_MIN_THROUGHPUT = 2 ** 20  # Min characters per second
+D_BENCH_MAX_SCALING = 2.0  # Max growth of the time per character (x4 size)
+_BENCH_MIN_TIME = 0.005  # Min seconds for a reliable scaling measurement
+
+# :: figure previews
+D_PREVIEW_DIRNAME = '.preview'
+D_PREVIEW_MAX_SIZE = (1030, 410)  # Max (width, height): 2x print CSS limits
+_PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}  # color type to channels
+_PNG_ADAM7 = (  # interlacing passes: (x0, y0, dx, dy)
+    (0, 0, 8, 8), (4, 0, 8, 8), (0, 4, 4, 8), (2, 0, 4, 4),
+    (0, 2, 2, 4), (1, 0, 2, 2), (0, 1, 1, 2))
+
+# :: citations
+D_BIB_MAX_AUTHORS = 6  # Max number of authors before `et al.`
+_CITE_PATTERN = re.compile(
+    r'\[\s*(@[^\s;,\[\]]+(?:\s*[;,]\s*@[^\s;,\[\]]+)*)\s*\]')
+
+# :: per-section HTML rendering
+D_FRAGMENTS = '.{name}.fragments.json'
+_FRAGMENT_ID = 'ismrm-fragment'
+_SECTION_PATTERN = re.compile(
+    r'\s*<section\b[^>]*\bclass="[^"]*\blevel([1-6])\b')
+
+# :: submission package
+D_PACKAGE_REPORT = 'report.md'
+D_ZIP_LEVEL = 6  # Deflate compression level (0 to store all members)
+_ZIP_STORED_EXTS = ('.png', '.jpg', '.jpeg', '.gif')  # already compressed
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)  # earliest timestamp allowed in ZIP
+_ZIP_COMMENT = 'ismrm_abstract sha1:{}'
+
+# :: multi-abstract bundles
+# top-level header: `# Title` or `Title` underlined with `=`
+_BUNDLE_HDR_PATTERN = re.compile(
+    br'^(?:# [^\r\n]*|[^\r\n]+\r?\n=+[ \t]*)\r?$', re.MULTILINE)
+D_BUNDLE_FMT = '{in_basename}.{index:03d}.md'
+D_JOURNAL = '.{name}.journal.jsonl'
+# arguments not affecting the outputs (ignored in the journal input hashes)
+_JOURNAL_IGNORED_ARGS = (
+    'force', 'verbose', 'backup', 'log', 'timeout', 'retries', 'cancel',
+    'history_filepath')
+
+# :: corpus analytics
+D_PERCENTILES = (5, 25, 50, 75, 95)
+# limit usage histogram edges (fraction of limit), the last bin is open
+D_USAGE_BINS = (0.0, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 2.0)
+D_CORPUS_MIN_SHARE = 0.01  # Min fraction of abstracts to show a section
+
+# :: near-duplicate detection
+D_DUP_THRESHOLD = 0.5  # Min estimated Jaccard similarity to report
+D_SHINGLE_SIZE = 5  # Number of words in each shingle
+D_MINHASH_PERM = 128  # Length of the MinHash signatures
+D_LSH_RECALL = 0.95  # Min probability of finding pairs at the threshold
+D_MINHASH_CACHE_FILEPATH = os.path.join(D_CACHE_DIRPATH, 'minhash.json')
+_MINHASH_SEED = 1
+_MINHASH_CACHE_MAX = 20000  # Max number of section signatures retained
+
+# :: concurrent invocations on the same abstract
+D_LOCK = '.{name}.lock'
+D_DIRTY = '.{name}.dirty'
+
+# :: shared-filesystem work queue
+D_QUEUE_LEASE = 120.0  # Seconds before an unrenewed lease expires
+D_QUEUE_IDLE = 60.0  # Seconds a worker waits for work before exiting
+_QUEUE_POLL = 0.5  # Seconds between queue scans
+_QUEUE_DIRNAMES = ('todo', 'leased', 'done')
+
+# :: resident daemon (see also: `ismrm_client.py`)
+D_DAEMON_SOCKET = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or D_CACHE_DIRPATH,
+    'ismrm_abstract.sock')
+D_DAEMON_IDLE = 1800  # Seconds without requests before the daemon exits
+_DAEMON_FRAME = struct.Struct('>cI')  # channel, length
+
+# :: command-line arguments selecting an alternate mode of operation
+_MODE_ARGS = (
+    'bundle', 'jobs', 'explain', 'history', 'wc_history', 'wc_diff',
+    'toolchain', 'usage', 'wait', 'analytics', 'duplicates', 'resume',
+    'daemon', 'queue', 'worker', 'benchmark')
+
 # :: test results additional text
 D_TESTS_TITLE = 'Test Results'
 D_TESTS_FINAL = 'Final Result: {result}'
@@ -350,23 +510,400 @@ def which(args):
     if dirpath:
         is_valid = is_executable(cmd)
     else:
+        # successful resolutions are cached (and re-checked on use)
+        key = (cmd, os.environ['PATH'])
+        if key in _WHICH_CACHE and is_executable(_WHICH_CACHE[key]):
+            return [_WHICH_CACHE[key]] + args[1:], True
         is_valid = False
         for dirpath in os.environ['PATH'].split(os.pathsep):
             dirpath = dirpath.strip('"')
             tmp = os.path.join(dirpath, cmd)
             is_valid = is_executable(tmp)
             if is_valid:
-                cmd = tmp
+                _WHICH_CACHE[key] = cmd = tmp
                 break
     return [cmd] + args[1:], is_valid
 
 
+# ======================================================================
+def log_event(
+        log,
+        name,
+        text,
+        encoding='utf-8'):
+    """
+    Append a timestamped event to the events log of an external tool.
+
+    Args:
+        log (str|None): The template filename to be used for logs.
+            If None, no logs are produced.
+        name (str): The name of the external tool.
+        text (str): The event description.
+        encoding (str): The encoding to use.
+
+    Returns:
+        None.
+    """
+    if log:
+        source = 'events'
+        log_filepath = log.format_map(vars())
+        with open(log_filepath, 'ab') as fileobj:
+            fileobj.write('{} {}\n'.format(
+                datetime.datetime.now().isoformat(), text).encode(encoding))
+
+
+# ======================================================================
+def kill_group(proc, grace=_KILL_GRACE):
+    """
+    Terminate a process and all its children.
+
+    The process is expected to lead its own process group (session).
+    First, SIGTERM is sent to the group; if the process has not exited
+    after `grace` seconds, SIGKILL is sent.
+    The process must not be reaped concurrently by another thread, as its
+    ID could then be reused (see `_reap()`).
+
+    Args:
+        proc (subprocess.Popen): The process to terminate.
+        grace (float): Seconds to wait before forcing the termination.
+
+    Returns:
+        None.
+    """
+    for sig, wait in ((signal.SIGTERM, grace), (signal.SIGKILL, None)):
+        try:
+            os.killpg(proc.pid, sig)
+        except (OSError, AttributeError):
+            # no process group support or process already gone
+            try:
+                proc.send_signal(sig)
+            except OSError:
+                pass
+        if wait is None:
+            break
+        deadline = time.monotonic() + wait
+        while proc.poll() is None and time.monotonic() < deadline:
+            time.sleep(_POLL_INTERVAL)
+        if proc.poll() is not None:
+            break
+
+
+# ======================================================================
+def _communicate(
+        proc,
+        in_data=None):
+    """
+    Exchange data with a process until its output is closed.
+
+    Unlike `subprocess.Popen.communicate()`, the process is not reaped, so
+    that its resource usage can be collected (see `_reap()`).
+    Input and standard error are handled by helper threads.
+
+    Args:
+        proc (subprocess.Popen): The process.
+            Its stdout and stderr must be pipes.
+        in_data (bytes|None): The data to send to stdin (if it is a pipe).
+
+    Returns:
+        p_stdout (bytes): The stdout of the process.
+        p_stderr (bytes): The stderr of the process.
+    """
+    chunks = []
+
+    def _write():
+        try:
+            if in_data:
+                proc.stdin.write(in_data)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass  # : the process exited without reading all of its input
+
+    helpers = [threading.Thread(
+        target=lambda: chunks.append(proc.stderr.read()), daemon=True)]
+    if proc.stdin:
+        helpers.append(threading.Thread(target=_write, daemon=True))
+    for helper in helpers:
+        helper.start()
+    p_stdout = proc.stdout.read()
+    for helper in helpers:
+        helper.join()
+    proc.stdout.close()
+    proc.stderr.close()
+    return p_stdout, chunks[0]
+
+
+# ======================================================================
+def _reap(
+        proc,
+        lock):
+    """
+    Wait for a process to terminate, collecting its resource usage.
+
+    The process is reaped with `os.wait4()` (where available), as
+    `subprocess.Popen.wait()` discards the resource usage.
+    The process is only reaped while holding `lock`, so that other threads
+    holding it (see `_watchdog()`) can signal the process group without
+    risking to hit a reused process ID.
+    The termination is awaited without reaping (with `os.waitid()`, where
+    available) or by polling, so that the lock is not held meanwhile.
+
+    Args:
+        proc (subprocess.Popen): The process.
+        lock (threading.Lock): The lock guarding the reaping.
+
+    Returns:
+        ret_code (int): The return code of the process.
+            Negative if the process was killed by a signal.
+        rusage (resource.struct_rusage|None): The resource usage.
+            If not available (e.g. the process was already reaped by
+            `kill_group()`), returns None.
+    """
+    if hasattr(os, 'wait4'):
+        delay = 0.001
+        try:
+            if hasattr(os, 'waitid'):
+                # : a terminated (not reaped) process keeps its ID
+                os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+            while True:
+                with lock:
+                    if proc.returncode is not None:
+                        break  # : reaped by `kill_group()`
+                    pid, status, rusage = os.wait4(
+                        proc.pid, 0 if hasattr(os, 'waitid') else os.WNOHANG)
+                    if pid:
+                        proc.returncode = -os.WTERMSIG(status) \
+                            if os.WIFSIGNALED(status) \
+                            else os.WEXITSTATUS(status)
+                        return proc.returncode, rusage
+                time.sleep(delay)
+                delay = min(delay * 2, _POLL_INTERVAL)
+        except ChildProcessError:
+            pass
+    with lock:
+        return proc.wait(), None
+
+
+# ======================================================================
+def resource_usage(
+        rusage,
+        wall_time):
+    """
+    Summarize the resource usage of a child process.
+
+    Args:
+        rusage (resource.struct_rusage|None): The resource usage.
+        wall_time (float): The wall time in seconds.
+
+    Returns:
+        usage (dict): The resource usage.
+            Contains: 'wall', 'user', 'sys' (in seconds), 'max_rss',
+            'in_bytes', 'out_bytes' (in bytes).
+            Only 'wall' is available if `rusage` is None.
+    """
+    usage = dict(wall=wall_time)
+    if rusage is not None:
+        # `ru_maxrss` is in bytes on macOS and in kilobytes elsewhere
+        rss_unit = 1 if sys.platform == 'darwin' else 1024
+        usage.update(
+            user=rusage.ru_utime, sys=rusage.ru_stime,
+            max_rss=rusage.ru_maxrss * rss_unit,
+            in_bytes=rusage.ru_inblock * 512,
+            out_bytes=rusage.ru_oublock * 512)
+    return usage
+
+
+# ======================================================================
+def format_usage(usage):
+    """
+    Format the resource usage of a child process for display.
+
+    Args:
+        usage (dict): The resource usage, as obtained from `resource_usage()`.
+
+    Returns:
+        text (str): The formatted resource usage.
+
+    Examples:
+        >>> format_usage(dict(wall=1.5))
+        'wall 1.50s'
+        >>> format_usage(dict(
+        ...     wall=1.5, user=1.0, sys=0.25, max_rss=2 ** 20,
+        ...     in_bytes=0, out_bytes=3e6))
+        'wall 1.50s, user 1.00s, sys 0.25s, rss 1.0MB, in 0.0MB, out 2.9MB'
+    """
+    fmts = (
+        ('wall', 'wall', '{:.2f}s', 1),
+        ('user', 'user', '{:.2f}s', 1),
+        ('sys', 'sys', '{:.2f}s', 1),
+        ('max_rss', 'rss', '{:.1f}MB', 2 ** 20),
+        ('in_bytes', 'in', '{:.1f}MB', 2 ** 20),
+        ('out_bytes', 'out', '{:.1f}MB', 2 ** 20))
+    return ', '.join(
+        '{} {}'.format(label, fmt.format(usage[key] / scale))
+        for key, label, fmt, scale in fmts if key in usage)
+
+
+# ======================================================================
+def usage_summary(
+        dirpath,
+        log=D_LOG):
+    """
+    Aggregate the resource usage logs of the external tools.
+
+    Args:
+        dirpath (str): The directory to search (recursively) for logs.
+        log (str): The template filename used for logs.
+
+    Returns:
+        summary (dict): The aggregated usage for each tool.
+            Each value is a dict containing: 'runs', 'wall', 'user', 'sys',
+            'in_bytes', 'out_bytes' (totals) and 'max_rss' (maximum).
+    """
+    pattern = re.compile(
+        '^' + re.escape(log).replace(
+            re.escape('{name}'), '(?P<name>.+)').replace(
+            re.escape('{source}'), 'usage') + '$')
+    summary = {}
+    for root, dirnames, filenames in os.walk(dirpath):
+        for filename in filenames:
+            match = pattern.match(filename)
+            if not match:
+                continue
+            with open(os.path.join(root, filename), 'rb') as fileobj:
+                for line in fileobj:
+                    try:
+                        usage = json.loads(line.decode('utf-8'))
+                    except ValueError:
+                        continue
+                    item = summary.setdefault(match.group('name'), dict(
+                        runs=0, wall=0.0, user=0.0, sys=0.0, in_bytes=0,
+                        out_bytes=0, max_rss=0))
+                    item['runs'] += 1
+                    for key in ('wall', 'user', 'sys', 'in_bytes',
+                                'out_bytes'):
+                        item[key] += usage.get(key, 0)
+                    item['max_rss'] = max(
+                        item['max_rss'], usage.get('max_rss', 0))
+    return summary
+
+
+# ======================================================================
+def print_usage_summary(
+        dirpath,
+        verbose=D_VERB_LVL):
+    """
+    Display the aggregated resource usage of the external tools.
+
+    Args:
+        dirpath (str): The directory to search (recursively) for logs.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        summary (dict): The output of `usage_summary()`.
+    """
+    summary = usage_summary(dirpath)
+    for name, usage in sorted(
+            summary.items(), key=lambda item: -item[1]['wall']):
+        msg('I: {:<12s} {:>5d} runs: {}'.format(
+            name, usage['runs'], format_usage(usage)), verbose)
+    return summary
+
+
+# ======================================================================
+def _watchdog(proc, timeout, cancel, state):
+    """
+    Kill a running process on timeout or cancellation.
+
+    The process is not polled (so that it is only reaped by `_reap()`): the
+    watch ends when `state['done']` is set.
+    The process group is only signalled while holding `state['lock']` and
+    if the process was not reaped yet, so that a reused process ID cannot
+    be hit.
+
+    Args:
+        proc (subprocess.Popen): The process to watch.
+        timeout (float|None): Timeout of the process in seconds.
+        cancel (threading.Event|None): Cooperative cancellation flag.
+        state (dict): Shared state, updated with the `reason` for killing.
+            Contains: `reason`, `done` (threading.Event) and `lock`
+            (threading.Lock, guarding the reaping).
+
+    Returns:
+        None.
+    """
+    deadline = time.monotonic() + timeout if timeout else None
+    while not state['done'].is_set():
+        if cancel is not None and cancel.is_set():
+            state['reason'] = 'cancelled'
+        elif deadline is not None and time.monotonic() > deadline:
+            state['reason'] = 'timeout'
+        if state['reason']:
+            with state['lock']:
+                if proc.returncode is None:
+                    kill_group(proc)
+            break
+        state['done'].wait(_POLL_INTERVAL)
+
+
+# ======================================================================
+@contextlib.contextmanager
+def cancellation(signums=(signal.SIGINT, signal.SIGTERM)):
+    """
+    Provide a cooperative cancellation flag, set on interruption.
+
+    While active, the signals set the flag (so that the external tool runs
+    of all threads are aborted, see `execute()`) and then interrupt the main
+    thread with `KeyboardInterrupt`.
+    The signal handlers are only installed from the main thread, and are
+    restored on exit.
+
+    Args:
+        signums (Iterable[int]): The signals to handle.
+
+    Yields:
+        cancel (threading.Event): The cancellation flag.
+
+    Examples:
+        >>> with cancellation() as cancel:
+        ...     cancel.is_set()
+        False
+        >>> try:
+        ...     with cancellation() as cancel:
+        ...         os.kill(os.getpid(), signal.SIGTERM)
+        ...         time.sleep(10)
+        ... except KeyboardInterrupt:
+        ...     cancel.is_set()
+        True
+    """
+    cancel = threading.Event()
+
+    def _handler(signum, frame):
+        cancel.set()
+        raise KeyboardInterrupt
+
+    handlers = {}
+    if threading.current_thread() is threading.main_thread():
+        for signum in signums:
+            handlers[signum] = signal.signal(signum, _handler)
+    try:
+        yield cancel
+    except BaseException:
+        cancel.set()
+        raise
+    finally:
+        for signum, handler in handlers.items():
+            signal.signal(signum, handler)
+
+
 # ======================================================================
 def execute(
         args,
         in_pipe=None,
         mode='call',
         timeout=None,
+        retries=0,
+        backoff=D_BACKOFF,
+        cancel=None,
         encoding='utf-8',
         log=None,
         dry=False,
@@ -386,7 +923,17 @@ def execute(
              - 'flush': Call new process and get stdout+stderr immediately.
                 Once completed, obtain the return code.
                 Unfortunately, there is no easy
-        timeout (float): Timeout of the process in seconds.
+        timeout (float|None): Timeout of the process in seconds.
+            When expired, the whole process group is killed.
+            If None, no timeout is enforced.
+        retries (int): Max number of retries for transient failures.
+            A failure is transient if the process timed out or was killed
+            by a signal (and not cancelled).
+        backoff (float): Delay before the first retry in seconds.
+            The delay is doubled at each subsequent retry.
+        cancel (threading.Event|None): Cooperative cancellation flag.
+            If set while the process is running, the process group is
+            killed and no further retries are attempted.
         encoding (str): The encoding to use.
         log (str): The template filename to be used for logs.
             If None, no logs are produced.
@@ -405,228 +952,726 @@ def execute(
         msg('{} {}'.format('$$' if dry else '>>', ' '.join(args)),
             verbose, D_VERB_LVL if dry else VERB_LVL['medium'])
     else:
-        msg('W: `{}` is not in available in $PATH.'.format(args[0]))
+        msg('W: `{}` is not in available in $PATH.'.format(args[0]),
+            verbose)
 
-    if not dry and is_valid:
+    name = os.path.basename(args[0])
+    attempt = 0
+    while not dry and is_valid:
+        if cancel is not None and cancel.is_set():
+            msg('W: `{}` cancelled before start.'.format(name), verbose)
+            log_event(log, name, 'cancelled before start', encoding)
+            break
         if in_pipe is not None:
             msg('< {}'.format(in_pipe),
                 verbose, VERB_LVL['highest'])
 
+        begin_time, begin_clock = time.time(), time.monotonic()
+        rusage = None
         proc = subprocess.Popen(
             args,
             stdin=subprocess.PIPE if in_pipe and not mode == 'flush' else None,
             stdout=subprocess.PIPE if mode != 'spawn' else None,
             stderr=subprocess.PIPE if mode == 'call' else subprocess.STDOUT,
-            shell=False)
+            shell=False,
+            start_new_session=True)
+        if mode == 'spawn':
+            break
+
+        state = dict(
+            reason=None, done=threading.Event(), lock=threading.Lock())
+        watchdog = threading.Thread(
+            target=_watchdog, args=(proc, timeout, cancel, state))
+        watchdog.daemon = True
+        watchdog.start()
 
         # handle stdout nd stderr
-        if mode == 'flush' and not in_pipe:
-            p_stdout = ''
-            while proc.poll() is None:
-                out_buff = proc.stdout.readline().decode(encoding)
-                p_stdout += out_buff
-                msg(out_buff, fmtt='', end='')
-                sys.stdout.flush()
-            ret_code = proc.wait()
-        elif mode == 'call':
-            # try:
-            p_stdout, p_stderr = proc.communicate(
-                in_pipe.encode(encoding) if in_pipe else None)
-            # except subprocess.TimeoutExpired:
-            #     proc.kill()
-            #     p_stdout, p_stderr = proc.communicate()
-            p_stdout = p_stdout.decode(encoding)
-            p_stderr = p_stderr.decode(encoding)
-            if p_stdout:
-                msg(p_stdout, verbose, VERB_LVL['high'], fmtt='')
-            if p_stderr:
-                msg(p_stderr, verbose, VERB_LVL['high'], fmtt='')
-            ret_code = proc.wait()
-        else:
-            proc.kill()
-            msg('E: mode `{}` and `in_pipe` not supported.'.format(mode))
+        try:
+            if mode == 'flush' and not in_pipe:
+                p_stdout = ''
+                for out_buff in iter(proc.stdout.readline, b''):
+                    out_buff = out_buff.decode(encoding)
+                    p_stdout += out_buff
+                    msg(out_buff, fmtt='', end='')
+                    sys.stdout.flush()
+                proc.stdout.close()
+                ret_code, rusage = _reap(proc, state['lock'])
+            elif mode == 'call':
+                p_stdout, p_stderr = _communicate(
+                    proc, in_pipe.encode(encoding) if in_pipe else None)
+                p_stdout = p_stdout.decode(encoding)
+                p_stderr = p_stderr.decode(encoding)
+                if p_stdout:
+                    msg(p_stdout, verbose, VERB_LVL['high'], fmtt='')
+                if p_stderr:
+                    msg(p_stderr, verbose, VERB_LVL['high'], fmtt='')
+                ret_code, rusage = _reap(proc, state['lock'])
+            else:
+                with state['lock']:
+                    kill_group(proc)
+                msg('E: mode `{}` and `in_pipe` not supported.'.format(mode),
+                    verbose)
+        except BaseException:
+            # : e.g. `KeyboardInterrupt`: do not leave the group running
+            with state['lock']:
+                if proc.returncode is None:
+                    kill_group(proc)
+            raise
+        finally:
+            state['done'].set()
+            watchdog.join()
+        usage = resource_usage(
+            rusage, time.monotonic() - begin_clock)
+        msg('<< {}: {}'.format(name, format_usage(usage)),
+            verbose, VERB_LVL['medium'])
 
         if log:
-            name = os.path.basename(args[0])
             pid = proc.pid
             for stream, source in ((p_stdout, 'out'), (p_stderr, 'err')):
                 if stream:
                     log_filepath = log.format_map(vars())
                     with open(log_filepath, 'wb') as fileobj:
                         fileobj.write(stream.encode(encoding))
+            source = 'usage'
+            usage.update(
+                time=begin_time, args=args, pid=pid, ret_code=ret_code,
+                attempt=attempt)
+            with open(log.format_map(vars()), 'ab') as fileobj:
+                fileobj.write((json.dumps(usage) + '\n').encode(encoding))
+
+        if state['reason'] == 'timeout':
+            text = 'timed out after {}s (attempt {}/{})'.format(
+                timeout, attempt + 1, retries + 1)
+        elif state['reason'] == 'cancelled':
+            text = 'cancelled (attempt {}/{})'.format(
+                attempt + 1, retries + 1)
+        elif ret_code is not None and ret_code < 0:
+            text = 'killed by signal {} (attempt {}/{})'.format(
+                -ret_code, attempt + 1, retries + 1)
+        else:
+            break
+        msg('W: `{}` {}.'.format(name, text), verbose)
+        log_event(log, name, text, encoding)
+        if state['reason'] == 'cancelled' or attempt >= retries:
+            break
+        delay = backoff * 2 ** attempt
+        text = 'retrying in {:.1f}s'.format(delay)
+        msg('W: `{}` {}.'.format(name, text), verbose, VERB_LVL['low'])
+        log_event(log, name, text, encoding)
+        if cancel is not None:
+            cancel.wait(delay)
+        else:
+            time.sleep(delay)
+        attempt += 1
     return ret_code, p_stdout, p_stderr
 
 
 # ======================================================================
-def multi_replace(text, replaces):
+def _probe_tool(tool):
     """
-    Perform multiple replacements in a string.
+    Probe the version and the supported flags of an external tool.
 
     Args:
-        text (str): The input string.
-        replaces (tuple[str,str]): The listing of the replacements.
-            Format: ((<old>, <new>), ...).
+        tool (str): The external tool identifier (a key of `TOOLS`).
 
     Returns:
-        text (str): The string after the performed replacements.
-
-    Examples:
-        >>> multi_replace('python.best', (('thon', 'mrt'), ('est', 'ase')))
-        'pymrt.base'
-        >>> multi_replace('x-x-x-x', (('x', 'est'), ('est', 'test')))
-        'test-test-test-test'
-        >>> multi_replace('x-x-', (('-x-', '.test'),))
-        'x.test'
+        entry (dict): The tool information.
+            Contains: 'path', 'version', 'flags' (flag to bool), 'key'
+            (the binary fingerprint: realpath, mtime, inode and size).
     """
-    return functools.reduce(lambda s, r: s.replace(*r), replaces, text)
+    version_opt, help_opt, flags = TOOL_PROBES.get(tool, (None, None, ()))
+    args, is_valid = which(shlex.split(TOOLS[tool])[:1])
+    entry = dict(path=None, version=None, flags={}, key=None)
+    if not is_valid:
+        return entry
+    entry['path'] = args[0]
+    entry['key'] = _tool_key(args[0])
+    kws = dict(timeout=_PROBE_TIMEOUT, verbose=VERB_LVL['none'])
+    if version_opt:
+        ret_code, p_stdout, p_stderr = execute(args + [version_opt], **kws)
+        text = (p_stdout or '') + (p_stderr or '')
+        entry['version'] = text.strip().splitlines()[0] if text.strip() \
+            else None
+    if help_opt and flags:
+        ret_code, p_stdout, p_stderr = execute(args + [help_opt], **kws)
+        text = (p_stdout or '') + (p_stderr or '')
+        entry['flags'] = dict(
+            (flag, re.search(re.escape(flag) + r'\b', text) is not None)
+            for flag in flags)
+    return entry
 
 
 # ======================================================================
-def check_redo(
-        in_filepaths,
-        out_filepaths,
-        force=False,
-        verbose=D_VERB_LVL,
-        makedirs=False,
-        no_empty_input=False):
+def _tool_key(filepath):
     """
-    Check if input files are newer than output files, to force calculation.
+    Compute the fingerprint of an executable.
 
     Args:
-        in_filepaths (Iterable[str]|None): Input filepaths for computation.
-        out_filepaths (Iterable[str]): Output filepaths for computation.
-        force (bool): Force computation to be re-done.
-        verbose (int): Set level of verbosity.
-        makedirs (bool): Create output dirpaths if not existing.
-        no_empty_input (bool): Check if the input filepath list is empty.
+        filepath (str): The executable filepath.
 
     Returns:
-        force (bool): True if the computation is to be re-done.
+        key (list): The realpath, mtime, inode and size of the executable.
+    """
+    real_filepath = os.path.realpath(filepath)
+    stat = os.stat(real_filepath)
+    return [real_filepath, stat.st_mtime, stat.st_ino, stat.st_size]
 
-    Raises:
-        IndexError: If the input filepath list is empty.
-            Only if `no_empty_input` is True.
-        IOError: If any of the input files do not exist.
+
+# ======================================================================
+def toolchain(
+        tools=None,
+        refresh=False,
+        cache_filepath=D_TOOLCHAIN_FILEPATH):
     """
-    # check if output exists
-    if not force:
-        for out_filepath in out_filepaths:
-            if out_filepath and not os.path.exists(out_filepath):
-                force = True
-                break
+    Resolve and probe the external tools, with caching.
 
-    # create output directories
-    if force and makedirs:
-        for out_filepath in out_filepaths:
-            out_dirpath = os.path.dirname(out_filepath)
-            if not os.path.isdir(out_dirpath):
-                msg('mkdir: {}'.format(out_dirpath),
-                    verbose, VERB_LVL['highest'])
-                os.makedirs(out_dirpath)
+    Tools are resolved once per `$PATH` and probed in parallel.
+    Results are cached in memory and on disk, keyed by `$PATH` and by the
+    binary fingerprint (mtime, inode and size), so that a tool is only
+    re-probed when it changes.
+    Whenever the resolved tool or its information changes (e.g. when using a
+    different `$PATH`), its stamp file (see `toolchain_stamp()`) is
+    rewritten, so that outputs depending on it are rebuilt by
+    `check_redo()`.
 
-    # check if input is older than output
-    if not force:
-        # check if input is not empty
-        if in_filepaths:
-            # check if input exists
-            for in_filepath in in_filepaths:
-                if not os.path.exists(in_filepath):
-                    raise IOError('Input file does not exists.')
-
-            for in_filepath, out_filepath in \
-                    itertools.product(in_filepaths, out_filepaths):
-                if os.path.getmtime(in_filepath) > os.path.getmtime(
-                        out_filepath):
-                    force = True
-                    break
-        elif no_empty_input:
-            raise IOError('Input file list is empty.')
+    Args:
+        tools (Iterable[str]|None): The external tool identifiers.
+            If None, all `TOOLS` are used.
+        refresh (bool): Force probing all tools again.
+        cache_filepath (str|None): The toolchain cache filepath.
+            If None, no on-disk cache is used.
 
-    if force:
-        msg('Calc: {}'.format(out_filepaths), verbose, VERB_LVL['higher'])
-        msg('From: {}'.format(in_filepaths), verbose, VERB_LVL['highest'])
-    else:
-        msg('Skip: {}'.format(out_filepaths), verbose, VERB_LVL['higher'])
-        msg('From: {}'.format(in_filepaths), verbose, VERB_LVL['highest'])
-    return force
+    Returns:
+        registry (dict): The tool information for each tool.
+            See `_probe_tool()` for the content of each entry.
+    """
+    tools = list(TOOLS.keys()) if tools is None else list(tools)
+    env_path = os.environ.get('PATH', '')
+    registry = _TOOLCHAIN_CACHE.setdefault(env_path, {})
+    cached = {}
+    if cache_filepath and not all(tool in registry for tool in tools):
+        cached = _load_json(cache_filepath, {}).get(env_path, {})
+
+    def _is_current(tool, entry):
+        if entry is None or refresh:
+            return False
+        elif entry['path'] is None:
+            return not which(shlex.split(TOOLS[tool])[:1])[1]
+        try:
+            return _tool_key(entry['path']) == entry['key']
+        except OSError:
+            return False
+
+    todo = []
+    for tool in tools:
+        entry = registry.get(tool) or cached.get(tool)
+        if _is_current(tool, entry):
+            registry[tool] = entry
+        else:
+            todo.append(tool)
+    if todo:
+        with concurrent.futures.ThreadPoolExecutor(len(todo)) as executor:
+            entries = list(executor.map(_probe_tool, todo))
+        registry.update(zip(todo, entries))
+        if cache_filepath:
+            all_cached = _load_json(cache_filepath, {})
+            all_cached.setdefault(env_path, {}).update(
+                (tool, registry[tool]) for tool in todo)
+            _save_json(cache_filepath, all_cached)
+    # : the stamp is shared by all `$PATH` values, but records the tool
+    for tool in tools:
+        stamp = toolchain_stamp(tool)
+        data = json.dumps(dict(
+            (k, registry[tool].get(k)) for k in ('path', 'version', 'flags')),
+            sort_keys=True).encode('utf-8')
+        try:
+            with open(stamp, 'rb') as fileobj:
+                is_current = fileobj.read() == data
+        except (IOError, OSError):
+            is_current = False
+        if not is_current:
+            try:
+                if not os.path.isdir(os.path.dirname(stamp)):
+                    os.makedirs(os.path.dirname(stamp))
+                write_atomic(stamp, data)
+            except (IOError, OSError):
+                pass
+    return dict((tool, registry[tool]) for tool in tools)
 
 
 # ======================================================================
-def word_count(
-        in_filepath,
-        skip_tokens=D_SKIP_TOKENS,
-        hdr_tokens=D_HDR_TOKENS,
-        hdr_tokens_nl=D_HDR_TOKENS_NL,
-        skip_sections=(),
-        encoding='utf-8'):
+def toolchain_stamp(tool):
     """
-    Calculate word count for each Markdown section.
+    Determine the stamp filepath of an external tool.
+
+    The stamp records the resolved tool, and it is rewritten by
+    `toolchain()` whenever the tool, its version or its capabilities change
+    (including switching between tools resolved from different `$PATH`
+    values), so that it can be used as input for rebuild decisions.
 
     Args:
-        in_filepath (str): The path to the input file.
-        skip_tokens (Iterable[str]): Skip token identifier.
-            Ignore lines starting with any of the tokens indicated.
-        hdr_tokens (Iterable[str]): Header token identifier.
-            Lines stating with any of the tokens are considered header.
-        hdr_tokens_nl (Iterable[str]): Header-after-new-line token identifier.
-            Ignore lines immediately above and starting with any of the tokens
-            indicated.
-        skip_sections (Iterable[str]): Skip from word count.
-            The sections included in this list will not count toward the
-            total word count.
-        encoding (str): The encoding to use.
+        tool (str): The external tool identifier (a key of `TOOLS`).
 
     Returns:
-        blocks (list[dict]): A list of dicts containing section info.
-            Each dict contains:
-                - 'title': the section title as a text string.
-                - 'level': level of heading (1 to 6).
-                - 'text': the section text as a list of text string lines.
-                - 'num_words': the number of words as int.
-                - 'skip': False if block is skipped in partial counts.
-        wc_partial (int): The partial number of words.
-            Titles and sections to skip are not included.
-        wc_total (int): The total number of words.
-            Titles are excludes, sections to skip are included.
+        filepath (str): The stamp filepath.
     """
-    with open(in_filepath, 'rb') as i_file:
-        blocks = []
-        lines = []
-        len_last_line = 0
-        for line in i_file.read().decode(encoding).splitlines():
-            for i, token in enumerate(hdr_tokens):
-                if line.startswith(token):
-                    if len(blocks) > 0:
-                        blocks[-1]['text'] = lines
-                        lines = []
-                    blocks.append(
-                        {'title': line[len(token):], 'text': [], 'level': i})
-            skip_line = False
-            for skip_token in skip_tokens:
-                if line.startswith(skip_token):
-                    skip_line = True
-            if skip_line:
-                continue
-            was_title = False
-            for i, token in enumerate(hdr_tokens_nl):
-                if len(line) == len_last_line and line.startswith(token):
-                    was_title = True
-            if was_title:
-                title = lines.pop()
-                if len(blocks) > 0:
-                    blocks[-1]['text'] = lines
-                    lines = []
-                blocks.append({'title': title, 'text': [], 'level': i})
-            elif len(line) > 0:
-                # print(':: ', line)  # DEBUG
-                lines.append(line)
-            len_last_line = len(line)
-        if blocks:
-            blocks[-1]['text'] = lines
+    return D_TOOLCHAIN_STAMP.format(tool=tool)
 
-    wc_partial = 0
-    wc_total = 0
-    for i, block in enumerate(blocks):
+
+# ======================================================================
+def tool_flag(
+        tool,
+        flag):
+    """
+    Check if an external tool supports a specific flag.
+
+    Args:
+        tool (str): The external tool identifier (a key of `TOOLS`).
+        flag (str): The flag to check (as listed in `TOOL_PROBES`).
+
+    Returns:
+        supported (bool): True if the flag is supported.
+    """
+    return toolchain([tool])[tool]['flags'].get(flag, False)
+
+
+# ======================================================================
+def print_toolchain(
+        refresh=False,
+        verbose=D_VERB_LVL):
+    """
+    Display the external tools information.
+
+    Args:
+        refresh (bool): Force probing all tools again.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        registry (dict): The output of `toolchain()`.
+    """
+    registry = toolchain(refresh=refresh)
+    for tool, entry in sorted(registry.items()):
+        if entry['path']:
+            msg('I: {:<10s} {}'.format(tool, entry['path']), verbose)
+            msg('   {:<10s} {}'.format('', entry['version']), verbose)
+            for flag, supported in sorted(entry['flags'].items()):
+                msg('   {:<10s} {} {}'.format(
+                    '', '+' if supported else '-', flag), verbose)
+        else:
+            msg('W: {:<10s} `{}` not found.'.format(
+                tool, tool_name(tool)), verbose)
+    return registry
+
+
+# ======================================================================
+def record_timing(
+        tool,
+        size,
+        duration,
+        ret_code=0,
+        history_filepath=D_HISTORY_FILEPATH,
+        max_records=D_HISTORY_MAX):
+    """
+    Append a stage timing record to the local history.
+
+    The history is stored as JSON lines and it is trimmed to the most
+    recent `max_records` records when it grows past twice that size.
+
+    Args:
+        tool (str): The name of the tool (or in-process stage).
+        size (int): The size of the stage input in bytes.
+        duration (float): The wall time of the stage in seconds.
+        ret_code (int|None): The return code of the stage.
+        history_filepath (str|None): The history filepath.
+            If None, no record is written.
+        max_records (int): Max number of records retained.
+
+    Returns:
+        None.
+    """
+    if not history_filepath:
+        return
+    record = dict(
+        time=time.time(), tool=tool, size=int(size),
+        duration=float(duration), ret_code=ret_code)
+    try:
+        dirpath = os.path.dirname(history_filepath)
+        if dirpath and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        with open(history_filepath, 'ab') as fileobj:
+            fileobj.write((json.dumps(record) + '\n').encode('utf-8'))
+        if os.path.getsize(history_filepath) > max_records * 2 * 128:
+            records = load_history(history_filepath)
+            if len(records) > max_records * 2:
+                tmp_filepath = temp_filepath(history_filepath)
+                with open(tmp_filepath, 'wb') as fileobj:
+                    for record in records[-max_records:]:
+                        fileobj.write(
+                            (json.dumps(record) + '\n').encode('utf-8'))
+                os.replace(tmp_filepath, history_filepath)
+    except (IOError, OSError):
+        pass
+
+
+# ======================================================================
+def load_history(
+        history_filepath=D_HISTORY_FILEPATH,
+        tool=None,
+        last=None):
+    """
+    Load the stage timing records from the local history.
+
+    Args:
+        history_filepath (str): The history filepath.
+        tool (str|None): Only include records of the specified tool.
+        last (int|None): Only include the most recent records.
+
+    Returns:
+        records (list[dict]): The timing records, oldest first.
+            Each dict contains: 'time', 'tool', 'size', 'duration',
+            'ret_code'.
+    """
+    records = []
+    try:
+        with open(history_filepath, 'rb') as fileobj:
+            for line in fileobj:
+                try:
+                    record = json.loads(line.decode('utf-8'))
+                except ValueError:
+                    continue
+                if tool is None or record.get('tool') == tool:
+                    records.append(record)
+    except (IOError, OSError):
+        pass
+    return records[-last:] if last else records
+
+
+# ======================================================================
+def history_stats(
+        history_filepath=D_HISTORY_FILEPATH,
+        last=None):
+    """
+    Summarize the stage timings from the local history.
+
+    Args:
+        history_filepath (str): The history filepath.
+        last (int|None): Only include the most recent records of each tool.
+
+    Returns:
+        stats (dict): The statistics for each tool.
+            Each value is a dict containing: 'count', 'median', 'min',
+            'max' (durations in seconds) and 'size' (median size in bytes).
+    """
+    by_tool = {}
+    for record in load_history(history_filepath):
+        by_tool.setdefault(record['tool'], []).append(record)
+    stats = {}
+    for tool, records in sorted(by_tool.items()):
+        records = records[-last:] if last else records
+        durations = [record['duration'] for record in records]
+        stats[tool] = dict(
+            count=len(records),
+            median=statistics.median(durations),
+            min=min(durations),
+            max=max(durations),
+            size=statistics.median([record['size'] for record in records]))
+    return stats
+
+
+# ======================================================================
+def estimate_duration(
+        tool,
+        size,
+        records):
+    """
+    Estimate the duration of a stage from past timings.
+
+    Records are grouped in power-of-two size bins: the median duration
+    of the records in the same bin as `size` is used, if any, otherwise
+    the median over all records of the tool.
+
+    Args:
+        tool (str): The name of the tool (or in-process stage).
+        size (int): The size of the stage input in bytes.
+        records (Iterable[dict]): The timing records.
+
+    Returns:
+        duration (float|None): The estimated duration in seconds.
+            If no record is available for the tool, returns None.
+
+    Examples:
+        >>> records = [
+        ...     dict(tool='pandoc', size=1100, duration=1.0),
+        ...     dict(tool='pandoc', size=1200, duration=3.0),
+        ...     dict(tool='pandoc', size=9000, duration=8.0)]
+        >>> estimate_duration('pandoc', 1050, records)
+        2.0
+        >>> estimate_duration('pandoc', 100000, records)
+        3.0
+        >>> estimate_duration('wkhtmltopdf', 1000, records) is None
+        True
+    """
+    def size_bin(n):
+        return int(math.log2(n)) if n > 0 else -1
+
+    durations = [
+        record['duration'] for record in records if record['tool'] == tool]
+    same_bin = [
+        record['duration'] for record in records
+        if record['tool'] == tool
+        and size_bin(record['size']) == size_bin(size)]
+    if same_bin:
+        return statistics.median(same_bin)
+    elif durations:
+        return statistics.median(durations)
+    else:
+        return None
+
+
+# ======================================================================
+def multi_replace(text, replaces):
+    """
+    Perform multiple replacements in a string.
+
+    Args:
+        text (str): The input string.
+        replaces (tuple[str,str]): The listing of the replacements.
+            Format: ((<old>, <new>), ...).
+
+    Returns:
+        text (str): The string after the performed replacements.
+
+    Examples:
+        >>> multi_replace('python.best', (('thon', 'mrt'), ('est', 'ase')))
+        'pymrt.base'
+        >>> multi_replace('x-x-x-x', (('x', 'est'), ('est', 'test')))
+        'test-test-test-test'
+        >>> multi_replace('x-x-', (('-x-', '.test'),))
+        'x.test'
+    """
+    return functools.reduce(lambda s, r: s.replace(*r), replaces, text)
+
+
+# ======================================================================
+def temp_filepath(filepath):
+    """
+    Compute a process-specific temporary filepath next to a target file.
+
+    The extension is preserved, so that external tools guessing the format
+    from the filename keep working.
+
+    Args:
+        filepath (str): The target filepath.
+
+    Returns:
+        tmp_filepath (str): The temporary filepath.
+
+    Examples:
+        >>> temp_filepath('/tmp/abstract.pdf') == \\
+        ...     '/tmp/abstract.{}.tmp.pdf'.format(os.getpid())
+        True
+    """
+    base, ext = os.path.splitext(filepath)
+    return '{}.{}.tmp{}'.format(base, os.getpid(), ext)
+
+
+# ======================================================================
+def write_atomic(filepath, data):
+    """
+    Write data to a file atomically (temp file plus rename).
+
+    Concurrent readers see either the old or the new content, never a
+    partially written file.
+
+    Args:
+        filepath (str): The output filepath.
+        data (bytes): The content to write.
+
+    Returns:
+        None.
+    """
+    tmp_filepath = temp_filepath(filepath)
+    try:
+        with open(tmp_filepath, 'wb') as fileobj:
+            fileobj.write(data)
+        os.replace(tmp_filepath, filepath)
+    finally:
+        if os.path.exists(tmp_filepath):
+            os.remove(tmp_filepath)
+
+
+# ======================================================================
+def redo_reason(
+        in_filepaths,
+        out_filepaths,
+        force=False,
+        no_empty_input=False):
+    """
+    Determine why a computation is to be re-done, if at all.
+
+    Args:
+        in_filepaths (Iterable[str]|None): Input filepaths for computation.
+        out_filepaths (Iterable[str]): Output filepaths for computation.
+        force (bool): Force computation to be re-done.
+        no_empty_input (bool): Check if the input filepath list is empty.
+
+    Returns:
+        reason (str|None): The reason for re-doing the computation.
+            If None, the computation can be skipped.
+
+    Raises:
+        IndexError: If the input filepath list is empty.
+            Only if `no_empty_input` is True.
+        IOError: If any of the input files do not exist.
+    """
+    if force:
+        return 'forced'
+
+    # check if output exists
+    for out_filepath in out_filepaths:
+        if out_filepath and not os.path.exists(out_filepath):
+            return 'missing output `{}`'.format(out_filepath)
+
+    # check if input is older than output
+    # check if input is not empty
+    if in_filepaths:
+        # check if input exists
+        for in_filepath in in_filepaths:
+            if not os.path.exists(in_filepath):
+                raise IOError('Input file does not exists.')
+
+        for in_filepath, out_filepath in \
+                itertools.product(in_filepaths, out_filepaths):
+            if os.path.getmtime(in_filepath) > os.path.getmtime(
+                    out_filepath):
+                return 'input `{}` newer than output `{}`'.format(
+                    in_filepath, out_filepath)
+    elif no_empty_input:
+        raise IOError('Input file list is empty.')
+    return None
+
+
+# ======================================================================
+def check_redo(
+        in_filepaths,
+        out_filepaths,
+        force=False,
+        verbose=D_VERB_LVL,
+        makedirs=False,
+        no_empty_input=False):
+    """
+    Check if input files are newer than output files, to force calculation.
+
+    Args:
+        in_filepaths (Iterable[str]|None): Input filepaths for computation.
+        out_filepaths (Iterable[str]): Output filepaths for computation.
+        force (bool): Force computation to be re-done.
+        verbose (int): Set level of verbosity.
+        makedirs (bool): Create output dirpaths if not existing.
+        no_empty_input (bool): Check if the input filepath list is empty.
+
+    Returns:
+        force (bool): True if the computation is to be re-done.
+
+    Raises:
+        IndexError: If the input filepath list is empty.
+            Only if `no_empty_input` is True.
+        IOError: If any of the input files do not exist.
+    """
+    reason = redo_reason(in_filepaths, out_filepaths, force, no_empty_input)
+    force = reason is not None
+
+    # create output directories
+    if force and makedirs:
+        for out_filepath in out_filepaths:
+            out_dirpath = os.path.dirname(out_filepath)
+            if not os.path.isdir(out_dirpath):
+                msg('mkdir: {}'.format(out_dirpath),
+                    verbose, VERB_LVL['highest'])
+                os.makedirs(out_dirpath)
+
+    if force:
+        msg('Calc: {}'.format(out_filepaths), verbose, VERB_LVL['higher'])
+        msg('From: {}'.format(in_filepaths), verbose, VERB_LVL['highest'])
+        msg('Why: {}'.format(reason), verbose, VERB_LVL['highest'])
+    else:
+        msg('Skip: {}'.format(out_filepaths), verbose, VERB_LVL['higher'])
+        msg('From: {}'.format(in_filepaths), verbose, VERB_LVL['highest'])
+    return force
+
+
+# ======================================================================
+def word_count_text(
+        text,
+        skip_tokens=D_SKIP_TOKENS,
+        hdr_tokens=D_HDR_TOKENS,
+        hdr_tokens_nl=D_HDR_TOKENS_NL,
+        skip_sections=()):
+    """
+    Calculate word count for each Markdown section of a text.
+
+    Args:
+        text (str): The Markdown text.
+        skip_tokens (Iterable[str]): Skip token identifier.
+            Ignore lines starting with any of the tokens indicated.
+        hdr_tokens (Iterable[str]): Header token identifier.
+            Lines stating with any of the tokens are considered header.
+        hdr_tokens_nl (Iterable[str]): Header-after-new-line token identifier.
+            Ignore lines immediately above and starting with any of the tokens
+            indicated.
+        skip_sections (Iterable[str]): Skip from word count.
+            The sections included in this list will not count toward the
+            total word count.
+
+    Returns:
+        blocks (list[dict]): A list of dicts containing section info.
+            Each dict contains:
+                - 'title': the section title as a text string.
+                - 'level': level of heading (1 to 6).
+                - 'text': the section text as a list of text string lines.
+                - 'num_words': the number of words as int.
+                - 'skip': False if block is skipped in partial counts.
+        wc_partial (int): The partial number of words.
+            Titles and sections to skip are not included.
+        wc_total (int): The total number of words.
+            Titles are excludes, sections to skip are included.
+    """
+    # : a single prefix test (with early exit) rejects most lines
+    hdr_tokens = tuple(hdr_tokens)
+    skip_tokens = tuple(skip_tokens)
+    hdr_tokens_nl = tuple(hdr_tokens_nl)
+    blocks = []
+    lines = []
+    len_last_line = 0
+    for line in text.splitlines():
+        if line.startswith(hdr_tokens):
+            for i, token in enumerate(hdr_tokens):
+                if line.startswith(token):
+                    if len(blocks) > 0:
+                        blocks[-1]['text'] = lines
+                        lines = []
+                    blocks.append(
+                        {'title': line[len(token):], 'text': [], 'level': i})
+        if line.startswith(skip_tokens):
+            continue
+        if len(line) == len_last_line and line.startswith(hdr_tokens_nl):
+            title = lines.pop()
+            if len(blocks) > 0:
+                blocks[-1]['text'] = lines
+                lines = []
+            # : underlined headers all get the same level (as previously)
+            blocks.append({
+                'title': title, 'text': [],
+                'level': len(hdr_tokens_nl) - 1})
+        elif len(line) > 0:
+            lines.append(line)
+        len_last_line = len(line)
+    if blocks:
+        blocks[-1]['text'] = lines
+
+    wc_partial = 0
+    wc_total = 0
+    for i, block in enumerate(blocks):
         blocks[i]['num_words'] = len(' '.join(block['text']).split())
         skip = False
         for skip_section in skip_sections:
@@ -641,170 +1686,4502 @@ def word_count(
 
 
 # ======================================================================
-def find_figures(
+def word_count(
         in_filepath,
-        on_new_lines=True,
+        skip_tokens=D_SKIP_TOKENS,
+        hdr_tokens=D_HDR_TOKENS,
+        hdr_tokens_nl=D_HDR_TOKENS_NL,
+        skip_sections=(),
         encoding='utf-8'):
     """
     Calculate word count for each Markdown section.
 
     Args:
         in_filepath (str): The path to the input file.
-        on_new_lines (bool): Include only figures on a separate line.
+        skip_tokens (Iterable[str]): Skip token identifier.
+        hdr_tokens (Iterable[str]): Header token identifier.
+        hdr_tokens_nl (Iterable[str]): Header-after-new-line token identifier.
+        skip_sections (Iterable[str]): Skip from word count.
         encoding (str): The encoding to use.
 
     Returns:
-        figs (list[str]): The figures referenced in the text.
-    """
-    # fix patterns for newlines
-    fix_nl = '^' if on_new_lines else ''
-    # :: match referenced figures
-    pattern_ref_uri = fix_nl + r'\[(?P<ref>[0-9]+)\]:(?P<uri>.*)'
-    pattern_ref = fix_nl + r'\[!\[.*\]\[(?P<ref>[0-9]+)\]\]\[(?P=ref)\]'
-    # :: match unreferenced figures
-    pattern_uri = fix_nl + r'!\[.*\]\((?P<uri>.*)\)'
+        result (tuple): The output of `word_count_text()`.
 
-    figs = []
-    fig_refs, fig_uris = {}, [],
+    See Also:
+        word_count_text()
+    """
     with open(in_filepath, 'rb') as i_file:
-        for line in i_file.read().decode(encoding).splitlines():
-            re_ref = re.match(pattern_ref, line)
-            if re_ref:
-                figs.append(re_ref.group('ref'))
-
-            re_ref_uri = re.match(pattern_ref_uri, line)
-            if re_ref_uri:
-                fig_refs[re_ref_uri.group('ref')] = re_ref_uri.group('uri')
-
-            re_uri = re.match(pattern_uri, line)
-            if re_uri:
-                fig_uris.append(re_uri.group('uri'))
-                figs.append(fig_uris[-1])
-    for i, fig in enumerate(figs):
-        if fig in fig_refs:
-            figs[i] = fig_refs[fig].strip()
+        text = i_file.read().decode(encoding)
+    return word_count_text(
+        text, skip_tokens, hdr_tokens, hdr_tokens_nl, skip_sections)
 
-    return figs
+
+# ======================================================================
+def find_figures_text(
+        text,
+        on_new_lines=True):
+    """
+    Find the figures referenced in a Markdown text.
+
+    Figures are either inline (`![alt](uri)`) or reference-style
+    (`[![alt][n]][n]` with `[n]: uri`).
+    As for greedy patterns, the URI of an inline figure extends to the last
+    `)` of the line, and the reference is the last one matching in the line.
+    The last delimiters are searched for directly (instead of backtracking),
+    so that the scan takes linear time in the size of the text.
+
+    Args:
+        text (str): The Markdown text.
+        on_new_lines (bool): Include only figures on a separate line.
+            Figures are always matched at the start of a line.
+
+    Returns:
+        figs (list[str]): The figures referenced in the text.
+
+    Examples:
+        >>> find_figures_text(
+        ...     '![a](x.png)\\n[![b][1]][1]\\n[1]: y.png\\n![c](z (1).png)')
+        ['x.png', 'y.png', 'z (1).png']
+        >>> find_figures_text('![' + '](' * 10000)
+        []
+    """
+    figs = []
+    fig_refs = {}
+    for line in text.splitlines():
+        if line.startswith('[!['):
+            end = len(line)
+            while True:
+                pos = line.rfind('][', 3, end)
+                if pos < 0:
+                    break
+                match = _FIG_REF_PATTERN.match(line, pos)
+                if match:
+                    figs.append(match.group('ref'))
+                    break
+                end = pos + 1
+        elif line.startswith('!['):
+            end = line.rfind(')')
+            pos = line.rfind('](', 2, end) if end >= 0 else -1
+            if pos >= 0:
+                figs.append(line[pos + 2:end])
+        elif line.startswith('['):
+            match = _FIG_REF_URI_PATTERN.match(line)
+            if match:
+                fig_refs[match.group('ref')] = match.group('uri')
+    for i, fig in enumerate(figs):
+        if fig in fig_refs:
+            figs[i] = fig_refs[fig].strip()
+
+    return figs
+
+
+# ======================================================================
+def find_figures(
+        in_filepath,
+        on_new_lines=True,
+        encoding='utf-8'):
+    """
+    Find the figures referenced in a Markdown file.
+
+    Args:
+        in_filepath (str): The path to the input file.
+        on_new_lines (bool): Include only figures on a separate line.
+        encoding (str): The encoding to use.
+
+    Returns:
+        figs (list[str]): The figures referenced in the text.
+    """
+    with open(in_filepath, 'rb') as i_file:
+        text = i_file.read().decode(encoding)
+    return find_figures_text(text, on_new_lines)
+
+
+# ======================================================================
+def fix_filepath(
+        in_filepath,
+        out_filepath=None,
+        out_fmt='fix_{in_filename}'):
+    """
+    Determine the output filepath of the fixed version of the input.
+
+    Args:
+        in_filepath (str): The input filepath.
+        out_filepath (str): The output filepath.
+        out_fmt (str): The output format if out_filepath is None.
+
+    Returns:
+        out_filepath (str): The output filepath.
+
+    Examples:
+        >>> fix_filepath('/abstract/abstract.md')
+        '/abstract/fix_abstract.md'
+        >>> fix_filepath('/abstract/abstract.md', 'submit.md')
+        '/abstract/submit.md'
+    """
+    in_dirpath, in_filename = os.path.split(in_filepath)
+    if not out_filepath:
+        out_filepath = out_fmt.format_map(vars())
+    if os.path.dirname(out_filepath) == '':
+        out_filepath = os.path.join(in_dirpath, out_filepath)
+    return out_filepath
+
+
+# ======================================================================
+def fix(
+        in_filepath,
+        out_filepath=None,
+        attachment=None,
+        encoding='utf-8',
+        out_fmt='fix_{in_filename}',
+        bib=None,
+        force=False,
+        verbose=D_VERB_LVL):
+    """
+    Substitute maths environment standard delimiters with custom defined ones.
+
+    Args:
+        in_filepath (str): The input filepath.
+        out_filepath (str): The output filepath.
+        attachment (str): The text to attach to the abstract.
+        encoding (str): The encoding to use.
+        out_fmt (str): The output format if out_filepath is None.
+        bib (str|None): The BibTeX filepath to resolve citations against.
+            If None, citations are not resolved (see `cite()`).
+        force (bool): Force new processing.
+        verbose (int):set the level of verbosity.
+
+    Returns:
+        redo (bool): True if the output was (re-)generated.
+    """
+    out_filepath = fix_filepath(in_filepath, out_filepath, out_fmt)
+
+    redo = check_redo(
+        [in_filepath, __file__] + ([bib] if bib else []), [out_filepath],
+        force)
+    if redo:
+        with open(in_filepath, 'rb') as i_file:
+            stream = i_file.read().decode(encoding)
+            i_file.close()
+        if bib:
+            stream = cite(stream, bib)[0]
+
+        replaces = (
+            ('.\n\n', '.' + ' ' * 3 + '\n\n'),
+            ('.\n', '.' + ' ' + '\n'),
+            ('\\\\(', '$$$'), ('\\\\)', '$$$'),
+            ('\\\\[', '$$'), ('\\\\]', '$$'),
+        )
+        stream = multi_replace(stream, replaces)
+
+        if attachment:
+            stream += '\n' + attachment + '\n'
+
+        write_atomic(out_filepath, stream.encode(encoding))
+        msg('Output: {}'.format(out_filepath), verbose, VERB_LVL['lowest'])
+    return redo
+
+
+# ======================================================================
+def gen_report(
+        lines,
+        tests,
+        title=D_TESTS_TITLE,
+        final=D_TESTS_FINAL,
+        hdr_style=+2,
+        prefix='',
+        suffix='',
+        use_html=False):
+    """
+    Generate a report of the tests performed.
+
+    Args:
+        lines (list[str]): A list of text strings with description of tests.
+            This is usually the same as displayed in the terminal.
+        tests (list[bool]): A list of the results of all tests performed.
+        title (str): The title to use for the section heading.
+        final (str): The template string to use for the final test.
+            This is OK only if all tests are OK.
+        hdr_style (int): Determine the style of the header to use.
+            A positive number will use '#'-style heading (valid: 1-6).
+            A negative number will use underlined-style heading (valid: 1-2).
+        prefix (str): String to attach to the report before its content.
+        suffix (str): String to attach to the report after its content.
+        use_html (bool): Insert HTML specific tags for improved export.
+
+    Returns:
+        text (str): The report as valid MarkDown (eventually HTML-enriched).
+    """
+    text = '\n' * 3
+    # title
+    if hdr_style > 0:
+        i = hdr_style - 1
+        text += str(D_HDR_TOKENS[i]) + title + '\n'
+    elif hdr_style < 0:
+        i = hdr_style + 1
+        text += title + '\n'
+        text += '-' * len(title) + '\n'
+    else:
+        text += title + '\n'
+    # body
+    if use_html:
+        for line, test in zip(lines, tests):
+            if test:
+                attr = 'green'
+            elif test is not None:
+                attr = 'red'
+            else:
+                attr = ''
+            text += '{}- <span class="{}">{}</span>{}\n'.format(
+                prefix, attr, line.replace(' ', '&nbsp;'), suffix)
+    else:
+        text += '\n'.join([prefix + line + suffix for line in lines])
+    text += '\n'
+    # final result
+    if lines:
+        final_test = all([test for test in tests if test is not None])
+        color = 'green' if final_test else 'red'
+        result = 'OK' if final_test else 'ERR'
+        text += '-' * len(lines[-1]) + '\n'
+        text += '<span class="{}">'.format(color) if use_html else ''
+        text += '{:>{n}s}'.format(
+            final.format_map(vars()), n=len(lines[-1]) if not use_html else '')
+        text += '</span>' if use_html else ''
+    return text
+
+
+# ======================================================================
+def resolve_input(in_filepath):
+    """
+    Determine the abstract source from a file or directory path.
+
+    A directory is resolved to the Markdown file with the same name
+    inside that directory.
+
+    Args:
+        in_filepath (str): The input file or directory path.
+
+    Returns:
+        in_filepath (str): The full path of the abstract source.
+            The path is not guaranteed to exist.
+    """
+    if os.path.isfile(in_filepath):
+        in_filepath = os.path.realpath(in_filepath)
+    elif os.path.isdir(in_filepath):
+        dirpath = os.path.realpath(in_filepath)
+        in_filepath = os.path.join(
+            dirpath, os.path.basename(dirpath) + '.md')
+    return in_filepath
+
+
+# ======================================================================
+def tool_name(tool):
+    """
+    Determine the name of the binary used by an external tool.
+
+    Args:
+        tool (str): The external tool identifier (a key of `TOOLS`).
+
+    Returns:
+        name (str): The basename of the binary.
+
+    Examples:
+        >>> tool_name('md2html')
+        'pandoc'
+    """
+    return os.path.basename(shlex.split(TOOLS[tool])[0])
+
+
+# ======================================================================
+def plan_stages(
+        in_filepath,
+        out_filepath=None,
+        export=('html', 'pdf'),
+        backup=True,
+        css=None,
+        preview=True,
+        bib=None):
+    """
+    Determine the processing stages for an abstract.
+
+    Args:
+        in_filepath (str): The input filepath (already resolved).
+        out_filepath (str): The output filepath.
+            If None, it will be computed from the input file.
+        export (list[str]): The export format(s).
+            Accepted values are: [html|pdf|zip]
+        backup (bool): Backups before processing.
+        css (list[str]|None): Specify the CSS sources.
+        preview (bool): Use preview-resolution figures in exports.
+        bib (str|None): The BibTeX filepath to resolve citations against.
+
+    Returns:
+        stages (list[dict]): The stages, in order of execution.
+            Each dict contains:
+                - 'name': the stage name.
+                - 'tool': the tool name (as used in the timings history).
+                - 'in_filepaths': the stage input filepaths.
+                    If None, the stage is always run.
+                - 'out_filepaths': the stage output filepaths.
+                - 'size': the (estimated) size of the stage input in bytes.
+    """
+    export = [s.lower() for s in export]
+    if isinstance(css, str):
+        css = [css]
+
+    def _size(filepath):
+        return os.path.getsize(filepath) if os.path.isfile(filepath) else 0
+
+    base_filepath = os.path.splitext(in_filepath)[0]
+    html_filepath = base_filepath + '.htm'
+    pdf_filepath = base_filepath + '.pdf'
+    stages = []
+    if backup:
+        stages.append(dict(
+            name='vcs', tool=tool_name('vcs'),
+            in_filepaths=None, out_filepaths=[], size=0))
+    bib_filepaths = [bib] if bib else []
+    stages.append(dict(
+        name='fix', tool='fix',
+        in_filepaths=[in_filepath, __file__] + bib_filepaths,
+        out_filepaths=[fix_filepath(in_filepath, out_filepath)],
+        size=_size(in_filepath)))
+    if 'html' in export or 'pdf' in export:
+        if css is None:
+            stages.append(dict(
+                name='css', tool='css',
+                in_filepaths=[__file__], out_filepaths=[D_CSS_FILEPATH],
+                size=0))
+            css = [D_CSS_FILEPATH]
+        figs_filepaths = figures_filepaths(load_document(in_filepath)) \
+            if preview and os.path.isfile(in_filepath) else []
+        stages.append(dict(
+            name='html', tool=tool_name('md2html'),
+            in_filepaths=[in_filepath, __file__, toolchain_stamp('md2html')] +
+                         figs_filepaths + bib_filepaths,
+            out_filepaths=[html_filepath],
+            size=_size(in_filepath)))
+        if 'pdf' in export:
+            stages.append(dict(
+                name='pdf', tool=tool_name('html2pdf'),
+                in_filepaths=[html_filepath, __file__,
+                              toolchain_stamp('html2pdf')] +
+                             [item for item in css if '://' not in item],
+                out_filepaths=[pdf_filepath],
+                size=_size(html_filepath) or _size(in_filepath)))
+    if 'zip' in export:
+        in_filepaths = [in_filepath, fix_filepath(in_filepath, out_filepath)]
+        if 'pdf' in export:
+            in_filepaths.append(pdf_filepath)
+        if os.path.isfile(in_filepath):
+            in_filepaths += figures_filepaths(load_document(in_filepath))
+        stages.append(dict(
+            name='zip', tool='zip',
+            in_filepaths=in_filepaths, out_filepaths=[base_filepath + '.zip'],
+            size=sum(_size(filepath) for filepath in in_filepaths)))
+    return stages
+
+
+# ======================================================================
+def explain(
+        in_filepath,
+        out_filepath=None,
+        export=('html', 'pdf'),
+        backup=True,
+        css=None,
+        preview=True,
+        bib=None,
+        force=False,
+        history_filepath=D_HISTORY_FILEPATH,
+        verbose=D_VERB_LVL):
+    """
+    Explain what would be rebuilt for an abstract, without running anything.
+
+    The duration of each stage is estimated from the timings history.
+
+    Args:
+        in_filepath (str): The input filepath.
+        out_filepath (str): The output filepath.
+            If None, it will be computed from the input file.
+        export (list[str]): The export format(s).
+            Accepted values are: [html|pdf|zip]
+        backup (bool): Backups before processing.
+        css (list[str]|None): Specify the CSS sources.
+        preview (bool): Use preview-resolution figures in exports.
+        bib (str|None): The BibTeX filepath to resolve citations against.
+        force (bool): Force new processing.
+        history_filepath (str): The timings history filepath.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        stages (list[dict]): The stages, as obtained from `plan_stages()`.
+            Additionally, each dict contains:
+                - 'reason': the reason for running the stage or None.
+                - 'estimate': the estimated duration in seconds or None.
+    """
+    in_filepath = resolve_input(in_filepath)
+    msg('Input: {}'.format(in_filepath))
+    stages = plan_stages(
+        in_filepath, out_filepath, export, backup, css, preview, bib)
+    records = load_history(history_filepath)
+    rebuilt = set()
+    total = 0.0
+    for stage in stages:
+        if stage['in_filepaths'] is None:
+            reason = 'always'
+        else:
+            upstream = [
+                name for name, outs in rebuilt
+                if set(outs) & set(stage['in_filepaths'])]
+            if upstream and not force:
+                reason = 'upstream `{}` rebuilt'.format(upstream[0])
+            else:
+                try:
+                    reason = redo_reason(
+                        stage['in_filepaths'], stage['out_filepaths'], force)
+                except IOError:
+                    reason = 'missing input'
+        if reason:
+            rebuilt.add((stage['name'], tuple(stage['out_filepaths'])))
+        estimate = estimate_duration(
+            stage['tool'], stage['size'], records) if reason else None
+        total += estimate or 0.0
+        stage.update(reason=reason, estimate=estimate)
+        msg('{}: {:<8s} {:<12s} {:>8s}  {}'.format(
+            'I' if reason else GLIPH,
+            stage['name'], stage['tool'],
+            ('~{:.1f}s'.format(estimate) if estimate is not None else '?')
+            if reason else '-',
+            reason if reason else 'up to date'))
+    msg('Estimated: ~{:.1f}s'.format(total))
+    return stages
+
+
+# ======================================================================
+def print_history(
+        history_filepath=D_HISTORY_FILEPATH,
+        last=None):
+    """
+    Display the summary statistics of the timings history.
+
+    Args:
+        history_filepath (str): The timings history filepath.
+        last (int|None): Only include the most recent records of each tool.
+
+    Returns:
+        stats (dict): The statistics, as obtained from `history_stats()`.
+    """
+    stats = history_stats(history_filepath, last)
+    msg(': {:<14s} {:>6s} {:>9s} {:>9s} {:>9s} {:>10s}'.format(
+        'Tool', 'Runs', 'Median', 'Min', 'Max', 'Size'),
+        fmtt='{t.bold}{t.blue}')
+    for tool, stat in stats.items():
+        msg('  {:<14s} {count:>6d} {median:>8.2f}s {min:>8.2f}s'
+            ' {max:>8.2f}s {size:>9.0f}B'.format(tool, **stat))
+    return stats
+
+
+# ======================================================================
+def parse_bibtex(text):
+    """
+    Parse the entries of a BibTeX database.
+
+    Field values can be delimited by braces or quotes, or be numbers or
+    `@string` macros, possibly concatenated with `#`.
+    `@comment` and `@preamble` blocks are ignored.
+
+    Args:
+        text (str): The BibTeX text.
+
+    Returns:
+        entries (dict[str,dict]): The fields of each entry, by key.
+            Field names are lowercase, and the entry type is stored as
+            'entrytype'.
+
+    Examples:
+        >>> bib = parse_bibtex(
+        ...     '@string{mrm = "Magn Reson Med"}\\n'
+        ...     '@Article{doe2019, author = {Doe, J. and {Roe} Smith, A.},'
+        ...     ' journal = mrm, year = 2019, title = "A {MRI} Study"}')
+        >>> sorted(bib['doe2019'].items())
+        [('author', 'Doe, J. and {Roe} Smith, A.'), ('entrytype', 'article'),\
+ ('journal', 'Magn Reson Med'), ('title', 'A {MRI} Study'), ('year', '2019')]
+    """
+    entries = {}
+    macros = dict(
+        (month, month.capitalize()) for month in (
+            'jan', 'feb', 'mar', 'apr', 'may', 'jun',
+            'jul', 'aug', 'sep', 'oct', 'nov', 'dec'))
+    pos = 0
+    size = len(text)
+    entry_pattern = re.compile(r'@\s*(\w+)\s*([{(])')
+    key_pattern = re.compile(r'\s*([^\s,]+)\s*,')
+    field_pattern = re.compile(r'([\w.:+/-]+)\s*=')
+    value_pattern = re.compile(r'[^\s,#}\)]+')
+
+    def _skip_spaces(i):
+        while i < size and text[i].isspace():
+            i += 1
+        return i
+
+    def _delimited(i, closing):
+        # : return the content up to the matching closing delimiter
+        depth = 0
+        start = i
+        while i < size:
+            char = text[i]
+            if char == '\\':
+                i += 2
+                continue
+            elif char == '{':
+                depth += 1
+            elif char == '}' and depth > 0:
+                depth -= 1
+            elif char == closing and depth == 0:
+                return text[start:i], i + 1
+            i += 1
+        raise ValueError('Unterminated BibTeX value at {}.'.format(start))
+
+    def _value(i):
+        parts = []
+        while True:
+            i = _skip_spaces(i)
+            if i < size and text[i] == '{':
+                part, i = _delimited(i + 1, '}')
+            elif i < size and text[i] == '"':
+                part, i = _delimited(i + 1, '"')
+            else:
+                match = value_pattern.match(text, i)
+                if not match:
+                    raise ValueError('Invalid BibTeX value at {}.'.format(i))
+                part, i = match.group(), match.end()
+                part = macros.get(part.lower(), part)
+            parts.append(part)
+            i = _skip_spaces(i)
+            if i < size and text[i] == '#':
+                i += 1
+            else:
+                return ''.join(parts), i
+
+    while True:
+        pos = text.find('@', pos)
+        if pos < 0:
+            break
+        match = entry_pattern.match(text, pos)
+        if not match:
+            pos += 1
+            continue
+        kind = match.group(1).lower()
+        closing = '}' if match.group(2) == '{' else ')'
+        pos = match.end()
+        if kind in ('comment', 'preamble'):
+            _, pos = _delimited(pos, closing)
+            continue
+        fields = {}
+        if kind != 'string':
+            match = key_pattern.match(text, pos)
+            if not match:
+                continue
+            key, pos = match.group(1), match.end()
+        while True:
+            pos = _skip_spaces(pos)
+            if pos < size and text[pos] == closing:
+                pos += 1
+                break
+            match = field_pattern.match(text, pos)
+            if not match:
+                # : skip malformed content up to the end of the entry
+                _, pos = _delimited(pos, closing)
+                break
+            name = match.group(1).lower()
+            fields[name], pos = _value(match.end())
+            pos = _skip_spaces(pos)
+            if pos < size and text[pos] == ',':
+                pos += 1
+        if kind == 'string':
+            macros.update((name.lower(), value) for name, value in
+                          fields.items())
+        else:
+            fields['entrytype'] = kind
+            entries[key] = fields
+    return entries
+
+
+# ======================================================================
+def bib_index(
+        bib_filepath,
+        cache_dirpath=D_CACHE_DIRPATH):
+    """
+    Open the on-disk index of a BibTeX database, (re-)building it if needed.
+
+    The index is a SQLite database in the cache directory.
+    It is rebuilt only if the content hash of the BibTeX file changes
+    (the hash is only computed if its modification time or size change).
+
+    Requires `sqlite3` (usually part of the Python standard library).
+
+    Args:
+        bib_filepath (str): The BibTeX filepath.
+        cache_dirpath (str): The directory where the index is stored.
+
+    Returns:
+        index (sqlite3.Connection): The index, with table `entries`
+            (columns: `key`, `entry` as JSON).
+
+    Raises:
+        IOError: If the BibTeX file does not exist.
+    """
+    import sqlite3
+
+    bib_filepath = os.path.realpath(bib_filepath)
+    if not os.path.isfile(bib_filepath):
+        raise IOError('BibTeX file `{}` not found.'.format(bib_filepath))
+    if not os.path.isdir(cache_dirpath):
+        os.makedirs(cache_dirpath)
+    index_filepath = os.path.join(cache_dirpath, 'bib_{}.sqlite'.format(
+        hashlib.sha1(bib_filepath.encode('utf-8')).hexdigest()[:16]))
+    index = sqlite3.connect(index_filepath)
+    with index:
+        index.execute(
+            'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)')
+        index.execute(
+            'CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, entry)')
+    meta = dict(index.execute('SELECT name, value FROM meta'))
+    stat = os.stat(bib_filepath)
+    fingerprint = '{}:{}'.format(stat.st_mtime_ns, stat.st_size)
+    if meta.get('fingerprint') != fingerprint:
+        with open(bib_filepath, 'rb') as fileobj:
+            data = fileobj.read()
+        digest = hashlib.sha1(data).hexdigest()
+        with index:
+            if meta.get('hash') != digest:
+                entries = parse_bibtex(data.decode('utf-8', 'replace'))
+                index.execute('DELETE FROM entries')
+                index.executemany(
+                    'INSERT OR REPLACE INTO entries VALUES (?, ?)',
+                    ((key, json.dumps(entry))
+                     for key, entry in entries.items()))
+            index.executemany(
+                'INSERT OR REPLACE INTO meta VALUES (?, ?)',
+                (('hash', digest), ('fingerprint', fingerprint)))
+    return index
+
+
+# ======================================================================
+def bib_entries(
+        bib_filepath,
+        keys):
+    """
+    Look up entries in a BibTeX database through its index.
+
+    Args:
+        bib_filepath (str): The BibTeX filepath.
+        keys (Iterable[str]): The entry keys.
+
+    Returns:
+        entries (dict[str,dict]): The fields of the entries found, by key.
+            See `parse_bibtex()` for the content of each entry.
+
+    Raises:
+        IOError: If the BibTeX file does not exist.
+    """
+    keys = list(keys)
+    index = bib_index(bib_filepath)
+    try:
+        entries = {}
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            entries.update(
+                (key, json.loads(entry)) for key, entry in index.execute(
+                    'SELECT key, entry FROM entries WHERE key IN ({})'.format(
+                        ', '.join('?' * len(chunk))), chunk))
+        return entries
+    finally:
+        index.close()
+
+
+# ======================================================================
+def latex_to_text(text):
+    """
+    Convert the LaTeX markup of BibTeX values to plain text.
+
+    Args:
+        text (str): The BibTeX value.
+
+    Returns:
+        text (str): The plain text.
+
+    Examples:
+        >>> latex_to_text(
+        ...     'M{\\\\"u}ller and {\\\\v{S}}koda --- {MRI} \\\\& more')
+        'Müller and Škoda — MRI & more'
+    """
+    accents = {
+        '"': '\u0308', "'": '\u0301', '`': '\u0300', '^': '\u0302',
+        '~': '\u0303', '=': '\u0304', '.': '\u0307', 'u': '\u0306',
+        'v': '\u030c', 'H': '\u030b', 'c': '\u0327', 'r': '\u030a'}
+    text = re.sub(
+        r'\\([\"\'`^~=.]|[uvHcr](?![a-zA-Z]))\s*\{?\s*([a-zA-Z])\}?',
+        lambda match: unicodedata.normalize(
+            'NFC', match.group(2) + accents[match.group(1)]), text)
+    text = multi_replace(text, (
+        ('---', '—'), ('--', '-'), ('~', ' '), ('\\&', '&'), ('\\%', '%'),
+        ('\\_', '_'), ('\\$', '$')))
+    text = re.sub(r'\\[a-zA-Z]+\s*', '', text)
+    return ' '.join(text.replace('{', '').replace('}', '').split())
+
+
+# ======================================================================
+def format_authors(
+        authors,
+        max_authors=D_BIB_MAX_AUTHORS):
+    """
+    Format a BibTeX author list (surname followed by initials).
+
+    Args:
+        authors (str): The BibTeX author list.
+        max_authors (int): The max number of authors before `et al.`.
+
+    Returns:
+        text (str): The formatted author list.
+
+    Examples:
+        >>> format_authors('Doe, John and Jane Ann Roe and van Dyk, J.-P.')
+        'Doe J, Roe JA, van Dyk JP'
+        >>> format_authors('A, B and C, D and E, F', 2)
+        'A B, C D, et al.'
+    """
+    names = []
+    for author in re.split(r'\s+and\s+', authors.strip()):
+        if ',' in author:
+            parts = [part.strip() for part in author.split(',')]
+            surname, given = parts[0], parts[-1] if len(parts) > 1 else ''
+        else:
+            words = author.split()
+            # : lowercase particles (e.g. `van`) belong to the surname
+            i = len(words) - 1
+            while i > 0 and words[i - 1][:1].islower():
+                i -= 1
+            surname, given = ' '.join(words[i:]), ' '.join(words[:i])
+        initials = ''.join(
+            word[0] for word in re.split(r'[\s.-]+', latex_to_text(given))
+            if word)
+        names.append(' '.join(
+            item for item in (latex_to_text(surname), initials) if item))
+    if len(names) > max_authors:
+        names = names[:max_authors] + ['et al.']
+    return ', '.join(names)
+
+
+# ======================================================================
+def format_reference(
+        entry,
+        max_authors=D_BIB_MAX_AUTHORS):
+    """
+    Format a BibTeX entry as a reference in ISMRM style.
+
+    Args:
+        entry (dict): The entry fields (see `parse_bibtex()`).
+        max_authors (int): The max number of authors before `et al.`.
+
+    Returns:
+        text (str): The formatted reference.
+
+    Examples:
+        >>> format_reference(dict(
+        ...     entrytype='article', author='Doe, John and Roe, Jane',
+        ...     title='A {MRI} study', journal='Magn Reson Med', year='2019',
+        ...     volume='81', number='2', pages='100--110'))
+        'Doe J, Roe J. A MRI study. Magn Reson Med. 2019;81(2):100-110.'
+    """
+    def _field(name):
+        return latex_to_text(entry.get(name, ''))
+
+    text = ''
+    if entry.get('author'):
+        text += format_authors(entry['author'], max_authors).rstrip('.') + '. '
+    if entry.get('title'):
+        text += _field('title').rstrip('.') + '. '
+    if entry.get('entrytype') == 'article':
+        source = _field('shortjournal') or _field('journal')
+    elif entry.get('entrytype') in ('book', 'phdthesis', 'mastersthesis'):
+        source = _field('publisher') or _field('school')
+    else:
+        source = _field('booktitle') or _field('howpublished')
+    details = _field('year')
+    if entry.get('volume'):
+        details += ';' + _field('volume')
+        if entry.get('number'):
+            details += '({})'.format(_field('number'))
+    if entry.get('pages'):
+        details += (':' if entry.get('volume') else ';') + _field('pages')
+    text += '. '.join(item for item in (source, details) if item)
+    return text.strip().rstrip('.') + '.'
+
+
+# ======================================================================
+def _format_numbers(numbers):
+    """
+    Format citation numbers, compressing consecutive runs into ranges.
+
+    Args:
+        numbers (Iterable[int]): The citation numbers.
+
+    Returns:
+        text (str): The formatted numbers.
+
+    Examples:
+        >>> _format_numbers([3, 1, 2, 5, 7, 8])
+        '1-3,5,7,8'
+    """
+    numbers = sorted(set(numbers))
+    runs = []
+    for number in numbers:
+        if runs and number == runs[-1][1] + 1:
+            runs[-1][1] = number
+        else:
+            runs.append([number, number])
+    return ','.join(
+        '{}-{}'.format(*run) if run[1] - run[0] > 1
+        else ','.join(str(n) for n in range(run[0], run[1] + 1))
+        for run in runs)
+
+
+# ======================================================================
+def cite(
+        text,
+        bib_filepath,
+        max_authors=D_BIB_MAX_AUTHORS):
+    """
+    Resolve the citations of a Markdown text against a BibTeX database.
+
+    Citations use the `[@key]` or `[@key1; @key2]` syntax, and are replaced
+    by their number (in order of first appearance).
+    The References section is then replaced by (or, if missing, appended
+    as) the list of the cited references.
+    Citations of keys not found in the database are left unchanged.
+    If the text has no citations, it is returned unchanged.
+
+    Args:
+        text (str): The Markdown text.
+        bib_filepath (str): The BibTeX filepath.
+        max_authors (int): The max number of authors before `et al.`.
+
+    Returns:
+        text (str): The text with the citations resolved.
+        missing (list[str]): The keys not found in the database.
+
+    Raises:
+        IOError: If the BibTeX file does not exist.
+    """
+    cited = [
+        item.strip()[1:]
+        for match in _CITE_PATTERN.finditer(text)
+        for item in re.split(r'[;,]', match.group(1))]
+    if not cited:
+        return text, []
+    entries = bib_entries(bib_filepath, set(cited))
+    numbers = collections.OrderedDict()
+    for key in cited:
+        if key in entries and key not in numbers:
+            numbers[key] = len(numbers) + 1
+    missing = sorted(set(key for key in cited if key not in entries))
+
+    def _replace(match):
+        keys = [item.strip()[1:] for item in re.split(r'[;,]', match.group(1))]
+        if any(key not in numbers for key in keys):
+            return match.group()
+        return '[{}]'.format(_format_numbers(numbers[key] for key in keys))
+
+    text = _CITE_PATTERN.sub(_replace, text)
+    if not numbers:
+        return text, missing
+    references = ''.join(
+        '{}. {}\n'.format(number, format_reference(entries[key], max_authors))
+        for key, number in numbers.items())
+    chunks = split_sections(text)
+    for i, chunk in enumerate(chunks):
+        lines = chunk.splitlines(True)
+        num_hdr = 2 if len(lines) > 1 and lines[1].startswith(
+            D_HDR_TOKENS_NL) else 1
+        if lines and lines[0].lstrip('#').strip().startswith('References'):
+            chunks[i] = ''.join(lines[:num_hdr]) + references + '\n\n'
+            break
+    else:
+        chunks.append('\n\n## References\n' + references)
+    return ''.join(chunks), missing
+
+
+# ======================================================================
+@functools.lru_cache(maxsize=_DOCUMENT_CACHE_SIZE)
+def parse_document(
+        text,
+        filepath=None):
+    """
+    Parse a Markdown abstract into its sections and figures.
+
+    Results are cached by content, so that long-lived callers (e.g. a
+    service validating many abstracts) do not re-parse unchanged sources.
+    The returned object must be treated as read-only.
+
+    Args:
+        text (str): The Markdown text.
+        filepath (str|None): The source filepath, if any.
+            Relative figure paths are resolved against its directory.
+
+    Returns:
+        document (Document): The parsed document.
+    """
+    blocks, wc_partial, wc_total = word_count_text(
+        text, skip_sections=D_SKIP_SECTIONS)
+    figs = find_figures_text(text)
+    return Document(filepath, text, blocks, wc_partial, wc_total, figs)
+
+
+# ======================================================================
+def load_document(
+        source,
+        encoding='utf-8'):
+    """
+    Obtain a parsed document from a path or a document.
+
+    Markdown text is parsed with `parse_document()` instead.
+
+    Args:
+        source (str|Document): The abstract source.
+            If Document, it is returned unchanged.
+            If str, it is interpreted as a file or directory path
+            (see `resolve_input()`).
+        encoding (str): The encoding to use.
+
+    Returns:
+        document (Document): The parsed document.
+
+    Raises:
+        IOError: If the source path does not exist.
+    """
+    if isinstance(source, Document):
+        return source
+    else:
+        in_filepath = resolve_input(source)
+        if not os.path.isfile(in_filepath):
+            raise IOError('File `{}` not found.'.format(in_filepath))
+        with open(in_filepath, 'rb') as fileobj:
+            text = fileobj.read().decode(encoding)
+        return parse_document(text, in_filepath)
+
+
+# ======================================================================
+def limits_rules(
+        limits=D_LIMITS,
+        skip_sections=D_SKIP_SECTIONS,
+        bib=False):
+    """
+    Describe the checks for a set of submission limits as rules.
+
+    The number of references is only reported if a bibliography is used
+    or if it is limited.
+
+    Args:
+        limits (dict): Limits to be used for testing.
+            Defaults to ISMRM 2019 Montreal abstracts.
+        skip_sections (Iterable[str]): The sections not counting toward
+            the total word count.
+        bib (bool): True if a bibliography is used (see `cite()`).
+
+    Returns:
+        rules (dict): The rules (see `compile_rules()`).
+
+    Examples:
+        >>> def labels(rules):
+        ...     return [rule.get('label') for rule in rules['rules']][-2:]
+        >>> labels(limits_rules(D_LIMITS))
+        ['Matching number of figures and captions', None]
+        >>> labels(limits_rules(D_LIMITS, bib=True))
+        ['Number of references', None]
+        >>> labels(limits_rules(dict(D_LIMITS, n_refs=10)))
+        ['Number of references', None]
+    """
+    n_refs = limits.get('n_refs')
+    rules = dict(
+        name='limits',
+        skip_sections=list(skip_sections),
+        rules=[
+            dict(label='Word Count Total ({gliph})', metric='wc_counted',
+                 max=limits['wc_tot']),
+            dict(scope='sections', rules=[
+                dict(select=dict(equals='Synopsis'),
+                     max=limits['wc_synopsis']),
+                dict(select=dict(prefix='Figure'),
+                     max=limits['wc_fig'], count='n_captions'),
+                dict(select=dict(prefix='References'), items='n_refs')]),
+            dict(label='Number of figures', metric='n_figs',
+                 max=limits['n_figs']),
+            dict(label='Number of captions', metric='n_captions',
+                 max=limits['n_figs']),
+            dict(label='Matching number of figures and captions',
+                 metric='n_figs', equals='n_captions'),
+            dict(scope='figures', max=limits['fig_size'])])
+    if bib or n_refs:
+        rules['rules'].insert(-1, dict(
+            label='Number of references', metric='n_refs',
+            **(dict(max=n_refs) if n_refs else {})))
+    return rules
+
+
+# ======================================================================
+def _compile_selector(selector):
+    """
+    Compile a section selector into a regular expression.
+
+    Args:
+        selector (dict): The selector, with one of the following keys:
+            - 'equals': the section title.
+            - 'prefix': the beginning of the section title.
+            - 'contains': a part of the section title.
+            - 'regex': a regular expression searched in the section title.
+
+    Returns:
+        pattern (re.Pattern): The compiled regular expression.
+
+    Raises:
+        ValueError: If the selector is not valid.
+
+    Examples:
+        >>> _compile_selector(dict(prefix='Fig.')).pattern
+        '^Fig\\\\.'
+        >>> _compile_selector(dict(around='Synopsis'))
+        Traceback (most recent call last):
+            ...
+        ValueError: Invalid section selector `{'around': 'Synopsis'}`.
+    """
+    fmts = dict(
+        equals='^{}$', prefix='^{}', contains='{}', regex=None)
+    if not isinstance(selector, dict) or len(selector) != 1 \
+            or next(iter(selector)) not in fmts:
+        raise ValueError('Invalid section selector `{}`.'.format(selector))
+    kind, text = next(iter(selector.items()))
+    try:
+        return re.compile(
+            fmts[kind].format(re.escape(text)) if fmts[kind] else text)
+    except re.error as e:
+        raise ValueError('Invalid section selector `{}`: {}'.format(
+            selector, e))
+
+
+# ======================================================================
+@functools.lru_cache(_RULES_CACHE_SIZE)
+def _compile_rules_json(text):
+    """
+    Compile rules (serialized as JSON) into an evaluation plan.
+
+    Args:
+        text (str): The JSON rules, see `compile_rules()`.
+
+    Returns:
+        plan (RulePlan): The evaluation plan.
+
+    Raises:
+        ValueError: If the rules are not valid.
+    """
+    rules = json.loads(text)
+    if not isinstance(rules, dict) or not isinstance(rules.get('rules'), list):
+        raise ValueError('Rules must contain a `rules` list.')
+    skip = rules.get('skip_sections', ())
+    skip = re.compile('|'.join(re.escape(item) for item in skip)) \
+        if skip else None
+    sections = []
+    steps = []
+    metrics = set(_RULES_METRICS)
+    ops = ('max', 'min', 'equals')
+    for rule in rules['rules']:
+        scope = rule.get('scope', 'document')
+        if scope == 'sections':
+            for item in rule.get('rules', ()):
+                sections.append((
+                    _compile_selector(item.get('select')),
+                    item.get('max'), item.get('count'), item.get('items'),
+                    item.get('label', 'Word Count: {title}')))
+                metrics.update(
+                    item[name] for name in ('count', 'items')
+                    if item.get(name))
+            steps.append(('sections', None, None, None, None))
+        elif scope == 'figures':
+            if not isinstance(rule.get('max'), (int, float)):
+                raise ValueError('Figures rule requires a `max` size.')
+            steps.append(('figures', rule.get('label', '"{fig:.46}"'),
+                          'size', 'max', rule.get('max')))
+        elif scope == 'document':
+            op = next((op for op in ops if op in rule), None)
+            steps.append(('document', rule.get('label', rule.get('metric')),
+                          rule.get('metric'), op, rule.get(op)))
+        else:
+            raise ValueError('Unknown rule scope `{}`.'.format(scope))
+    for kind, label, metric, op, ref in steps:
+        if kind == 'document' and (
+                metric not in metrics
+                or isinstance(ref, str) and ref not in metrics):
+            raise ValueError('Unknown metric in rule `{}`.'.format(label))
+    return RulePlan(
+        rules.get('name'), skip, tuple(sections), tuple(steps))
+
+
+# ======================================================================
+@functools.lru_cache(_RULES_CACHE_SIZE)
+def _compile_rules_file(filepath, mtime, size):
+    """
+    Compile a rule file into an evaluation plan.
+
+    The file modification time and size are only used as cache keys.
+
+    Args:
+        filepath (str): The JSON rule filepath.
+        mtime (int): The file modification time in ns.
+        size (int): The file size in bytes.
+
+    Returns:
+        plan (RulePlan): The evaluation plan.
+
+    Raises:
+        ValueError: If the rules are not valid.
+    """
+    with open(filepath, 'rb') as fileobj:
+        rules = json.loads(fileobj.read().decode('utf-8'))
+    return _compile_rules_json(json.dumps(rules, sort_keys=True))
+
+
+# ======================================================================
+def compile_rules(
+        limits=D_LIMITS,
+        bib=False):
+    """
+    Compile the checks into an evaluation plan (cached).
+
+    Rules are described by a dict (or the equivalent JSON file) with:
+        - 'name': the name of the rules (e.g. the conference and year).
+        - 'skip_sections': the sections (matched as part of the title)
+          not counting toward the total word count.
+        - 'rules': the checks, in report order. Each rule has a 'scope':
+            - 'document' (default): check the 'metric' against the
+              'max', 'min' or 'equals' value (a number or another metric),
+              reporting it as 'label'. The metrics are: 'wc_counted',
+              'wc_total', 'n_sections', 'n_figs' and the section counters.
+            - 'sections': report the word count of all non-empty sections.
+              Its 'rules' select sections (see `_compile_selector()`) to
+              check against their 'max' value, to tally in their 'count'
+              metric, and whose list items are tallied in their 'items'
+              metric. The first matching rule applies.
+              Unmatched sections are informative only.
+            - 'figures': check the size of each figure against 'max'.
+        A 'label' may use the `{gliph}`, `{title}` (sections) and `{fig}`
+        (figures) fields.
+
+    Args:
+        limits (dict|str): Limits or rules to be used for testing.
+            If dict with a 'rules' key, it is interpreted as rules.
+            If dict without a 'rules' key, it is interpreted as limits
+            (see `limits_rules()`).
+            If str, it is interpreted as a JSON rule filepath.
+        bib (bool): True if a bibliography is used (see `limits_rules()`).
+            Only used for limits.
+
+    Returns:
+        plan (RulePlan): The evaluation plan.
+
+    Raises:
+        IOError: If the rule file does not exist.
+        ValueError: If the rules are not valid.
+
+    Examples:
+        >>> plan = compile_rules(D_LIMITS)
+        >>> [step[0] for step in plan.steps][:3]
+        ['document', 'sections', 'document']
+        >>> compile_rules(D_LIMITS) is plan
+        True
+    """
+    if isinstance(limits, str):
+        if not os.path.isfile(limits):
+            raise IOError('Rule file `{}` not found.'.format(limits))
+        stat = os.stat(limits)
+        return _compile_rules_file(
+            os.path.realpath(limits), stat.st_mtime_ns, stat.st_size)
+    if 'rules' not in limits:
+        limits = limits_rules(limits, bib=bib)
+    return _compile_rules_json(json.dumps(limits, sort_keys=True))
+
+
+# ======================================================================
+def _make_check(label, value, limit, passed, txt_value):
+    """
+    Generate a check with its report text.
+
+    Args:
+        label (str): The check label.
+        value (int|float): The checked value.
+        limit (int|float|str): The limit (or the marking gliph).
+        passed (bool|None): The check result (None if informative).
+        txt_value (str): The value and limit, as displayed.
+
+    Returns:
+        check (Check): The check.
+    """
+    if passed:
+        mode, res = 'I', 'OK'
+    elif passed is None:
+        mode, res = GLIPH, ' '
+    else:
+        mode, res = 'E', 'ERR'
+    text = '{}: {:64} {:.>6s}'.format(
+        mode, '{:<48s}  {:>18s}'.format(label, txt_value), res)
+    return Check(label, value, limit, passed, text)
+
+
+# ======================================================================
+def evaluate_rules(
+        plan,
+        document):
+    """
+    Evaluate a compiled plan on a parsed document.
+
+    All sections and all figures are visited once, then the checks are
+    produced in report order.
+
+    Args:
+        plan (RulePlan): The evaluation plan, from `compile_rules()`.
+        document (Document): The parsed document.
+
+    Returns:
+        checks (list[Check]): The results of all checks, in report order.
+            The `passed` field is None for informative-only items.
+    """
+    metrics = collections.Counter()
+    section_checks = []
+    for block in document.blocks:
+        num_words = block['num_words']
+        title = block['title']
+        skip = plan.skip is not None and plan.skip.search(title) is not None
+        metrics['wc_total'] += num_words
+        metrics['wc_counted'] += 0 if skip else num_words
+        metrics['n_sections'] += 1
+        if not num_words:
+            continue
+        for pattern, limit, counter, items, label in plan.sections:
+            if pattern.search(title):
+                if counter:
+                    metrics[counter] += 1
+                if items:
+                    metrics[items] += sum(
+                        1 for line in block['text']
+                        if _LIST_ITEM_PATTERN.match(line))
+                passed = num_words <= limit if limit is not None else None
+                limit = limit if limit is not None else 0
+                break
+        else:
+            label = 'Word Count: {title}{gliph}'
+            passed, limit = None, 0 if skip else GLIPH
+        section_checks.append(_make_check(
+            label.format(title=title, gliph='' if limit != GLIPH else GLIPH),
+            num_words, limit, passed, '{:>8} / {:<7}'.format(
+                num_words, limit)))
+
+    figs = document.figs
+    metrics['n_figs'] = len(figs)
+    fig_sizes = []
+    if any(step[0] == 'figures' for step in plan.steps):
+        dirpath = os.path.dirname(document.filepath) \
+            if document.filepath else os.path.realpath(os.path.curdir)
+        for fig in figs:
+            fig_filepath = os.path.realpath(
+                os.path.join(dirpath, os.path.expanduser(fig)))
+            fig_sizes.append(
+                os.path.getsize(fig_filepath)
+                if os.path.isfile(fig_filepath) else -1)
+
+    checks = []
+    for kind, label, metric, op, ref in plan.steps:
+        if kind == 'sections':
+            checks.extend(section_checks)
+        elif kind == 'figures':
+            for fig, fig_size in zip(figs, fig_sizes):
+                if fig_size >= 0:
+                    txt_fig = '{:>8} / {:<7}'.format(
+                        *['{:.1f} {}'.format(n / 1e6, 'MB')
+                          for n in (fig_size, ref)])
+                else:
+                    txt_fig = 'NOT FOUND!'
+                checks.append(_make_check(
+                    label.format(fig=fig, gliph=GLIPH), fig_size, ref,
+                    0 <= fig_size <= ref, txt_fig))
+        else:
+            value = metrics[metric]
+            limit = metrics[ref] if isinstance(ref, str) else ref
+            if op == 'equals':
+                passed = value == limit
+                txt_value = '{:>8} {} {:<7}'.format(
+                    value, '=' if passed else '≠', limit)
+            else:
+                passed = None if op is None \
+                    else value <= limit if op == 'max' else value >= limit
+                txt_value = '{:>8} / {:<7}'.format(
+                    value, limit if limit is not None else 0)
+            checks.append(_make_check(
+                label.format(gliph=GLIPH), value, limit, passed, txt_value))
+    return checks
+
+
+# ======================================================================
+def check_document(
+        document,
+        limits=D_LIMITS,
+        bib=False):
+    """
+    Check a parsed document against the submission limits.
+
+    Args:
+        document (Document): The parsed document.
+        limits (dict|str): Limits or rules to be used for testing.
+            See `compile_rules()` for the accepted values.
+            Defaults to ISMRM 2019 Montreal abstracts.
+        bib (bool): True if a bibliography is used (see `limits_rules()`).
+
+    Returns:
+        checks (list[Check]): The results of all checks, in report order.
+            The `passed` field is None for informative-only items.
+
+    Raises:
+        IOError: If the rule file does not exist.
+        ValueError: If the rules are not valid.
+    """
+    return evaluate_rules(compile_rules(limits, bib), document)
+
+
+# ======================================================================
+def validate(
+        source,
+        limits=D_LIMITS,
+        encoding='utf-8',
+        bib=None):
+    """
+    Validate an abstract against the submission limits.
+
+    This has no side effects: nothing is printed or written.
+
+    Args:
+        source (str|Document): The abstract source.
+            See `load_document()` for the accepted values.
+            For Markdown text, use `parse_document()` first.
+        limits (dict|str): Limits or rules to be used for testing.
+            Defaults to ISMRM 2019 Montreal abstracts.
+        encoding (str): The encoding to use.
+        bib (str|None): The BibTeX filepath to resolve citations against.
+            If None, citations are not resolved (see `cite()`).
+
+    Returns:
+        result (Result): The validation result.
+            The `outputs` are empty, and the `notes` report the citations
+            not found.
+
+    Raises:
+        IOError: If the source path, the rule file or the BibTeX file do
+            not exist.
+        ValueError: If the source cannot be parsed or the rules are not
+            valid.
+    """
+    begin_time = time.time()
+    document = load_document(source, encoding)
+    notes = []
+    if bib:
+        text, missing = cite(document.text, bib)
+        document = parse_document(text, document.filepath)
+        if missing:
+            notes.append('W: citations not found: {}'.format(
+                ', '.join(missing)))
+    parse_time = time.time() - begin_time
+    try:
+        title = document.blocks[0]['title']
+    except IndexError:
+        raise ValueError('Could not parse file (syntax error or empty?)')
+    begin_time = time.time()
+    checks = check_document(document, limits, bool(bib))
+    check_time = time.time() - begin_time
+    passed = all(
+        [check.passed for check in checks if check.passed is not None])
+    return Result(
+        document, title, checks, passed,
+        dict(parse=parse_time, checks=check_time), {}, notes)
+
+
+# ======================================================================
+def png_size(in_filepath):
+    """
+    Read the size of a PNG image from its header.
+
+    Args:
+        in_filepath (str): The PNG filepath.
+
+    Returns:
+        size (tuple[int,int]|None): The (width, height) of the image.
+            If the file is not a PNG image, returns None.
+    """
+    with open(in_filepath, 'rb') as fileobj:
+        header = fileobj.read(24)
+    if header[:8] != _PNG_SIGNATURE or header[12:16] != b'IHDR':
+        return None
+    return struct.unpack('>II', header[16:24])
+
+
+# ======================================================================
+def _png_unfilter(filters, data, bpp):
+    """
+    Reverse the PNG scanline filters (vectorized with NumPy).
+
+    If only the None, Sub and Up filters are used, scanlines are processed
+    one at a time, each in a single vectorized operation.
+    Otherwise (Average and Paeth depend on the reconstructed left byte),
+    the image is processed along anti-diagonals: all bytes on the same
+    anti-diagonal only depend on bytes on previous anti-diagonals, and are
+    reconstructed together.
+
+    Args:
+        filters (np.ndarray[uint8]): The filter type of each scanline.
+        data (np.ndarray[uint8]): The filtered scanlines (without the
+            filter type byte), with shape (height, stride).
+        bpp (int): The number of bytes per complete pixel (at least 1).
+
+    Returns:
+        data (np.ndarray[uint8]): The reconstructed scanlines.
+    """
+    import numpy as np
+
+    height, stride = data.shape
+    width = stride // bpp
+    if np.all(filters <= 2):
+        out = np.empty_like(data)
+        prev = np.zeros(stride, dtype=np.uint8)
+        for i in range(height):
+            row = data[i]
+            if filters[i] == 1:
+                row = np.cumsum(
+                    row.reshape(width, bpp), axis=0, dtype=np.uint8).ravel()
+            elif filters[i] == 2:
+                row = row + prev
+            out[i] = prev = row
+        return out
+
+    raw = data.reshape(height, width, bpp).astype(np.int16)
+    # padded with a zero row on top and a zero pixel on the left
+    out = np.zeros((height + 1, width + 1, bpp), dtype=np.int16)
+    rows = np.arange(height)
+    filters = filters.astype(np.int16)
+    for diag in range(height + width - 1):
+        r = rows[max(0, diag - width + 1):min(height - 1, diag) + 1]
+        x = diag - r
+        a, b, c = out[r + 1, x], out[r, x + 1], out[r, x]
+        p = a + b - c
+        pa, pb, pc = np.abs(p - a), np.abs(p - b), np.abs(p - c)
+        paeth = np.where((pa <= pb) & (pa <= pc), a, np.where(pb <= pc, b, c))
+        kind = filters[r][:, None]
+        pred = np.select(
+            (kind == 1, kind == 2, kind == 3, kind == 4),
+            (a, b, (a + b) >> 1, paeth), 0)
+        out[r + 1, x + 1] = (raw[r, x] + pred) & 0xFF
+    return out[1:, 1:].astype(np.uint8).reshape(height, stride)
+
+
+# ======================================================================
+def _png_decode(data, width, height, depth, color):
+    """
+    Decode the (non-interlaced) PNG scanlines into pixel samples.
+
+    Args:
+        data (np.ndarray[uint8]): The decompressed image data.
+        width (int): The image width.
+        height (int): The image height.
+        depth (int): The bit depth.
+        color (int): The color type.
+
+    Returns:
+        img (np.ndarray[uint8]): The samples with shape (height, width,
+            channels). Palette images are not expanded.
+        size (int): The number of bytes of `data` used.
+    """
+    import numpy as np
+
+    channels = _PNG_CHANNELS[color]
+    bits = depth * channels
+    stride = (width * bits + 7) // 8
+    size = height * (stride + 1)
+    scanlines = data[:size].reshape(height, stride + 1)
+    pixels = _png_unfilter(
+        scanlines[:, 0], scanlines[:, 1:], max(1, bits // 8))
+    if depth == 16:
+        img = pixels.reshape(height, width, channels, 2)[..., 0]
+    elif depth < 8:
+        img = np.unpackbits(pixels, axis=1)
+        img = img[:, :width * depth].reshape(height, width, depth)
+        img = np.dot(img, 1 << np.arange(depth - 1, -1, -1)).astype(np.uint8)
+        if color == 0:
+            img = img * np.uint8(255 // ((1 << depth) - 1))
+        img = img[..., None]
+    else:
+        img = pixels.reshape(height, width, channels)
+    return img, size
+
+
+# ======================================================================
+def read_png(in_filepath):
+    """
+    Decode a PNG image.
+
+    Requires NumPy.
+
+    Args:
+        in_filepath (str): The PNG filepath.
+
+    Returns:
+        img (np.ndarray[uint8]): The image with shape (height, width,
+            channels). Palette images are expanded to RGB(A), and 16-bit
+            images are reduced to 8 bits.
+
+    Raises:
+        ValueError: If the file is not a supported PNG image.
+    """
+    import numpy as np
+
+    with open(in_filepath, 'rb') as fileobj:
+        data = fileobj.read()
+    if data[:8] != _PNG_SIGNATURE:
+        raise ValueError('`{}` is not a PNG image.'.format(in_filepath))
+    header, palette, transparency, chunks = None, None, None, []
+    pos = 8
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += length + 12
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', chunk)
+        elif kind == b'PLTE':
+            palette = chunk
+        elif kind == b'tRNS':
+            transparency = chunk
+        elif kind == b'IDAT':
+            chunks.append(chunk)
+        elif kind == b'IEND':
+            break
+    if header is None:
+        raise ValueError('`{}` has no header.'.format(in_filepath))
+    width, height, depth, color, _, _, interlace = header
+    if color not in _PNG_CHANNELS:
+        raise ValueError('`{}` has unsupported format.'.format(in_filepath))
+    data = np.frombuffer(zlib.decompress(b''.join(chunks)), dtype=np.uint8)
+    if not interlace:
+        img, size = _png_decode(data, width, height, depth, color)
+    else:
+        img = np.zeros((height, width, _PNG_CHANNELS[color]), dtype=np.uint8)
+        pos = 0
+        for x0, y0, dx, dy in _PNG_ADAM7:
+            sub_width = (width - x0 + dx - 1) // dx
+            sub_height = (height - y0 + dy - 1) // dy
+            if sub_width > 0 and sub_height > 0:
+                sub_img, size = _png_decode(
+                    data[pos:], sub_width, sub_height, depth, color)
+                img[y0::dy, x0::dx] = sub_img
+                pos += size
+    if color == 3:
+        lut = np.frombuffer(palette, dtype=np.uint8).reshape(-1, 3)
+        if transparency:
+            alpha = np.full((len(lut), 1), 255, dtype=np.uint8)
+            alpha[:len(transparency), 0] = np.frombuffer(
+                transparency, dtype=np.uint8)[:len(lut)]
+            lut = np.concatenate([lut, alpha], axis=1)
+        img = lut[img[..., 0]]
+    return img
+
+
+# ======================================================================
+def write_png(
+        out_filepath,
+        img,
+        level=6):
+    """
+    Encode an image as PNG (8-bit, using the Sub filter).
+
+    Requires NumPy.
+
+    Args:
+        out_filepath (str): The PNG filepath.
+        img (np.ndarray[uint8]): The image with shape (height, width,
+            channels), with 1 (gray), 2 (gray+alpha), 3 (RGB) or 4 (RGBA)
+            channels.
+        level (int): The compression level.
+
+    Returns:
+        None.
+    """
+    import numpy as np
+
+    height, width, channels = img.shape
+    color = dict((v, k) for k, v in _PNG_CHANNELS.items() if k != 3)
+    rows = np.ascontiguousarray(img, dtype=np.uint8).reshape(height, -1)
+    filtered = np.empty((height, rows.shape[1] + 1), dtype=np.uint8)
+    filtered[:, 0] = 1
+    filtered[:, 1:channels + 1] = rows[:, :channels]
+    filtered[:, channels + 1:] = rows[:, channels:] - rows[:, :-channels]
+
+    def _chunk(kind, chunk):
+        return struct.pack('>I', len(chunk)) + kind + chunk + struct.pack(
+            '>I', zlib.crc32(kind + chunk) & 0xFFFFFFFF)
+
+    with open(out_filepath, 'wb') as fileobj:
+        fileobj.write(_PNG_SIGNATURE)
+        fileobj.write(_chunk(b'IHDR', struct.pack(
+            '>IIBBBBB', width, height, 8, color[channels], 0, 0, 0)))
+        fileobj.write(_chunk(
+            b'IDAT', zlib.compress(filtered.tobytes(), level)))
+        fileobj.write(_chunk(b'IEND', b''))
+
+
+# ======================================================================
+def resample_area(
+        img,
+        size):
+    """
+    Resize an image by area averaging (vectorized with NumPy).
+
+    Each output pixel is the exact average of the input area it covers,
+    computed from cumulative sums along each axis.
+
+    Args:
+        img (np.ndarray): The image with shape (height, width, channels).
+        size (tuple[int,int]): The output (width, height).
+
+    Returns:
+        img (np.ndarray[uint8]): The resized image.
+    """
+    import numpy as np
+
+    result = img.astype(np.float32)
+    for axis, num in ((0, size[1]), (1, size[0])):
+        arr = np.moveaxis(result, axis, 0)
+        num_in = arr.shape[0]
+        cum = np.concatenate(
+            [np.zeros((1,) + arr.shape[1:], dtype=arr.dtype),
+             np.cumsum(arr, axis=0)])
+        edges = np.linspace(0, num_in, num + 1)
+        idx = np.floor(edges).astype(int)
+        frac = (edges - idx).astype(np.float32).reshape(
+            (-1,) + (1,) * (arr.ndim - 1))
+        integral = cum[idx] + frac * arr[np.minimum(idx, num_in - 1)]
+        result = np.moveaxis(
+            np.diff(integral, axis=0) * (num / num_in), 0, axis)
+    return np.clip(np.round(result), 0, 255).astype(np.uint8)
+
+
+# ======================================================================
+def make_preview(
+        in_filepath,
+        out_dirpath,
+        max_size=D_PREVIEW_MAX_SIZE):
+    """
+    Generate a downscaled preview of a PNG figure, with caching.
+
+    Previews are named after the hash of the figure content and the
+    preview size, so they are only generated once for each figure version.
+
+    Args:
+        in_filepath (str): The figure filepath.
+        out_dirpath (str): The directory where previews are stored.
+        max_size (tuple[int,int]): The max (width, height) of the preview.
+
+    Returns:
+        out_filepath (str|None): The preview filepath.
+            If the figure is not a PNG or it is not larger than `max_size`,
+            returns None (the original figure should be used).
+    """
+    size = png_size(in_filepath)
+    if size is None:
+        return None
+    scale = min(max_size[0] / size[0], max_size[1] / size[1])
+    if scale >= 1:
+        return None
+    with open(in_filepath, 'rb') as fileobj:
+        digest = hashlib.sha1(fileobj.read()).hexdigest()
+    out_filepath = os.path.join(
+        out_dirpath, '{}_{}x{}.png'.format(digest[:20], *max_size))
+    if not os.path.isfile(out_filepath):
+        img = resample_area(
+            read_png(in_filepath),
+            (max(1, int(round(size[0] * scale))),
+             max(1, int(round(size[1] * scale)))))
+        if not os.path.isdir(out_dirpath):
+            os.makedirs(out_dirpath)
+        tmp_filepath = temp_filepath(out_filepath)
+        write_png(tmp_filepath, img)
+        os.replace(tmp_filepath, out_filepath)
+    return out_filepath
+
+
+# ======================================================================
+def preview_figures(
+        document,
+        max_size=D_PREVIEW_MAX_SIZE,
+        dirname=D_PREVIEW_DIRNAME):
+    """
+    Generate the previews for all the figures of a document.
+
+    Args:
+        document (Document): The parsed document.
+            The document must have been loaded from a file.
+        max_size (tuple[int,int]): The max (width, height) of the previews.
+        dirname (str): The previews directory, relative to the document.
+
+    Returns:
+        previews (dict): The preview path (relative to the document) for
+            each figure URI that has a preview.
+
+    Raises:
+        ImportError: If NumPy is not available.
+    """
+    import numpy  # noqa: F401 (fail early if not available)
+
+    dirpath = os.path.dirname(document.filepath)
+    previews = {}
+    for fig in document.figs:
+        fig_filepath = os.path.join(dirpath, os.path.expanduser(fig))
+        if os.path.isfile(fig_filepath):
+            try:
+                preview_filepath = make_preview(
+                    fig_filepath, os.path.join(dirpath, dirname), max_size)
+            except (ValueError, zlib.error):
+                preview_filepath = None
+            if preview_filepath:
+                previews[fig] = os.path.relpath(preview_filepath, dirpath)
+    return previews
+
+
+# ======================================================================
+def figures_filepaths(document):
+    """
+    Determine the filepaths of the existing figures of a document.
+
+    Args:
+        document (Document): The parsed document.
+
+    Returns:
+        filepaths (list[str]): The figure filepaths.
+            Figures that cannot be found are not included.
+    """
+    dirpath = os.path.dirname(document.filepath) \
+        if document.filepath else os.path.realpath(os.path.curdir)
+    filepaths = [
+        os.path.join(dirpath, os.path.expanduser(fig))
+        for fig in document.figs]
+    return [filepath for filepath in filepaths if os.path.isfile(filepath)]
+
+
+# ======================================================================
+def replace_figures(
+        text,
+        replaces):
+    """
+    Replace the figure URIs in a Markdown text.
+
+    Args:
+        text (str): The Markdown text.
+        replaces (dict): The new URI for each URI to replace.
+
+    Returns:
+        text (str): The Markdown text with the replaced URIs.
+
+    Examples:
+        >>> replace_figures('[1]: a.png\\n![x](a.png)', {'a.png': 'b.png'})
+        '[1]: b.png\\n![x](b.png)'
+    """
+    for old, new in replaces.items():
+        text = re.sub(
+            r'(\]:[ \t]*|\]\()' + re.escape(old) + r'(?=[ \t]*(\)|$))',
+            lambda match: match.group(1) + new, text, flags=re.MULTILINE)
+    return text
+
+
+# ======================================================================
+def split_sections(
+        text,
+        hdr_tokens=D_HDR_TOKENS,
+        hdr_tokens_nl=D_HDR_TOKENS_NL):
+    """
+    Split a Markdown text into the source of its sections.
+
+    Headers are detected as in `word_count_text()`.
+    Any text before the first header is kept as a separate section.
+
+    Args:
+        text (str): The Markdown text.
+        hdr_tokens (Iterable[str]): Header token identifier.
+        hdr_tokens_nl (Iterable[str]): Header-after-new-line token identifier.
+
+    Returns:
+        chunks (list[str]): The source of each section.
+            Their concatenation is the input text.
+
+    Examples:
+        >>> split_sections('# Title\\nA\\n## Sub\\nB\\n')
+        ['# Title\\nA\\n', '## Sub\\nB\\n']
+        >>> split_sections('Intro\\nTitle\\n=====\\nA\\n')
+        ['Intro\\n', 'Title\\n=====\\nA\\n']
+    """
+    lines = text.splitlines(True)
+    starts = [0]
+    for i, line in enumerate(lines):
+        if line.startswith(tuple(hdr_tokens)):
+            starts.append(i)
+        elif i > 0 and line.startswith(tuple(hdr_tokens_nl)) \
+                and len(line.rstrip()) == len(lines[i - 1].rstrip()):
+            starts.append(i - 1)
+    starts = sorted(set(starts)) + [len(lines)]
+    return [
+        ''.join(lines[start:end])
+        for start, end in zip(starts[:-1], starts[1:]) if end > start]
+
+
+# ======================================================================
+def bench_inputs(size=D_BENCH_SIZE):
+    """
+    Generate the pathological inputs for the scanners benchmark.
+
+    Args:
+        size (int): The approximate size of each input in characters.
+
+    Returns:
+        inputs (list[tuple[str,str]]): The name and the text of each input.
+
+    Examples:
+        >>> [name for name, text in bench_inputs(1024)]
+        ... # doctest: +NORMALIZE_WHITESPACE
+        ['long line', 'inline brackets', 'ref brackets', 'brackets',
+         'data URI', 'open data URI', 'table', 'headers']
+        >>> all(1000 < len(text) <= 1024 for name, text in bench_inputs(1024))
+        True
+    """
+    def _fill(unit, head='', tail=''):
+        num = max(1, (size - len(head) - len(tail)) // len(unit))
+        return head + unit * num + tail
+
+    return [
+        ('long line', _fill('word ')),
+        ('inline brackets', _fill('](', '![')),
+        ('ref brackets', _fill('][1]]', '[![')),
+        ('brackets', _fill('[![](')),
+        ('data URI', _fill('QUJD', '![fig](data:image/png;base64,', ')')),
+        ('open data URI', _fill('QUJD', '![fig](data:image/png;base64,')),
+        ('table', _fill('| a | b | c |\n|---|---|---|\n')),
+        ('headers', _fill('# A\nB\n=\n## C\n')),
+    ]
+
+
+# ======================================================================
+def benchmark_scanners(
+        size=D_BENCH_SIZE,
+        min_throughput=D_BENCH_MIN_THROUGHPUT,
+        max_scaling=D_BENCH_MAX_SCALING,
+        repeats=3):
+    """
+    Benchmark the Markdown scanners on pathological inputs.
+
+    Each scanner is timed on each input of `bench_inputs()` (best of a few
+    runs), at full and quarter size.
+    A scanner passes if its throughput is above the bound and if its time
+    per character does not grow with the input size (i.e. it is linear).
+
+    Args:
+        size (int): The approximate size of each input in characters.
+        min_throughput (float): Min characters per second.
+        max_scaling (float): Max growth of the time per character between
+            quarter and full size (~1 if linear, ~4 if quadratic).
+            Not checked if the full-size time is too short to be reliable.
+        repeats (int): The number of runs of each measurement.
+
+    Returns:
+        results (list[dict]): The measurements.
+            Each dict contains:
+                - 'input': the input name.
+                - 'scanner': the scanner name.
+                - 'size': the input size in characters.
+                - 'elapsed': the time in seconds.
+                - 'throughput': the characters per second.
+                - 'scaling': the growth of the time per character.
+                - 'passed': True if within the bounds.
+
+    Examples:
+        >>> results = benchmark_scanners(2 ** 16, 0, repeats=5)
+        >>> [(result['input'], result['scanner']) for result in results
+        ...  if result['scaling'] > D_BENCH_MAX_SCALING]
+        []
+    """
+    scanners = (
+        ('find_figures_text', find_figures_text),
+        ('word_count_text', word_count_text),
+        ('split_sections', split_sections))
+
+    def _elapsed(scanner, text):
+        times = []
+        for _ in range(repeats):
+            begin_time = time.perf_counter()
+            scanner(text)
+            times.append(time.perf_counter() - begin_time)
+        return max(min(times), 1e-9)
+
+    small_inputs = dict(bench_inputs(size // 4))
+    results = []
+    for name, text in bench_inputs(size):
+        small_text = small_inputs[name]
+        for scanner_name, scanner in scanners:
+            elapsed = _elapsed(scanner, text)
+            scaling = (elapsed / len(text)) / (
+                _elapsed(scanner, small_text) / len(small_text))
+            throughput = len(text) / elapsed
+            results.append(dict(
+                input=name, scanner=scanner_name, size=len(text),
+                elapsed=elapsed, throughput=throughput, scaling=scaling,
+                passed=throughput >= min_throughput and (
+                    elapsed < _BENCH_MIN_TIME or scaling <= max_scaling)))
+    return results
+
+
+# ======================================================================
+def print_benchmark(
+        size=D_BENCH_SIZE,
+        verbose=D_VERB_LVL):
+    """
+    Display the benchmark of the Markdown scanners on pathological inputs.
+
+    Args:
+        size (int): The approximate size of each input in characters.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        passed (bool): True if all scanners are within the bounds.
+            See `benchmark_scanners()` for more details.
+    """
+    results = benchmark_scanners(size)
+    msg(': {:<16s} {:<18s} {:>10s} {:>11s} {:>8s}'.format(
+        'Input', 'Scanner', 'Time', 'Throughput', 'Scaling'),
+        verbose, fmtt='{t.bold}{t.blue}')
+    for result in results:
+        msg('{}: {input:<16s} {scanner:<18s} {:>9.2f}ms {:>8.1f}MB/s'
+            ' {scaling:>8.2f}'.format(
+                'I' if result['passed'] else 'E',
+                result['elapsed'] * 1e3, result['throughput'] / 2 ** 20,
+                **result), verbose)
+    num_passed = sum(result['passed'] for result in results)
+    msg('Passed: {} / {}'.format(num_passed, len(results)), verbose,
+        fmtt='{t.bold}')
+    return num_passed == len(results)
+
+
+# ======================================================================
+def nest_sections(fragments):
+    """
+    Stitch HTML section fragments, restoring the nesting of the sections.
+
+    Each fragment is rendered separately, so its `<section>` (as produced
+    by `--section-divs`) is closed at its end.
+    Instead, a section is kept open until a header of the same or higher
+    level, as in a whole-document rendering.
+
+    Args:
+        fragments (Iterable[str]): The HTML of each section.
+            Fragments not starting with a `<section>` are left unchanged.
+
+    Returns:
+        html (str): The stitched HTML.
+
+    Examples:
+        >>> print(nest_sections([
+        ...     '<p>0</p>',
+        ...     '<section class="level1">\\n<h1>A</h1>\\n</section>',
+        ...     '<section class="level2">\\n<h2>B</h2>\\n</section>',
+        ...     '<section class="level1">\\n<h1>C</h1>\\n</section>']))
+        <p>0</p>
+        <section class="level1">
+        <h1>A</h1>
+        <section class="level2">
+        <h2>B</h2>
+        </section>
+        </section>
+        <section class="level1">
+        <h1>C</h1>
+        </section>
+    """
+    parts = []
+    levels = []
+    for fragment in fragments:
+        match = _SECTION_PATTERN.match(fragment)
+        fragment = fragment.rstrip()
+        if match and fragment.endswith('</section>'):
+            level = int(match.group(1))
+            while levels and levels[-1] >= level:
+                parts.append('</section>')
+                levels.pop()
+            fragment = fragment[:-len('</section>')].rstrip()
+            levels.append(level)
+        parts.append(fragment)
+    parts.extend('</section>' for _ in levels)
+    return '\n'.join(parts)
+
+
+# ======================================================================
+def html_dom(text):
+    """
+    Extract the structure of an HTML document, for comparisons.
+
+    Whitespace-only text is ignored, and other text is stripped, so that
+    documents differing only in formatting have the same structure.
+
+    Args:
+        text (str): The HTML text.
+
+    Returns:
+        dom (list[tuple]): The start tags (with their attributes), the end
+            tags and the text, in document order.
+
+    Examples:
+        >>> html_dom('<p class="a">\\n x </p>') == \\
+        ...     html_dom('<p class="a">x</p>')
+        True
+        >>> html_dom('<div><p>x</p></div>') == html_dom('<div></div><p>x</p>')
+        False
+    """
+    dom = []
+
+    class _Parser(html.parser.HTMLParser):
+        def handle_starttag(self, tag, attrs):
+            dom.append(('start', tag, tuple(attrs)))
+
+        def handle_endtag(self, tag):
+            dom.append(('end', tag))
+
+        def handle_data(self, data):
+            if data.strip():
+                dom.append(('data', data.strip()))
+
+    parser = _Parser(convert_charrefs=True)
+    parser.feed(text)
+    parser.close()
+    return dom
+
+
+# ======================================================================
+def render_sections(
+        chunks,
+        args,
+        run,
+        cache_filepath=None,
+        options=''):
+    """
+    Render Markdown sections to HTML, with a per-section cache.
+
+    Each section is cached by a hash of its source and of the renderer
+    options.
+    All sections not found in the cache are rendered in one batch, each
+    wrapped in a fenced div (requires `pandoc` 2.0+), together with a
+    placeholder for the standalone header and footer.
+    The header and footer are cached separately for documents with and
+    without math, so that they match those of a whole-document rendering.
+    Link reference definitions are shared among all sections, as for the
+    whole document.
+
+    Args:
+        chunks (Sequence[str]): The Markdown source of each section.
+        args (list[str]): The command-line of the standalone renderer.
+        run (callable): Run the renderer.
+            Signature: run(args, in_pipe) -> (ret_code, p_stdout, p_stderr).
+        cache_filepath (str|None): The fragments cache filepath.
+            Only the fragments of the current sections are retained.
+            If None, fragments are not cached.
+        options (str): Additional renderer options (e.g. its version) to
+            distinguish the cached fragments.
+
+    Returns:
+        html (str|None): The stitched HTML document.
+            If the batch rendering failed, returns None.
+        num_rendered (int): The number of sections rendered.
+
+    Examples:
+        >>> filepath = os.path.join(
+        ...     os.path.dirname(os.path.realpath(__file__)), '..',
+        ...     'abstract_template', 'abstract_template.md')
+        >>> with open(filepath, 'r', encoding='utf-8') as file_obj:
+        ...     text = file_obj.read()
+        >>> args, is_valid = which(TOOLS['md2html'].format(
+        ...     css_str='', self_contained_str=''))
+        >>> run = lambda args, in_pipe: execute(
+        ...     args, in_pipe, verbose=VERB_LVL['none'])
+        >>> html, num_rendered = render_sections(
+        ...     split_sections(text), args, run) if is_valid else (None, 0)
+        >>> not is_valid or html_dom(html) == html_dom(run(args, text)[1])
+        True
+    """
+    options = ' '.join(args) + '\n' + options
+    refs = [
+        line for line in ''.join(chunks).splitlines()
+        if re.match(r' {0,3}\[[^\]]+\]:', line)]
+    sources = []
+    for chunk in chunks:
+        chunk_lines = set(chunk.splitlines())
+        missing = [ref for ref in refs if ref not in chunk_lines]
+        sources.append(chunk + ('\n\n' + '\n'.join(missing) + '\n'
+                                if missing else ''))
+    keys = [
+        hashlib.sha1((options + '\n' + source).encode('utf-8')).hexdigest()
+        for source in sources]
+    shell_keys = [
+        hashlib.sha1((options + '\n' + str(has_math)).encode(
+            'utf-8')).hexdigest()
+        for has_math in (False, True)]
+    cache = _load_json(cache_filepath, {}) if cache_filepath else {}
+
+    todo = [i for i, key in enumerate(keys) if key not in cache]
+    for batch in (todo, None):
+        if batch is None:
+            # : the header must match the one of the whole document
+            has_math = any(
+                'class="math' in cache[key] for key in keys)
+            if shell_keys[has_math] in cache:
+                break
+            batch = []
+        elif not batch:
+            continue
+        else:
+            has_math = False
+        # : math in the shell makes the header include MathJax
+        in_pipe = '::: {{#{}-shell .{}}}\n{}\n:::\n\n'.format(
+            _FRAGMENT_ID, _FRAGMENT_ID,
+            '\\\\(x\\\\)' if has_math else 'x') + ''.join(
+            '::: {{#{}-{} .{}}}\n{}\n:::\n\n'.format(
+                _FRAGMENT_ID, i, _FRAGMENT_ID, sources[i]) for i in batch)
+        ret_code, p_stdout, p_stderr = run(args, in_pipe)
+        tags = list(re.finditer(
+            r'<div id="{}-(shell|\d+)" class="{}">\n?'.format(
+                _FRAGMENT_ID, _FRAGMENT_ID), p_stdout or ''))
+        end = (p_stdout or '').rfind('</body>')
+        if ret_code != 0 or not tags or tags[0].group(1) != 'shell' \
+                or end < tags[-1].end():
+            return None, 0
+        fragments = []
+        for tag, next_start in zip(
+                tags[1:], [tag.start() for tag in tags[2:]] + [end]):
+            fragment = p_stdout[tag.end():next_start].rstrip()
+            if fragment.endswith('</div>'):
+                fragment = fragment[:-len('</div>')].rstrip()
+            cache[keys[int(tag.group(1))]] = fragment
+            fragments.append(fragment)
+        has_math = has_math or any(
+            'class="math' in fragment for fragment in fragments)
+        cache[shell_keys[has_math]] = [
+            p_stdout[:tags[0].start()], p_stdout[end:]]
+        if any(keys[i] not in cache for i in batch):
+            return None, 0
+    shell_key = shell_keys[has_math]
+    header, footer = cache[shell_key]
+    html = header + nest_sections([cache[key] for key in keys]) + '\n' + \
+        footer
+    if cache_filepath:
+        _save_json(cache_filepath, dict(
+            (key, cache[key]) for key in [shell_key] + keys))
+    return html, len(todo)
+
+
+# ======================================================================
+def _zip_compress(name, data, level=D_ZIP_LEVEL):
+    """
+    Compress a single ZIP archive member (worker function).
+
+    Args:
+        name (str): The member name.
+        data (bytes): The member content.
+        level (int): The Deflate compression level.
+
+    Returns:
+        method (int): The ZIP compression method (0: stored, 8: deflated).
+        payload (bytes): The (possibly compressed) content.
+        crc (int): The CRC-32 of the uncompressed content.
+    """
+    crc = zlib.crc32(data) & 0xffffffff
+    if level and os.path.splitext(name)[1].lower() not in _ZIP_STORED_EXTS:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        payload = compressor.compress(data) + compressor.flush()
+        if len(payload) < len(data):
+            return zipfile.ZIP_DEFLATED, payload, crc
+    return zipfile.ZIP_STORED, data, crc
+
+
+# ======================================================================
+def zip_archive(
+        members,
+        level=D_ZIP_LEVEL,
+        comment=b'',
+        jobs=None):
+    """
+    Build a deterministic ZIP archive.
+
+    Members are sorted by name and get fixed timestamps and permissions,
+    so that the same content always gives the same archive.
+    Members are compressed in parallel threads (`zlib` releases the GIL),
+    except already compressed formats (e.g. PNG), which are stored.
+
+    Args:
+        members (dict[str,bytes]): The content of each member, by name.
+        level (int): The Deflate compression level.
+        comment (bytes): The archive comment.
+        jobs (int|None): The number of parallel threads.
+            If None, this is determined automatically.
+
+    Returns:
+        data (bytes): The archive.
+
+    Examples:
+        >>> import io
+        >>> data = zip_archive({'b.md': b'b' * 100, 'a.png': b'a' * 100})
+        >>> data == zip_archive({'a.png': b'a' * 100, 'b.md': b'b' * 100})
+        True
+        >>> archive = zipfile.ZipFile(io.BytesIO(data))
+        >>> [(info.filename, info.compress_type)
+        ...  for info in archive.infolist()]
+        [('a.png', 0), ('b.md', 8)]
+        >>> set(info.date_time for info in archive.infolist())
+        {(1980, 1, 1, 0, 0, 0)}
+        >>> archive.read('b.md') == b'b' * 100
+        True
+    """
+    year, month, day, hour, minute, second = _ZIP_DATE_TIME
+    dos_date = (year - 1980) << 9 | month << 5 | day
+    dos_time = hour << 11 | minute << 5 | second // 2
+    names = sorted(members)
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        compressed = list(executor.map(
+            lambda name: _zip_compress(name, members[name], level), names))
+    flags = 0x800  # UTF-8 member names
+    chunks, entries = [], []
+    offset = 0
+    for name, (method, payload, crc) in zip(names, compressed):
+        name_bytes = name.encode('utf-8')
+        header = struct.pack(
+            '<4sHHHHHIIIHH', b'PK\x03\x04', 20, flags, method,
+            dos_time, dos_date, crc, len(payload), len(members[name]),
+            len(name_bytes), 0) + name_bytes
+        entries.append(struct.pack(
+            '<4sHHHHHHIIIHHHHHII', b'PK\x01\x02', 3 << 8 | 20, 20, flags,
+            method, dos_time, dos_date, crc, len(payload), len(members[name]),
+            len(name_bytes), 0, 0, 0, 0, 0o100644 << 16, offset) + name_bytes)
+        chunks.extend((header, payload))
+        offset += len(header) + len(payload)
+    directory = b''.join(entries)
+    end = struct.pack(
+        '<4sHHHHIIH', b'PK\x05\x06', 0, 0, len(entries), len(entries),
+        len(directory), offset, len(comment)) + comment
+    return b''.join(chunks + [directory, end])
+
+
+# ======================================================================
+def package_members(
+        document,
+        outputs,
+        report=None):
+    """
+    Collect the members of the submission package of an abstract.
+
+    Only the figures referenced by the document are included, regardless of
+    the other files in their directory.
+    Files outside of the abstract directory are stored by their filename,
+    numbered (e.g. `fig.1.png`) if already taken by another member.
+
+    Args:
+        document (Document): The parsed document.
+            It must have been loaded from a file.
+        outputs (dict[str,str]): The output filepaths, by stage name.
+            The 'fix' and 'pdf' outputs are included, if present.
+        report (bytes|None): The test report.
+            If None, it is not included.
+
+    Returns:
+        members (dict[str,str|bytes]): The filepath or the content of each
+            member, by name (relative to the abstract directory).
+    """
+    dirpath = os.path.dirname(document.filepath)
+    filepaths = [
+        outputs[name] for name in ('fix', 'pdf') if name in outputs]
+    filepaths += figures_filepaths(document)
+    members = {}
+    if report is not None:
+        members[D_PACKAGE_REPORT] = report
+    for filepath in filepaths:
+        name = os.path.relpath(filepath, dirpath)
+        if name.startswith(os.pardir):
+            name = os.path.basename(filepath)
+        name = name.replace(os.sep, '/')
+        base, ext = os.path.splitext(name)
+        i = 0
+        while members.get(name, filepath) != filepath:
+            i += 1
+            name = '{}.{}{}'.format(base, i, ext)
+        members[name] = filepath
+    return members
+
+
+# ======================================================================
+def write_package(
+        out_filepath,
+        members,
+        level=D_ZIP_LEVEL,
+        jobs=None,
+        force=False):
+    """
+    Write a submission package, if any of its members changed.
+
+    The digest of the members is stored as the archive comment, and the
+    archive is rebuilt only if it differs (the archive modification time
+    is updated anyway, to keep timestamp-based checks consistent).
+
+    Args:
+        out_filepath (str): The archive filepath.
+        members (dict[str,str|bytes]): The filepath or the content of each
+            member, by name.
+        level (int): The Deflate compression level.
+        jobs (int|None): The number of parallel threads.
+            If None, this is determined automatically.
+        force (bool): Force new processing.
+
+    Returns:
+        redo (bool): True if the archive was (re)written.
+    """
+    def _read(source):
+        if isinstance(source, bytes):
+            return source
+        with open(source, 'rb') as fileobj:
+            return fileobj.read()
+
+    names = sorted(members)
+    with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+        contents = dict(zip(names, executor.map(
+            lambda name: _read(members[name]), names)))
+        hashes = executor.map(
+            lambda name: hashlib.sha1(contents[name]).digest(), names)
+        digest = hashlib.sha1(str(level).encode('utf-8'))
+        for name, member_hash in zip(names, hashes):
+            digest.update(name.encode('utf-8') + b'\0' + member_hash)
+    comment = _ZIP_COMMENT.format(digest.hexdigest()).encode('utf-8')
+    if not force and os.path.isfile(out_filepath):
+        try:
+            with zipfile.ZipFile(out_filepath) as archive:
+                is_current = archive.comment == comment
+        except zipfile.BadZipFile:
+            is_current = False
+        if is_current:
+            os.utime(out_filepath)
+            return False
+    write_atomic(out_filepath, zip_archive(contents, level, comment, jobs))
+    return True
+
+
+# ======================================================================
+def build(
+        result,
+        out_filepath=None,
+        export=('html', 'pdf'),
+        attach=True,
+        backup=False,
+        log=True,
+        css=None,
+        self_contained=False,
+        preview=True,
+        incremental=False,
+        bib=None,
+        encoding='utf-8',
+        figs_dpi=72,
+        timeout=None,
+        retries=D_RETRIES,
+        cancel=None,
+        history_filepath=D_HISTORY_FILEPATH,
+        force=False,
+        verbose=VERB_LVL['none']):
+    """
+    Produce the fixed version and the exports of a validated abstract.
+
+    Args:
+        result (Result): The validation result, as obtained from `validate()`.
+            The document must have been loaded from a file.
+        out_filepath (str): The output filepath.
+            If None, it will be computed from the input file.
+        export (list[str]): The export format(s).
+            Accepted values are: [html|pdf|zip]
+        attach (bool): Attach results to output/export file(s).
+        backup (bool): Backups before processing.
+        log (bool): Log the output of external tools.
+        css (list[str]|None): Specify the CSS sources.
+        self_contained (bool): Specify if HTML export is self-contained.
+        preview (bool): Use preview-resolution figures in exports.
+            The fixed version always references the original figures.
+            Requires NumPy.
+        incremental (bool): Render the HTML export section by section.
+            Only the sections changed since the last export are rendered
+            (see `render_sections()`); the others are taken from the cache.
+            Ignored if the HTML export is self-contained.
+        bib (str|None): The BibTeX filepath to resolve citations against.
+            It should match the one used for `validate()`.
+        encoding (str): The encoding to use.
+        figs_dpi (float): Resolution of the figures in exports.
+        timeout (float|None): Timeout of each external tool in seconds.
+            If None, the tool-specific defaults from `D_TIMEOUT` are used.
+        retries (int): Max number of retries for transient tool failures.
+        cancel (threading.Event|None): Cooperative cancellation flag.
+            If set, in-flight external tool runs are aborted.
+        history_filepath (str|None): The stage timings history filepath.
+            If None, no timings are recorded.
+        force (bool): Force new processing.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        result (Result): The input result with updated `timings`, `outputs`
+            (stage name to filepath, only for up-to-date outputs) and `notes`
+            (messages for the user).
+
+    Raises:
+        ValueError: If the document was not loaded from a file.
+    """
+    in_filepath = result.document.filepath
+    if not in_filepath:
+        raise ValueError('Cannot build a document without a filepath.')
+    export = [s.lower() for s in export]
+    if isinstance(css, str):
+        css = [css]
+    timings = dict(result.timings)
+    outputs = {}
+    notes = list(result.notes)
+    lines = [check.text for check in result.checks]
+    tests = [check.passed for check in result.checks]
+
+    def _exec(tool, args, in_pipe=None, size=0):
+        begin_time = time.time()
+        ret = execute(
+            args, in_pipe,
+            timeout=timeout if timeout is not None else D_TIMEOUT.get(tool),
+            retries=retries, cancel=cancel, log=D_LOG if log else None,
+            verbose=verbose)
+        timings[tool] = time.time() - begin_time
+        record_timing(
+            os.path.basename(args[0]), size, timings[tool], ret[0],
+            history_filepath)
+        return ret
+
+    if backup:
+        args, is_valid = which(TOOLS['vcs'].format_map(vars()))
+        ret_code, p_stdout, p_stderr = _exec('vcs', args)
+        if ret_code == 0:
+            notes.append('I: Your VCS has been updated.')
+        else:
+            reason = '(Returned: {})'.format(ret_code) \
+                if is_valid else '(`{}` not found)'.format(args[0])
+            notes.append('W: VCS backup failed {}.'.format(reason))
+
+    # :: generate fixed version
+    begin_time = time.time()
+    if fix(in_filepath, out_filepath,
+           gen_report(lines, tests) if attach else '', encoding,
+           bib=bib, force=force, verbose=verbose):
+        timings['fix'] = time.time() - begin_time
+        record_timing(
+            'fix', os.path.getsize(in_filepath), timings['fix'],
+            history_filepath=history_filepath)
+    outputs['fix'] = fix_filepath(in_filepath, out_filepath)
+
+    # :: export to HTML and PDF
+    if 'html' in export or 'pdf' in export:
+        if css is None:
+            if check_redo([__file__], [D_CSS_FILEPATH], force):
+                write_atomic(
+                    D_CSS_FILEPATH, D_CSS_FILECONTENT.encode(encoding))
+                notes.append('W: CSS `{}` may have been overwritten.'.format(
+                    D_CSS_FILEPATH))
+            css = D_CSS + \
+                  [D_CSS_FILEPATH] if D_CSS_FILEPATH not in D_CSS else []
+        css_str = ' '.join([_MD2HTML_MULTI_CSS + item for item in css])
+        notes.append('CSS: {}'.format(css))
+
+        toolchain(['md2html', 'html2pdf'] if 'pdf' in export else ['md2html'])
+        html_filepath = os.path.splitext(in_filepath)[0] + '.htm'
+        if not self_contained:
+            self_contained_str = ''
+        elif tool_flag('md2html', '--embed-resources'):
+            self_contained_str = '--embed-resources'
+        else:
+            self_contained_str = '--self-contained'
+        previews = {}
+        if preview:
+            try:
+                begin_time = time.time()
+                previews = preview_figures(result.document)
+                timings['preview'] = time.time() - begin_time
+            except ImportError:
+                notes.append('W: figure previews require NumPy.')
+        figs_filepaths = figures_filepaths(result.document) if preview else []
+        is_stale = False  # : an existing output could not be updated
+        if check_redo(
+                [in_filepath, __file__, toolchain_stamp('md2html')] +
+                figs_filepaths + ([bib] if bib else []), [html_filepath],
+                force):
+            in_pipe = replace_figures(result.document.text, previews)
+            if attach:
+                in_pipe += gen_report(lines, tests, use_html=True)
+            args, is_valid = which(TOOLS['md2html'].format_map(vars()))
+            html = None
+            if is_valid and incremental and not self_contained:
+                html, num_rendered = render_sections(
+                    split_sections(in_pipe), args,
+                    lambda args, in_pipe: _exec(
+                        'md2html', args, in_pipe,
+                        len(in_pipe.encode(encoding))),
+                    os.path.join(
+                        os.path.dirname(in_filepath), D_FRAGMENTS.format(
+                            name=os.path.basename(in_filepath))),
+                    str(toolchain(['md2html'])['md2html'].get('version')))
+                if html is None:
+                    notes.append(
+                        'W: incremental HTML export failed, using full.')
+                else:
+                    notes.append('I: HTML sections rendered: {}.'.format(
+                        num_rendered))
+            if html is not None:
+                write_atomic(html_filepath, html.encode(encoding))
+                notes.append('HTML: {}'.format(html_filepath))
+            elif is_valid:
+                ret_code, p_stdout, p_stderr = _exec(
+                    'md2html', args, in_pipe, len(in_pipe.encode(encoding)))
+                if ret_code == 0:
+                    write_atomic(html_filepath, p_stdout.encode(encoding))
+                    notes.append('HTML: {}'.format(html_filepath))
+                else:
+                    is_stale = True
+                    notes.append('E: No HTML was produced.')
+            else:
+                is_stale = True
+                notes.append(
+                    'W: cannot export HTML without `{}`.'.format(args[0]))
+        if os.path.isfile(html_filepath) and not is_stale:
+            outputs['html'] = html_filepath
+
+        # export to PDF
+        if 'pdf' in export:
+            pdf_filepath = os.path.splitext(in_filepath)[0] + '.pdf'
+            in_filepaths = [
+                html_filepath, __file__, toolchain_stamp('html2pdf')] + \
+                [item for item in css if not '://' in item]
+            out_filepaths = [pdf_filepath]
+            local_access_str = '--enable-local-file-access' \
+                if tool_flag('html2pdf', '--enable-local-file-access') else ''
+            is_stale = False
+            if 'html' not in outputs:
+                is_stale = True
+                notes.append('W: cannot export PDF without HTML.')
+            elif check_redo(in_filepaths, out_filepaths, force):
+                # : render to a temporary file, then rename it in place
+                tmp_filepath = temp_filepath(pdf_filepath)
+                args, is_valid = which(TOOLS['html2pdf'].format_map(
+                    dict(vars(), pdf_filepath=tmp_filepath)))
+                if is_valid:
+                    ret_code, p_stdout, p_stderr = _exec(
+                        'html2pdf', args, size=os.path.getsize(html_filepath))
+                    if ret_code == 0 and os.path.isfile(tmp_filepath):
+                        os.replace(tmp_filepath, pdf_filepath)
+                        notes.append('PDF: {}'.format(pdf_filepath))
+                    else:
+                        is_stale = True
+                        notes.append('E: No PDF was produced.')
+                    if os.path.isfile(tmp_filepath):
+                        os.remove(tmp_filepath)
+                else:
+                    is_stale = True
+                    notes.append(
+                        'W: cannot export PDF without `{}`.'.format(args[0]))
+            if os.path.isfile(pdf_filepath) and not is_stale:
+                outputs['pdf'] = pdf_filepath
+
+    # :: collect the submission package
+    if 'zip' in export:
+        zip_filepath = os.path.splitext(in_filepath)[0] + '.zip'
+        members = package_members(
+            result.document, outputs,
+            gen_report(lines, tests).encode(encoding))
+        begin_time = time.time()
+        if write_package(zip_filepath, members, force=force):
+            timings['zip'] = time.time() - begin_time
+            record_timing(
+                'zip', os.path.getsize(zip_filepath), timings['zip'],
+                history_filepath=history_filepath)
+            notes.append('ZIP: {}'.format(zip_filepath))
+        outputs['zip'] = zip_filepath
+    return result._replace(timings=timings, outputs=outputs, notes=notes)
+
+
+# ======================================================================
+def index_bundle(
+        in_filepath,
+        delimiter=None):
+    """
+    Find the byte offsets of the abstracts in a multi-abstract bundle.
+
+    The file is memory-mapped and scanned once, so memory usage does not
+    depend on the size of the bundle.
+
+    Args:
+        in_filepath (str): The bundle filepath.
+        delimiter (str|None): The line separating the abstracts.
+            If None, each top-level header starts a new abstract
+            (any text before the first top-level header is ignored).
+
+    Returns:
+        index (list[tuple[int,int]]): The (start, end) byte offsets.
+            Blank-only segments are not included.
+    """
+    index = []
+    if not os.path.getsize(in_filepath):
+        return index
+    with open(in_filepath, 'rb') as fileobj, \
+            mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        if delimiter is None:
+            starts = [match.start() for match in
+                      _BUNDLE_HDR_PATTERN.finditer(data)]
+            segments = zip(starts, starts[1:] + [len(data)])
+        else:
+            pattern = re.compile(
+                br'^' + re.escape(delimiter.encode('utf-8')) +
+                br'[ \t]*\r?$', re.MULTILINE)
+            starts, ends = [0], []
+            for match in pattern.finditer(data):
+                ends.append(match.start())
+                starts.append(match.end())
+            segments = zip(starts, ends + [len(data)])
+        for start, end in segments:
+            if data[start:end].strip():
+                index.append((start, end))
+    return index
+
+
+# ======================================================================
+def read_bundle_item(
+        in_filepath,
+        start,
+        end,
+        encoding='utf-8'):
+    """
+    Read a single abstract from a multi-abstract bundle.
+
+    Args:
+        in_filepath (str): The bundle filepath.
+        start (int): The start byte offset.
+        end (int): The end byte offset.
+        encoding (str): The encoding to use.
+
+    Returns:
+        text (str): The Markdown text of the abstract.
+    """
+    with open(in_filepath, 'rb') as fileobj, \
+            mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return data[start:end].decode(encoding)
+
+
+# ======================================================================
+def _validate_bundle_item(args):
+    """
+    Validate a single abstract from a bundle (worker function).
+
+    Args:
+        args (tuple): The arguments: (in_filepath, start, end, limits,
+            encoding).
+
+    Returns:
+        result (Result): The validation result, without the `document`.
+            If the abstract cannot be parsed, the exception is returned.
+    """
+    in_filepath, start, end, limits, encoding = args
+    text = read_bundle_item(in_filepath, start, end, encoding)
+    try:
+        result = validate(parse_document(text, in_filepath), limits)
+    except ValueError as e:
+        return e
+    return result._replace(document=None)
+
+
+# ======================================================================
+def validate_bundle(
+        in_filepath,
+        delimiter=None,
+        limits=D_LIMITS,
+        encoding='utf-8',
+        jobs=1,
+        skip=()):
+    """
+    Validate each abstract of a multi-abstract bundle independently.
+
+    Abstracts are read lazily from the memory-mapped bundle, and results
+    are yielded as soon as they are available (in bundle order).
+
+    Args:
+        in_filepath (str): The bundle filepath.
+        delimiter (str|None): The line separating the abstracts.
+            See `index_bundle()` for more details.
+        limits (dict|str): Limits or rules to be used for testing.
+        encoding (str): The encoding to use.
+        jobs (int): The number of parallel worker processes.
+            If 1, everything runs in the current process.
+        skip (Container[int]): The positions of the abstracts not to
+            validate (their result is None).
+
+    Yields:
+        index (int): The position of the abstract within the bundle.
+        offsets (tuple[int,int]): The (start, end) byte offsets.
+        result (Result|ValueError|None): The validation result (without the
+            `document`) or the parsing error.
+    """
+    offsets = index_bundle(in_filepath, delimiter)
+    items = [
+        (in_filepath, start, end, limits, encoding)
+        for i, (start, end) in enumerate(offsets) if i not in skip]
+    if jobs > 1 and items:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            results = executor.map(
+                _validate_bundle_item, items,
+                chunksize=max(1, len(items) // (jobs * 4)))
+            for i, offset in enumerate(offsets):
+                yield i, offset, None if i in skip else next(results)
+    else:
+        results = map(_validate_bundle_item, items)
+        for i, offset in enumerate(offsets):
+            yield i, offset, None if i in skip else next(results)
+
+
+# ======================================================================
+def item_filepath(
+        out_filepath,
+        index,
+        out_fmt=D_BUNDLE_FMT):
+    """
+    Determine the output filepath of a single abstract of a batch.
+
+    Args:
+        out_filepath (str|None): The output filepath of the batch.
+        index (int): The position of the abstract within the batch.
+        out_fmt (str): The output filename format.
+            Accepted fields are: `in_basename` (of `out_filepath`), `index`.
+
+    Returns:
+        out_filepath (str|None): The output filepath of the abstract.
+            If `out_filepath` is None, returns None.
+
+    Examples:
+        >>> item_filepath('submit.md', 1)
+        'submit.001.md'
+        >>> item_filepath('/out/submit.md', 12)
+        '/out/submit.012.md'
+        >>> item_filepath(None, 1) is None
+        True
+    """
+    if not out_filepath:
+        return None
+    dirpath, filename = os.path.split(out_filepath)
+    in_basename = os.path.splitext(filename)[0]
+    return os.path.join(dirpath, out_fmt.format_map(vars()))
+
+
+# ======================================================================
+def extract_bundle_item(
+        in_filepath,
+        index,
+        start,
+        end,
+        out_fmt=D_BUNDLE_FMT,
+        encoding='utf-8'):
+    """
+    Extract a single abstract from a bundle into its own file.
+
+    The file is written next to the bundle, so that relative figure paths
+    remain valid. It is only rewritten if the content has changed.
+
+    Args:
+        in_filepath (str): The bundle filepath.
+        index (int): The position of the abstract within the bundle.
+        start (int): The start byte offset.
+        end (int): The end byte offset.
+        out_fmt (str): The output filename format.
+            Accepted fields are: `in_basename`, `index`.
+        encoding (str): The encoding to use.
+
+    Returns:
+        out_filepath (str): The extracted abstract filepath.
+    """
+    in_dirpath, in_filename = os.path.split(os.path.realpath(in_filepath))
+    in_basename = os.path.splitext(in_filename)[0]
+    out_filepath = os.path.join(in_dirpath, out_fmt.format_map(vars()))
+    text = read_bundle_item(in_filepath, start, end, encoding)
+    stream = text.encode(encoding)
+    is_current = os.path.isfile(out_filepath) \
+        and os.path.getsize(out_filepath) == len(stream)
+    if is_current:
+        with open(out_filepath, 'rb') as file_obj:
+            is_current = file_obj.read() == stream
+    if not is_current:
+        write_atomic(out_filepath, stream)
+    return out_filepath
+
+
+# ======================================================================
+def git_blobs(
+        dirpath,
+        names):
+    """
+    Stream the content of git objects through a single `git cat-file`.
+
+    Args:
+        dirpath (str): A directory within the git working tree.
+        names (Iterable[str]): The object names, e.g. `<commit>:<path>`.
+
+    Yields:
+        name (str): The object name.
+        sha (str|None): The object hash. None if the object is missing.
+        data (bytes|None): The object content. None if the object is missing.
+
+    Raises:
+        IOError: If `git` is not available.
+    """
+    args, is_valid = which(['git', '-C', dirpath, 'cat-file', '--batch'])
+    if not is_valid:
+        raise IOError('`{}` not found.'.format(args[0]))
+    proc = subprocess.Popen(
+        args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        for name in names:
+            proc.stdin.write(name.encode('utf-8') + b'\n')
+            proc.stdin.flush()
+            header = proc.stdout.readline().decode('utf-8').split()
+            if len(header) == 3:
+                sha, size = header[0], int(header[2])
+                data = proc.stdout.read(size)
+                proc.stdout.read(1)  # trailing newline
+                yield name, sha, data
+            else:
+                yield name, None, None
+    finally:
+        proc.stdin.close()
+        proc.stdout.close()
+        proc.wait()
+
+
+# ======================================================================
+def _load_json(filepath, default):
+    """
+    Load a JSON file, falling back to a default on any error.
+
+    Args:
+        filepath (str): The JSON filepath.
+        default (Any): The value to return if the file cannot be loaded.
+
+    Returns:
+        obj (Any): The loaded object.
+    """
+    try:
+        with open(filepath, 'rb') as fileobj:
+            return json.loads(fileobj.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return default
+
+
+# ======================================================================
+def _save_json(filepath, obj):
+    """
+    Save an object to a JSON file atomically (temp file plus rename).
+
+    Args:
+        filepath (str): The JSON filepath.
+        obj (Any): The object to save.
+
+    Returns:
+        None.
+    """
+    try:
+        dirpath = os.path.dirname(filepath)
+        if dirpath and not os.path.isdir(dirpath):
+            os.makedirs(dirpath)
+        write_atomic(filepath, json.dumps(obj).encode('utf-8'))
+    except (IOError, OSError):
+        pass
+
+
+# ======================================================================
+def word_count_history(
+        in_filepath,
+        revisions=None,
+        last=None,
+        cache_filepath=D_WC_CACHE_FILEPATH,
+        encoding='utf-8'):
+    """
+    Calculate the word count of each section across git revisions.
+
+    All revisions are read through a single `git cat-file --batch` process
+    and word counts are cached by blob hash, so that only new revisions
+    need to be fetched and counted.
+
+    Args:
+        in_filepath (str): The abstract filepath (or its directory).
+        revisions (Iterable[str]|None): The revisions to inspect.
+            If None, all commits touching the file are used, oldest first.
+        last (int|None): Only include the most recent revisions.
+        cache_filepath (str|None): The word count cache filepath.
+            If None, no cache is used.
+        encoding (str): The encoding to use.
+
+    Returns:
+        history (list[dict]): The word counts for each revision.
+            Each dict contains:
+                - 'rev': the revision as given (or the commit hash).
+                - 'time': the commit timestamp (None if not known).
+                - 'blob': the blob hash (None if missing in the revision).
+                - 'sections': list of (title, num_words, skip) tuples.
+                - 'wc_partial': the partial number of words.
+
+    Raises:
+        IOError: If the file is not within a git working tree, or its git
+            history cannot be read.
+    """
+    in_filepath = resolve_input(in_filepath)
+    dirpath = os.path.dirname(in_filepath)
+    ret_code, top_dirpath, _ = execute(
+        ['git', '-C', dirpath, 'rev-parse', '--show-toplevel'],
+        verbose=VERB_LVL['none'])
+    if ret_code != 0:
+        raise IOError('`{}` is not in a git working tree.'.format(dirpath))
+    rel_filepath = os.path.relpath(
+        in_filepath, os.path.realpath(top_dirpath.strip()))
+    rel_filepath = rel_filepath.replace(os.sep, '/')
+
+    times = {}
+    if revisions is None:
+        ret_code, p_stdout, _ = execute(
+            ['git', '-C', dirpath, 'log', '--format=%H %ct', '--',
+             in_filepath], verbose=VERB_LVL['none'])
+        if ret_code != 0:
+            raise IOError('Cannot read the git history of `{}`.'.format(
+                in_filepath))
+        for line in reversed(p_stdout.splitlines()):
+            commit, timestamp = line.split()
+            times[commit] = int(timestamp)
+        revisions = list(times.keys())
+    revisions = list(revisions)[-last:] if last else list(revisions)
+
+    cache = _load_json(cache_filepath, {}) if cache_filepath else {}
+    blobs = cache.setdefault('blobs', {})
+    revs = cache.setdefault('revs', {})
+    names = ['{}:{}'.format(rev, rel_filepath) for rev in revisions]
+    # only fully-qualified commits map to a fixed blob
+    todo = [
+        name for rev, name in zip(revisions, names)
+        if name not in revs or rev not in times]
+    for name, sha, data in git_blobs(dirpath, todo):
+        revs[name] = sha
+        if sha and sha not in blobs:
+            blocks, wc_partial, wc_total = word_count_text(
+                data.decode(encoding), skip_sections=D_SKIP_SECTIONS)
+            blobs[sha] = [
+                (block['title'], block['num_words'], block['skip'])
+                for block in blocks]
+    if cache_filepath and todo:
+        _save_json(cache_filepath, cache)
+
+    history = []
+    for rev, name in zip(revisions, names):
+        sha = revs.get(name)
+        sections = [tuple(item) for item in blobs.get(sha, [])]
+        history.append(dict(
+            rev=rev, time=times.get(rev), blob=sha, sections=sections,
+            wc_partial=sum(n for title, n, skip in sections if not skip)))
+    return history
+
+
+# ======================================================================
+def word_count_diff(
+        in_filepath,
+        rev_a,
+        rev_b,
+        cache_filepath=D_WC_CACHE_FILEPATH,
+        encoding='utf-8'):
+    """
+    Compare the word count of each section between two git revisions.
+
+    Args:
+        in_filepath (str): The abstract filepath (or its directory).
+        rev_a (str): The first revision.
+        rev_b (str): The second revision.
+        cache_filepath (str|None): The word count cache filepath.
+        encoding (str): The encoding to use.
+
+    Returns:
+        diff (list[tuple]): The (title, num_words_a, num_words_b) tuples.
+            Sections missing in one revision have None as word count.
+            Sections are in the order of `rev_b` then `rev_a`.
+    """
+    history = word_count_history(
+        in_filepath, [rev_a, rev_b], cache_filepath=cache_filepath,
+        encoding=encoding)
+    counts_a, counts_b = [
+        collections.OrderedDict(
+            (title, n) for title, n, skip in item['sections'])
+        for item in history]
+    titles = list(counts_b.keys()) + [
+        title for title in counts_a.keys() if title not in counts_b]
+    return [
+        (title, counts_a.get(title), counts_b.get(title))
+        for title in titles]
+
+
+# ======================================================================
+def print_word_count_history(
+        in_filepath,
+        last=None,
+        encoding='utf-8',
+        verbose=D_VERB_LVL):
+    """
+    Display the word count of each section across git revisions.
+
+    Args:
+        in_filepath (str): The abstract filepath (or its directory).
+        last (int|None): Only include the most recent revisions.
+        encoding (str): The encoding to use.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        history (list[dict]): The output of `word_count_history()`.
+    """
+    history = word_count_history(in_filepath, last=last, encoding=encoding)
+    titles = []
+    for item in history:
+        for title, n, skip in item['sections']:
+            if title not in titles:
+                titles.append(title)
+    msg(': {:<16s} {:<8s} {:>6s} {}'.format(
+        'Date', 'Commit', GLIPH, ' '.join(
+            '{:>6.6s}'.format(title) for title in titles)),
+        verbose, fmtt='{t.bold}{t.blue}')
+    for item in history:
+        counts = dict((title, n) for title, n, skip in item['sections'])
+        date = datetime.datetime.fromtimestamp(item['time']).strftime(
+            '%Y-%m-%d %H:%M') if item['time'] else ''
+        msg('  {:<16s} {:<8.8s} {:>6d} {}'.format(
+            date, item['rev'], item['wc_partial'], ' '.join(
+                '{:>6}'.format(counts.get(title, '-')) for title in titles)),
+            verbose)
+    return history
+
+
+# ======================================================================
+def print_word_count_diff(
+        in_filepath,
+        rev_a,
+        rev_b,
+        encoding='utf-8',
+        verbose=D_VERB_LVL):
+    """
+    Display the word count differences between two git revisions.
+
+    Args:
+        in_filepath (str): The abstract filepath (or its directory).
+        rev_a (str): The first revision.
+        rev_b (str): The second revision.
+        encoding (str): The encoding to use.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        diff (list[tuple]): The output of `word_count_diff()`.
+    """
+    diff = word_count_diff(in_filepath, rev_a, rev_b, encoding=encoding)
+    msg(': {:<48s} {:>8.8s} {:>8.8s} {:>8s}'.format(
+        'Section', rev_a, rev_b, 'Delta'), verbose, fmtt='{t.bold}{t.blue}')
+    for title, n_a, n_b in diff:
+        delta = (n_b or 0) - (n_a or 0)
+        msg('{}: {:<48.48s} {:>8} {:>8} {:>+8d}'.format(
+            'I' if delta < 0 else 'W' if delta > 0 else GLIPH, title,
+            '-' if n_a is None else n_a, '-' if n_b is None else n_b, delta),
+            verbose)
+    return diff
+
+
+# ======================================================================
+def corpus_filepaths(in_filepath):
+    """
+    Find the abstracts of a corpus.
+
+    Fixed versions (see `fix_filepath()`) and hidden files are ignored.
+
+    Args:
+        in_filepath (str): The corpus directory (searched recursively)
+            or a single abstract filepath.
+
+    Returns:
+        filepaths (list[str]): The sorted abstract filepaths.
+    """
+    if os.path.isfile(in_filepath):
+        return [os.path.realpath(in_filepath)]
+    filepaths = []
+    for dirpath, dirnames, filenames in os.walk(in_filepath):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        filepaths.extend(
+            os.path.realpath(os.path.join(dirpath, filename))
+            for filename in filenames
+            if filename.endswith('.md') and not filename.startswith(
+                ('.', 'fix_')))
+    return sorted(filepaths)
+
+
+# ======================================================================
+def _corpus_item(args):
+    """
+    Extract the analytics of a single abstract (worker function).
+
+    Args:
+        args (tuple): The arguments: (in_filepath, encoding).
+
+    Returns:
+        item (tuple|None): The extracted values: (wc_partial, wc_total,
+            sections, fig_sizes), where `sections` is a list of
+            (title, num_words, skip) and `fig_sizes` a list of sizes in
+            bytes (-1 if not found).
+            If the abstract cannot be read, returns None.
+    """
+    in_filepath, encoding = args
+    try:
+        with open(in_filepath, 'rb') as fileobj:
+            text = fileobj.read().decode(encoding)
+    except (IOError, OSError, UnicodeDecodeError):
+        return None
+    blocks, wc_partial, wc_total = word_count_text(
+        text, skip_sections=D_SKIP_SECTIONS)
+    sections = [
+        ('Title' if i == 0
+         else 'Figure' if block['title'].startswith('Figure')
+         else block['title'].strip(), block['num_words'], block['skip'])
+        for i, block in enumerate(blocks)]
+    dirpath = os.path.dirname(in_filepath)
+    fig_sizes = []
+    for fig in find_figures_text(text):
+        fig_filepath = os.path.join(dirpath, os.path.expanduser(fig))
+        fig_sizes.append(
+            os.path.getsize(fig_filepath) if os.path.isfile(fig_filepath)
+            else -1)
+    return wc_partial, wc_total, sections, fig_sizes
+
+
+# ======================================================================
+def corpus_analytics(
+        in_filepaths,
+        encoding='utf-8',
+        jobs=1):
+    """
+    Extract word counts and figures from a corpus into columnar arrays.
+
+    Each abstract is processed independently (in parallel, if requested).
+    Per-section and per-figure values are stored as flat arrays, together
+    with the index of the abstract they belong to.
+
+    Requires NumPy.
+
+    Args:
+        in_filepaths (Sequence[str]): The abstract filepaths.
+        encoding (str): The encoding to use.
+        jobs (int): The number of parallel worker processes.
+            If 1, everything runs in the current process.
+
+    Returns:
+        columns (dict[str,np.ndarray]): The corpus columns:
+            - 'filepath': the abstract filepaths.
+            - 'wc_partial', 'wc_total': the word counts (see
+              `word_count_text()`).
+            - 'wc_synopsis': the synopsis word count (-1 if missing).
+            - 'n_figs', 'n_captions': the number of figures and captions.
+            - 'titles': the distinct section titles (the first section
+              is labeled as 'Title' and figure captions as 'Figure').
+            - 'sec_abstract', 'sec_title', 'sec_wc', 'sec_skip': the index
+              of the abstract, the index of the title, the word count and
+              the skip flag of each section.
+            - 'fig_abstract', 'fig_size': the index of the abstract and the
+              size in bytes (-1 if not found) of each figure.
+            Abstracts that cannot be read are not included.
+    """
+    import numpy as np
+
+    items = [(in_filepath, encoding) for in_filepath in in_filepaths]
+    if jobs > 1:
+        with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+            results = list(executor.map(
+                _corpus_item, items,
+                chunksize=max(1, len(items) // (jobs * 4))))
+    else:
+        results = [_corpus_item(item) for item in items]
+
+    filepaths, wc_partials, wc_totals = [], [], []
+    sec_abstract, sec_titles, sec_wc, sec_skip = [], [], [], []
+    fig_abstract, fig_size = [], []
+    for (in_filepath, _), result in zip(items, results):
+        if result is None:
+            continue
+        i = len(filepaths)
+        wc_partial, wc_total, sections, fig_sizes = result
+        filepaths.append(in_filepath)
+        wc_partials.append(wc_partial)
+        wc_totals.append(wc_total)
+        for title, num_words, skip in sections:
+            sec_abstract.append(i)
+            sec_titles.append(title)
+            sec_wc.append(num_words)
+            sec_skip.append(skip)
+        fig_abstract.extend([i] * len(fig_sizes))
+        fig_size.extend(fig_sizes)
+
+    n = len(filepaths)
+    titles, sec_title = np.unique(
+        np.array(sec_titles, dtype=str), return_inverse=True)
+    sec_abstract = np.array(sec_abstract, dtype=np.int64)
+    sec_wc = np.array(sec_wc, dtype=np.int64)
+    sec_title = sec_title.astype(np.int64).ravel()
+    fig_abstract = np.array(fig_abstract, dtype=np.int64)
+    # : per-abstract aggregates of the sections
+    wc_synopsis = np.full(n, -1, dtype=np.int64)
+    sec_labels = titles[sec_title]
+    is_synopsis = sec_labels == 'Synopsis'
+    wc_synopsis[sec_abstract[is_synopsis]] = sec_wc[is_synopsis]
+    is_caption = sec_labels == 'Figure'
+    n_captions = np.bincount(
+        sec_abstract[is_caption & (sec_wc > 0)], minlength=n)
+    return dict(
+        filepath=np.array(filepaths, dtype=str),
+        wc_partial=np.array(wc_partials, dtype=np.int64),
+        wc_total=np.array(wc_totals, dtype=np.int64),
+        wc_synopsis=wc_synopsis,
+        n_figs=np.bincount(fig_abstract, minlength=n),
+        n_captions=n_captions,
+        titles=titles,
+        sec_abstract=sec_abstract,
+        sec_title=sec_title,
+        sec_wc=sec_wc,
+        sec_skip=np.array(sec_skip, dtype=bool),
+        fig_abstract=fig_abstract,
+        fig_size=np.array(fig_size, dtype=np.int64))
+
+
+# ======================================================================
+def corpus_stats(
+        columns,
+        limits=D_LIMITS,
+        percentiles=D_PERCENTILES,
+        bins=D_USAGE_BINS):
+    """
+    Compute the statistics of a corpus against the submission limits.
+
+    All statistics are computed with vectorized operations over the
+    columns, as obtained from `corpus_analytics()`.
+
+    Requires NumPy.
+
+    Args:
+        columns (dict[str,np.ndarray]): The corpus columns.
+        limits (dict): Limits to be used for testing.
+        percentiles (Sequence[float]): The percentiles to compute.
+        bins (Sequence[float]): The edges of the limit usage histograms,
+            as fractions of the limit.
+
+    Returns:
+        stats (dict): The corpus statistics:
+            - 'num': the number of abstracts.
+            - 'metrics': a list of (label, limit, values, usage_hist) where
+              `values` are the percentiles and `usage_hist` the histogram
+              of the fractions of the limit used.
+            - 'sections': a list of (title, num, values, share) for each
+              section title (most frequent first), where `num` is the
+              number of abstracts with the section, `values` the word
+              count percentiles and `share` the mean fraction of the
+              counted words of the abstract.
+
+    Examples:
+        >>> import numpy as np
+        >>> columns = dict(
+        ...     wc_partial=np.array([700, 800]), wc_total=np.array([900, 950]),
+        ...     wc_synopsis=np.array([90, -1]), n_figs=np.array([2, 5]),
+        ...     n_captions=np.array([2, 5]),
+        ...     titles=np.array(['Figure', 'Methods']),
+        ...     sec_abstract=np.array([0, 0, 1]),
+        ...     sec_title=np.array([0, 1, 1]),
+        ...     sec_wc=np.array([60, 350, 400]),
+        ...     sec_skip=np.array([True, False, False]),
+        ...     fig_abstract=np.array([0, 1]), fig_size=np.array([1e5, 3e6]))
+        >>> stats = corpus_stats(columns, percentiles=(50,), bins=(0, 1, 2))
+        >>> stats['num']
+        2
+        >>> [(label, values.tolist(), hist.tolist())
+        ...  for label, limit, values, hist in stats['metrics'][:2]]
+        [('Word Count Total', [750.0], [1, 1]), ('Synopsis', [90.0], [1, 0])]
+        >>> [(title, num, values.tolist(), round(share, 3))
+        ...  for title, num, values, share in stats['sections']]
+        [('Methods', 2, [375.0], 0.5), ('Figure', 1, [60.0], 0.0)]
+    """
+    import numpy as np
+
+    n = len(columns['wc_partial'])
+    sec_abstract = columns['sec_abstract']
+    sec_title = columns['sec_title']
+    sec_wc = columns['sec_wc']
+    caption_title = np.flatnonzero(columns['titles'] == 'Figure')
+    is_caption = np.isin(sec_title, caption_title) & (sec_wc > 0)
+    fig_size = columns['fig_size']
+
+    metrics = []
+    for label, values, limit in (
+            ('Word Count Total', columns['wc_partial'], limits['wc_tot']),
+            ('Synopsis', columns['wc_synopsis'][columns['wc_synopsis'] >= 0],
+             limits['wc_synopsis']),
+            ('Figure Captions', sec_wc[is_caption], limits['wc_fig']),
+            ('Number of Figures', columns['n_figs'], limits['n_figs']),
+            ('Figure Size', fig_size[fig_size >= 0], limits['fig_size'])):
+        values = np.asarray(values, dtype=float)
+        if values.size:
+            metrics.append((
+                label, limit, np.percentile(values, percentiles),
+                np.histogram(
+                    np.clip(values / limit, bins[0], bins[-1]), bins)[0]))
+        else:
+            metrics.append((
+                label, limit, np.full(len(percentiles), np.nan),
+                np.zeros(len(bins) - 1, dtype=np.int64)))
+
+    # : per-section percentiles, with sections grouped by sorting
+    sections = []
+    wc_partial = columns['wc_partial'][sec_abstract].astype(float)
+    share = np.where(
+        columns['sec_skip'] | (wc_partial == 0), 0.0,
+        sec_wc / np.maximum(wc_partial, 1))
+    order = np.argsort(sec_title, kind='stable')
+    groups = np.split(
+        order, np.flatnonzero(np.diff(sec_title[order])) + 1) \
+        if order.size else []
+    for group in groups:
+        sections.append((
+            str(columns['titles'][sec_title[group[0]]]),
+            len(np.unique(sec_abstract[group])),
+            np.percentile(sec_wc[group], percentiles),
+            float(np.mean(share[group]))))
+    sections.sort(key=lambda item: (-item[1], -item[3], item[0]))
+    return dict(num=n, metrics=metrics, sections=sections)
+
+
+# ======================================================================
+def save_corpus(
+        out_filepath,
+        columns):
+    """
+    Save the corpus columns to a compressed NumPy `.npz` file.
+
+    Requires NumPy.
+
+    Args:
+        out_filepath (str): The output filepath.
+        columns (dict[str,np.ndarray]): The corpus columns.
+
+    Returns:
+        None.
+    """
+    import numpy as np
+
+    tmp_filepath = temp_filepath(out_filepath)
+    with open(tmp_filepath, 'wb') as fileobj:
+        np.savez_compressed(fileobj, **columns)
+    os.replace(tmp_filepath, out_filepath)
+
+
+# ======================================================================
+def load_corpus(in_filepath):
+    """
+    Load the corpus columns from a NumPy `.npz` file.
+
+    Requires NumPy.
+
+    Args:
+        in_filepath (str): The input filepath.
+
+    Returns:
+        columns (dict[str,np.ndarray]): The corpus columns.
+    """
+    import numpy as np
+
+    with np.load(in_filepath, allow_pickle=False) as data:
+        return dict((key, data[key]) for key in data.files)
+
+
+# ======================================================================
+def print_corpus_stats(
+        in_filepath,
+        out_filepath=None,
+        limits=D_LIMITS,
+        encoding='utf-8',
+        jobs=1,
+        verbose=D_VERB_LVL):
+    """
+    Display the statistics of a corpus of abstracts.
+
+    Sections found in less than `D_CORPUS_MIN_SHARE` of the abstracts are
+    not displayed.
+
+    Requires NumPy.
+
+    Args:
+        in_filepath (str): The corpus directory, an abstract filepath or
+            a `.npz` file previously saved with `save_corpus()`.
+        out_filepath (str|None): The `.npz` filepath to save the columns to.
+        limits (dict): Limits to be used for testing.
+        encoding (str): The encoding to use.
+        jobs (int): The number of parallel worker processes.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        stats (dict): The output of `corpus_stats()`.
+    """
+    begin_time = time.time()
+    if in_filepath.endswith('.npz') and os.path.isfile(in_filepath):
+        columns = load_corpus(in_filepath)
+    else:
+        columns = corpus_analytics(
+            corpus_filepaths(in_filepath), encoding, jobs)
+    if out_filepath:
+        save_corpus(out_filepath, columns)
+        msg('Output: {}'.format(out_filepath), verbose)
+    stats = corpus_stats(columns, limits)
+    msg('Corpus: {} ({} abstracts, {:.2f} s)'.format(
+        in_filepath, stats['num'], time.time() - begin_time), verbose)
+
+    msg(': {:<20s} {:>9s} {}'.format(
+        'Metric', 'Limit', ' '.join(
+            '{:>8s}'.format('P{:g}'.format(p)) for p in D_PERCENTILES)),
+        verbose, fmtt='{t.bold}{t.blue}')
+    for label, limit, values, hist in stats['metrics']:
+        msg('  {:<20s} {:>9g} {}'.format(label, limit, ' '.join(
+            '{:>8.0f}'.format(value) for value in values)), verbose)
+
+    msg(': {:<20s} {}'.format('Limit usage', ' '.join(
+        '{:>5s}'.format('<{:g}%'.format(100 * edge))
+        for edge in D_USAGE_BINS[1:-1]) + '  >{:g}%'.format(
+        100 * D_USAGE_BINS[-2])), verbose, fmtt='{t.bold}{t.blue}')
+    for label, limit, values, hist in stats['metrics']:
+        msg('  {:<20s} {}'.format(label, ' '.join(
+            '{:>5d}'.format(count) for count in hist)), verbose)
+
+    msg(': {:<32s} {:>6s} {:>6s} {:>6s} {:>6s}'.format(
+        'Section', 'Num', 'P50', 'P95', GLIPH + '%'),
+        verbose, fmtt='{t.bold}{t.blue}')
+    for title, num, values, share in stats['sections']:
+        if num < stats['num'] * D_CORPUS_MIN_SHARE:
+            continue
+        msg('  {:<32.32s} {:>6d} {:>6.0f} {:>6.0f} {:>6.1f}'.format(
+            title, num, values[D_PERCENTILES.index(50)],
+            values[D_PERCENTILES.index(95)], 100 * share), verbose)
+    return stats
+
+
+# ======================================================================
+def shingles(
+        text,
+        size=D_SHINGLE_SIZE):
+    """
+    Compute the hashes of the word shingles (n-grams) of a text.
+
+    Words are compared case-insensitively, ignoring punctuation.
+
+    Requires NumPy.
+
+    Args:
+        text (str): The input text.
+        size (int): The number of words in each shingle.
+            Texts shorter than this produce a single shingle.
+
+    Returns:
+        hashes (np.ndarray[uint64]): The distinct shingle hashes.
+
+    Examples:
+        >>> len(shingles('The quick brown fox jumps over', 5))
+        2
+        >>> len(shingles('The quick, brown fox!', 5))
+        1
+        >>> list(shingles('A b c d e', 5)) == list(shingles('a B c. d e', 5))
+        True
+    """
+    import numpy as np
+
+    words = re.findall(r'\w+', text.lower())
+    grams = [
+        ' '.join(words[i:i + size])
+        for i in range(max(1, len(words) - size + 1))] if words else []
+    return np.unique(np.array(
+        [zlib.crc32(gram.encode('utf-8')) for gram in grams],
+        dtype=np.uint64))
+
+
+# ======================================================================
+def minhash(
+        hashes,
+        num_perm=D_MINHASH_PERM,
+        seed=_MINHASH_SEED):
+    """
+    Compute the MinHash signature of a set of hashes.
+
+    Each permutation is approximated by a multiply-shift hash function.
+    The fraction of equal values between two signatures estimates the
+    Jaccard similarity of the underlying sets.
+
+    Requires NumPy.
+
+    Args:
+        hashes (np.ndarray[uint64]): The set elements hashes.
+        num_perm (int): The number of permutations (signature length).
+        seed (int): The seed for the hash functions.
+
+    Returns:
+        signature (np.ndarray[uint32]): The signature.
+            For an empty set, all values are the max.
+
+    Examples:
+        >>> import numpy as np
+        >>> a = minhash(np.arange(100, dtype=np.uint64))
+        >>> b = minhash(np.arange(50, 150, dtype=np.uint64))
+        >>> bool(0.2 < np.mean(a == b) < 0.5)
+        True
+    """
+    import numpy as np
+
+    rng = np.random.RandomState(seed)
+    mult = rng.randint(0, 2 ** 32, (2, num_perm), dtype=np.uint64)
+    mult = (mult[0] << np.uint64(32) | mult[1]) | np.uint64(1)
+    add = rng.randint(0, 2 ** 32, num_perm, dtype=np.uint64) << np.uint64(32)
+    if not len(hashes):
+        return np.full(num_perm, 0xFFFFFFFF, dtype=np.uint32)
+    values = (hashes[:, None] * mult + add) >> np.uint64(32)
+    return values.min(axis=0).astype(np.uint32)
+
+
+# ======================================================================
+def section_signatures(
+        document,
+        num_perm=D_MINHASH_PERM,
+        shingle_size=D_SHINGLE_SIZE,
+        cache=None):
+    """
+    Compute the MinHash signatures of the counted sections of a document.
+
+    Sections skipped from the word count (see `D_SKIP_SECTIONS`) and empty
+    sections are ignored.
+
+    Requires NumPy.
+
+    Args:
+        document (Document): The parsed document.
+        num_perm (int): The number of permutations (signature length).
+        shingle_size (int): The number of words in each shingle.
+        cache (dict|None): The signatures cache (by section hash).
+            It is updated in place with the new signatures.
+
+    Returns:
+        signatures (list[tuple[str,np.ndarray]]): The (title, signature)
+            of each counted section.
+    """
+    import numpy as np
+
+    signatures = []
+    for block in document.blocks:
+        if block['skip'] or not block['num_words']:
+            continue
+        text = '\n'.join(block['text'])
+        key = hashlib.sha1('{}:{}:{}\n{}'.format(
+            num_perm, shingle_size, _MINHASH_SEED, text).encode(
+            'utf-8')).hexdigest()
+        if cache is not None and key in cache:
+            signature = np.frombuffer(
+                bytes.fromhex(cache.pop(key)), dtype=np.uint32)
+        else:
+            signature = minhash(shingles(text, shingle_size), num_perm)
+        if cache is not None:
+            # : re-insert so that recently used signatures are kept last
+            cache[key] = signature.tobytes().hex()
+        signatures.append((block['title'], signature))
+    return signatures
+
+
+# ======================================================================
+def lsh_rows(
+        threshold,
+        num_perm=D_MINHASH_PERM,
+        recall=D_LSH_RECALL):
+    """
+    Determine the number of rows per band for locality-sensitive hashing.
+
+    The largest number of rows (i.e. the fewest candidate pairs) is chosen,
+    such that pairs at the threshold similarity share at least one band
+    with the requested probability.
+
+    Args:
+        threshold (float): The min Jaccard similarity to detect.
+        num_perm (int): The signature length.
+        recall (float): The min detection probability at the threshold.
+
+    Returns:
+        rows (int): The number of rows per band.
+            The number of bands is `num_perm // rows`.
+
+    Examples:
+        >>> [lsh_rows(threshold) for threshold in (0.3, 0.5, 0.8)]
+        [2, 3, 7]
+    """
+    for rows in range(num_perm, 1, -1):
+        if 1 - (1 - threshold ** rows) ** (num_perm // rows) >= recall:
+            return rows
+    return 1
+
+
+# ======================================================================
+def find_duplicates(
+        in_filepaths,
+        threshold=D_DUP_THRESHOLD,
+        num_perm=D_MINHASH_PERM,
+        rows=None,
+        cache_filepath=D_MINHASH_CACHE_FILEPATH,
+        encoding='utf-8'):
+    """
+    Find near-duplicate abstracts using MinHash and locality-sensitive hashing.
+
+    Each abstract is summarized by the MinHash signature of its counted
+    sections.
+    Signatures are split into bands, and only abstracts sharing at least
+    one band are compared, so that the cost grows about linearly with the
+    number of abstracts.
+    For the pairs above the threshold, the overlapping sections are found
+    by comparing the section signatures.
+
+    Requires NumPy.
+
+    Args:
+        in_filepaths (Sequence[str]): The abstract filepaths.
+        threshold (float): The min estimated Jaccard similarity.
+        num_perm (int): The number of permutations (signature length).
+        rows (int|None): The number of signature rows per LSH band.
+            Fewer rows find more candidates with lower similarity.
+            If None, it is determined from the threshold (see `lsh_rows()`).
+        cache_filepath (str|None): The section signatures cache filepath.
+            If None, signatures are not cached.
+        encoding (str): The encoding to use.
+
+    Returns:
+        duplicates (list[tuple]): The (i, j, similarity, sections) of each
+            pair of similar abstracts, most similar first, where `i` and
+            `j` are indexes in `in_filepaths` and `sections` lists the
+            (title_i, title_j, similarity) of the overlapping sections.
+            Abstracts that cannot be read or parsed are ignored.
+    """
+    import numpy as np
+
+    if rows is None:
+        rows = lsh_rows(threshold, num_perm)
+    cache = _load_json(cache_filepath, {}) if cache_filepath else None
+
+    sections = {}
+    for i, in_filepath in enumerate(in_filepaths):
+        try:
+            document = load_document(in_filepath, encoding)
+        except (IOError, UnicodeDecodeError):
+            continue
+        sections[i] = section_signatures(document, num_perm, cache=cache)
+
+    # : the signature of the union of the sections is their minimum
+    buckets = collections.defaultdict(list)
+    signatures = {}
+    for i, items in sections.items():
+        if not items:
+            continue
+        signatures[i] = np.min([signature for _, signature in items], axis=0)
+        for band in range(num_perm // rows):
+            buckets[band, signatures[i][
+                band * rows:(band + 1) * rows].tobytes()].append(i)
+    candidates = set()
+    for bucket in buckets.values():
+        candidates.update(itertools.combinations(bucket, 2))
+
+    duplicates = []
+    for i, j in sorted(candidates):
+        similarity = float(np.mean(signatures[i] == signatures[j]))
+        if similarity >= threshold:
+            overlaps = [
+                (title_i, title_j, float(np.mean(sig_i == sig_j)))
+                for title_i, sig_i in sections[i]
+                for title_j, sig_j in sections[j]]
+            duplicates.append((i, j, similarity, sorted(
+                [item for item in overlaps if item[2] >= threshold],
+                key=lambda item: -item[2])))
+    duplicates.sort(key=lambda item: (-item[2], item[0], item[1]))
+
+    if cache_filepath:
+        if len(cache) > _MINHASH_CACHE_MAX:
+            cache = dict(list(cache.items())[-_MINHASH_CACHE_MAX:])
+        _save_json(cache_filepath, cache)
+    return duplicates
+
+
+# ======================================================================
+def print_duplicates(
+        in_filepath,
+        threshold=D_DUP_THRESHOLD,
+        encoding='utf-8',
+        verbose=D_VERB_LVL):
+    """
+    Display the near-duplicate abstracts of a corpus.
+
+    Requires NumPy.
+
+    Args:
+        in_filepath (str): The corpus directory or an abstract filepath.
+        threshold (float): The min estimated Jaccard similarity.
+        encoding (str): The encoding to use.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        duplicates (list[tuple]): The output of `find_duplicates()`.
+    """
+    begin_time = time.time()
+    filepaths = corpus_filepaths(in_filepath)
+    duplicates = find_duplicates(filepaths, threshold, encoding=encoding)
+    msg('Corpus: {} ({} abstracts, {:.2f} s)'.format(
+        in_filepath, len(filepaths), time.time() - begin_time), verbose)
+    dirpath = in_filepath if os.path.isdir(in_filepath) else None
+    for i, j, similarity, overlaps in duplicates:
+        names = [
+            os.path.relpath(filepaths[k], dirpath) if dirpath
+            else filepaths[k] for k in (i, j)]
+        msg('W: {:>5.0%}  {}  ~  {}'.format(similarity, *names), verbose,
+            fmtt='{t.bold}')
+        for title_i, title_j, sim in overlaps:
+            msg('   {:>5.0%}  {}  ~  {}'.format(sim, title_i, title_j),
+                verbose)
+    msg('Similar pairs: {}'.format(len(duplicates)), verbose,
+        fmtt='{t.bold}')
+    return duplicates
+
+
+# ======================================================================
+def journal_hash(
+        text,
+        filepaths=(),
+        options=None):
+    """
+    Compute the input hash of a batch stage, for the checkpoint journal.
+
+    Files are included through their size and modification time (not their
+    content), so that large inputs (e.g. figures) are never read.
+
+    Args:
+        text (str): The text of the abstract.
+        filepaths (Iterable[str]): The additional input filepaths.
+            Missing files are included as such.
+        options (dict|None): The options affecting the stage output.
+            Values must be JSON-serializable (or have a stable `str()`).
+
+    Returns:
+        digest (str): The hexadecimal SHA-1 digest.
+
+    Examples:
+        >>> digest = journal_hash('# Title', options=dict(export=['pdf']))
+        >>> digest == journal_hash('# Title', options=dict(export=['pdf']))
+        True
+        >>> digest == journal_hash('# Title', options=dict(export=['html']))
+        False
+    """
+    digest = hashlib.sha1(text.encode('utf-8'))
+    for filepath in filepaths:
+        try:
+            stat = os.stat(filepath)
+            stamp = '{}:{}:{}'.format(filepath, stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            stamp = '{}:missing'.format(filepath)
+        digest.update(b'\0' + stamp.encode('utf-8'))
+    digest.update(b'\0' + json.dumps(
+        options, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()
+
+
+# ======================================================================
+def load_journal(journal_filepath):
+    """
+    Load the latest record of each item and stage from a checkpoint journal.
+
+    Records are JSON lines appended by `append_journal()`.
+    A truncated last line (e.g. from a killed run) is ignored.
+
+    Args:
+        journal_filepath (str): The journal filepath.
+
+    Returns:
+        records (dict[tuple[int,str],dict]): The latest record, by
+            (item, stage).
+    """
+    records = {}
+    if not os.path.isfile(journal_filepath):
+        return records
+    with open(journal_filepath, 'rb') as fileobj:
+        for line in fileobj:
+            try:
+                record = json.loads(line.decode('utf-8'))
+                records[(record['item'], record['stage'])] = record
+            except (ValueError, KeyError, TypeError):
+                continue
+    return records
+
+
+# ======================================================================
+def append_journal(
+        fileobj,
+        record):
+    """
+    Append a record to a checkpoint journal, durably.
+
+    The record is flushed and synced to disk before returning, so that it
+    survives the process being killed right after.
+
+    Args:
+        fileobj (file): The journal file, opened in binary append mode.
+        record (dict): The record.
+            Must contain at least: `item`, `stage`, `hash` and `ok`.
+
+    Returns:
+        None.
+    """
+    record = dict(record, time=time.time())
+    fileobj.write((json.dumps(record, sort_keys=True) + '\n').encode('utf-8'))
+    fileobj.flush()
+    os.fsync(fileobj.fileno())
+
+
+# ======================================================================
+def ismrm_bundle(
+        in_filepath,
+        delimiter=None,
+        jobs=1,
+        out_filepath=None,
+        export=('html', 'pdf'),
+        backup=True,
+        limits=D_LIMITS,
+        encoding='utf-8',
+        resume=False,
+        verbose=D_VERB_LVL,
+        **_kws):
+    """
+    Validate (and optionally export) all abstracts of a bundle.
+
+    Each completed stage (`validate` and `build`) of each abstract is
+    recorded, with the hash of its inputs, in an append-only checkpoint
+    journal next to the bundle (see `D_JOURNAL`).
+    When resuming, the stages already completed with matching input hashes
+    (and whose outputs still exist) are skipped, so that an interrupted run
+    only processes the failed or missing stages.
+
+    Args:
+        in_filepath (str): The bundle filepath.
+        delimiter (str|None): The line separating the abstracts.
+            See `index_bundle()` for more details.
+        jobs (int): The number of parallel worker processes.
+        out_filepath (str|None): The output filepath of the fixed versions.
+            Each abstract gets its own, formatted as `D_BUNDLE_FMT` (e.g.
+            `submit.md` becomes `submit.000.md`, `submit.001.md`, ...).
+            If None, it is computed from each extracted abstract.
+        export (list[str]): The export format(s).
+            If not empty, each abstract is extracted (see
+            `extract_bundle_item()`) and processed with `ismrm_abstract()`.
+        backup (bool): Backup once before exporting the abstracts.
+        limits (dict|str): Limits or rules to be used for testing.
+        encoding (str): The encoding to use.
+        resume (bool): Skip the stages completed by a previous run.
+            Ignored if `force` is set.
+        verbose (int): Set level of verbosity.
+        **_kws: Keyword arguments for `ismrm_abstract()`.
+
+    Returns:
+        passed (bool): True if all abstracts passed all checks (and were
+            exported without errors, in all the requested formats).
+    """
+    msg('Bundle: {}'.format(in_filepath), verbose)
+    dirpath, filename = os.path.split(os.path.realpath(in_filepath))
+    journal_filepath = os.path.join(dirpath, D_JOURNAL.format(name=filename))
+    journal = load_journal(journal_filepath) \
+        if resume and not _kws.get('force') else {}
+
+    # :: compute the input hashes of the stages of each abstract
+    css = _kws.get('css') or []
+    rules_filepaths = [limits] if isinstance(limits, str) else []
+    build_filepaths = [__file__] + rules_filepaths + \
+        ([_kws['bib']] if _kws.get('bib') else []) + \
+        ([css] if isinstance(css, str) else list(css))
+    # : the tool stamps change with the external tools (see `toolchain()`)
+    tools = ['md2html'] if 'html' in export or 'pdf' in export else []
+    tools += ['html2pdf'] if 'pdf' in export else []
+    toolchain(tools)
+    build_filepaths += [toolchain_stamp(tool) for tool in tools]
+    options = dict(
+        (key, value) for key, value in _kws.items()
+        if key not in _JOURNAL_IGNORED_ARGS)
+    options.update(
+        out_filepath=out_filepath, export=list(export), limits=limits,
+        encoding=encoding)
+    hashes = {}
+    for i, (start, end) in enumerate(index_bundle(in_filepath, delimiter)):
+        text = read_bundle_item(in_filepath, start, end, encoding)
+        figs_filepaths = [
+            os.path.join(dirpath, os.path.expanduser(fig))
+            for fig in find_figures_text(text)]
+        hashes[i] = dict(
+            validate=journal_hash(
+                text, [__file__] + rules_filepaths, dict(limits=limits)),
+            build=journal_hash(
+                text, build_filepaths + figs_filepaths, options))
+
+    def _is_done(i, stage):
+        record = journal.get((i, stage))
+        return bool(record) and record['ok'] \
+            and record['hash'] == hashes[i][stage] \
+            and all(os.path.isfile(filepath)
+                    for filepath in record.get('outputs', ()))
+
+    skip = set(i for i in hashes if _is_done(i, 'validate'))
+    num_passed = num_total = num_failed = num_resumed = 0
+    if export and backup:
+        # : a single backup for the whole bundle, not one per abstract
+        args, is_valid = which(TOOLS['vcs'])
+        ret_code, p_stdout, p_stderr = execute(
+            args, timeout=D_TIMEOUT['vcs'], cancel=_kws.get('cancel'),
+            verbose=VERB_LVL['none'])
+        if ret_code == 0:
+            msg('I: Your VCS has been updated.', verbose)
+        else:
+            reason = '(Returned: {})'.format(ret_code) \
+                if is_valid else '(`{}` not found)'.format(args[0])
+            msg('W: VCS backup failed {}.'.format(reason), verbose)
+    with open(journal_filepath, 'ab') as journal_file:
+        # : terminate the last record, if truncated by an interrupted run
+        if journal_file.tell():
+            with open(journal_filepath, 'rb') as fileobj:
+                fileobj.seek(-1, os.SEEK_END)
+                if fileobj.read(1) != b'\n':
+                    journal_file.write(b'\n')
+        for i, (start, end), result in validate_bundle(
+                in_filepath, delimiter, limits, encoding, jobs, skip):
+            num_total += 1
+            if result is None:
+                num_resumed += 1
+                record = journal[(i, 'validate')]
+                title, passed = record['title'], record['passed']
+            elif isinstance(result, Exception):
+                msg('E: [{:03d}] {}'.format(i, result), verbose)
+                append_journal(journal_file, dict(
+                    item=i, stage='validate', hash=hashes[i]['validate'],
+                    ok=False, errors=[str(result)]))
+                continue
+            else:
+                title, passed = result.title, result.passed
+                append_journal(journal_file, dict(
+                    item=i, stage='validate', hash=hashes[i]['validate'],
+                    ok=True, title=title, passed=passed))
+            num_passed += passed
+            text = '{}: {:64} {:.>6s}'.format(
+                'I' if passed else 'E',
+                '[{:03d}] {}'.format(i, title)[:64],
+                'OK' if passed else 'ERR')
+            msg(text, verbose)
+            if not export:
+                continue
+            if _is_done(i, 'build'):
+                num_resumed += 1
+                continue
+            outputs = {}
+            try:
+                result = ismrm_abstract(
+                    extract_bundle_item(in_filepath, i, start, end,
+                                        encoding=encoding),
+                    item_filepath(out_filepath, i), export=export,
+                    backup=False,
+                    limits=limits, encoding=encoding, verbose=verbose,
+                    **_kws)
+                outputs = result.outputs
+                errors = [
+                    note for note in result.notes if note.startswith('E:')]
+                # : e.g. a missing external tool only produces a warning
+                errors += [
+                    'E: No {} was produced.'.format(fmt.upper())
+                    for fmt in export if fmt not in outputs]
+            except (IOError, ValueError) as e:
+                msg('E: [{:03d}] {}'.format(i, e), verbose)
+                errors = [str(e)]
+            num_failed += bool(errors)
+            append_journal(journal_file, dict(
+                item=i, stage='build', hash=hashes[i]['build'],
+                ok=not errors, outputs=sorted(outputs.values()),
+                errors=errors))
+    if num_resumed:
+        msg('Resumed: {} completed stage(s) skipped'.format(num_resumed),
+            verbose)
+    if num_failed:
+        msg('Failed: {} export(s)'.format(num_failed), verbose)
+    msg('Passed: {} / {}'.format(num_passed, num_total), verbose,
+        fmtt='{t.bold}')
+    return num_passed == num_total and not num_failed
+
+
+# ======================================================================
+def abstract_filepaths(in_filepath):
+    """
+    Find the abstract directories within a directory tree.
+
+    An abstract directory contains a Markdown file with the same name (see
+    `resolve_input()`); hidden directories are ignored.
+
+    Args:
+        in_filepath (str): The root directory (searched recursively)
+            or a single abstract file or directory path.
+
+    Returns:
+        filepaths (list[str]): The sorted abstract filepaths.
+    """
+    if os.path.isfile(resolve_input(in_filepath)):
+        return [resolve_input(in_filepath)]
+    filepaths = []
+    for dirpath, dirnames, filenames in os.walk(in_filepath):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        filepath = resolve_input(dirpath)
+        if os.path.isfile(filepath):
+            filepaths.append(filepath)
+    return sorted(filepaths)
+
+
+# ======================================================================
+def queue_submit(
+        queue_dirpath,
+        in_filepaths,
+        kws=None):
+    """
+    Write the work items of a batch into a shared-filesystem queue.
+
+    The queue directory contains:
+        - `todo/`: the work items waiting for a worker.
+        - `leased/`: the work items claimed by a worker.
+        - `done/`: the result records.
+
+    Args:
+        queue_dirpath (str): The queue directory.
+        in_filepaths (Iterable[str]): The abstract filepaths.
+            These must be valid on all the nodes running workers.
+        kws (dict|None): Keyword arguments for `ismrm_abstract()`.
+            Values must be JSON-serializable.
+            Each work item gets its own `out_filepath`, if any (see
+            `item_filepath()`).
+
+    Returns:
+        item_ids (list[str]): The identifiers of the work items (in order).
+    """
+    for dirname in _QUEUE_DIRNAMES:
+        os.makedirs(os.path.join(queue_dirpath, dirname), exist_ok=True)
+    batch = '{:x}{:x}'.format(int(time.time() * 1000), os.getpid())
+    kws = dict(kws or {})
+    out_filepath = kws.pop('out_filepath', None)
+    if out_filepath and os.path.dirname(out_filepath):
+        # : workers may run in a different working directory
+        out_filepath = os.path.realpath(out_filepath)
+    item_ids = []
+    for i, in_filepath in enumerate(in_filepaths):
+        item_id = '{}-{:05d}'.format(batch, i)
+        write_atomic(
+            os.path.join(queue_dirpath, 'todo', item_id + '.json'),
+            json.dumps(dict(
+                index=i, in_filepath=os.path.realpath(in_filepath),
+                kws=dict(kws, out_filepath=item_filepath(
+                    out_filepath, i)))).encode('utf-8'))
+        item_ids.append(item_id)
+    return item_ids
+
+
+# ======================================================================
+def _queue_reclaim(
+        queue_dirpath,
+        lease=D_QUEUE_LEASE):
+    """
+    Move the expired leases of a queue back to the waiting work items.
+
+    A lease expires when it was not renewed for `lease` seconds (i.e. its
+    worker died). Clocks of the nodes are assumed roughly synchronized.
+    An expired lease is first atomically renamed (so that only one
+    reclaimer proceeds, and its worker can no longer renew it), then its
+    modification time is checked again: if it was renewed in the meantime,
+    the lease is restored instead.
+
+    Args:
+        queue_dirpath (str): The queue directory.
+        lease (float): The lease duration in seconds.
+
+    Returns:
+        num_reclaimed (int): The number of work items reclaimed.
+    """
+    leased_dirpath = os.path.join(queue_dirpath, 'leased')
+    reclaimer = '{}.{}'.format(socket.gethostname(), os.getpid())
+    num_reclaimed = 0
+    for name in os.listdir(leased_dirpath):
+        filepath = os.path.join(leased_dirpath, name)
+        # : a left-over of an interrupted reclaim expires as a lease
+        reclaim_filepath = os.path.join(
+            leased_dirpath, '{}.json.{}.reclaim'.format(
+                name.split('.json')[0], reclaimer))
+        try:
+            if time.time() - os.path.getmtime(filepath) <= lease:
+                continue
+            os.rename(filepath, reclaim_filepath)
+        except OSError:
+            continue  # : completed or reclaimed by someone else
+        try:
+            if time.time() - os.path.getmtime(reclaim_filepath) <= lease:
+                os.rename(reclaim_filepath, filepath)
+            else:
+                os.rename(reclaim_filepath, os.path.join(
+                    queue_dirpath, 'todo', name.split('@')[0] + '.json'))
+                num_reclaimed += 1
+        except OSError:
+            pass
+    return num_reclaimed
+
+
+# ======================================================================
+def _queue_claim(
+        queue_dirpath,
+        worker):
+    """
+    Claim a waiting work item of a queue.
+
+    The work item is atomically renamed into a lease (only one worker can
+    succeed), whose modification time is then renewed by the worker.
+
+    Args:
+        queue_dirpath (str): The queue directory.
+        worker (str): The worker identifier.
+
+    Returns:
+        result (tuple[str,str]|None): The item identifier and the lease
+            filepath. If no work item could be claimed, returns None.
+    """
+    todo_dirpath = os.path.join(queue_dirpath, 'todo')
+    for name in sorted(os.listdir(todo_dirpath)):
+        # : skip temporary files being written by `write_atomic()`
+        if not name.endswith('.json') or name.count('.') != 1:
+            continue
+        item_id = name[:-len('.json')]
+        lease_filepath = os.path.join(
+            queue_dirpath, 'leased', '{}@{}.json'.format(item_id, worker))
+        try:
+            os.rename(os.path.join(todo_dirpath, name), lease_filepath)
+            os.utime(lease_filepath)
+        except OSError:
+            continue  # : claimed by another worker
+        return item_id, lease_filepath
+    return None
+
+
+# ======================================================================
+def queue_worker(
+        queue_dirpath,
+        lease=D_QUEUE_LEASE,
+        idle=D_QUEUE_IDLE,
+        cancel=None,
+        verbose=D_VERB_LVL):
+    """
+    Process the work items of a shared-filesystem queue.
+
+    Each work item is claimed (see `_queue_claim()`), processed with
+    `ismrm_abstract()` while renewing its lease, and its result record is
+    written to `done/`.
+    If the lease is lost (i.e. reclaimed after a stall), the in-flight
+    external tool runs are aborted and the result is discarded.
+    Expired leases of other workers are reclaimed (see `_queue_reclaim()`).
+    Any number of workers can run concurrently, on any node sharing the
+    queue directory.
+
+    Args:
+        queue_dirpath (str): The queue directory.
+        lease (float): The lease duration in seconds.
+        idle (float): Max seconds without work before exiting.
+            The worker does not exit while other leases are pending.
+        cancel (threading.Event|None): Cooperative cancellation flag.
+            If set, in-flight external tool runs are aborted.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        num_done (int): The number of work items processed.
+    """
+    worker = '{}.{}'.format(socket.gethostname(), os.getpid())
+    for dirname in _QUEUE_DIRNAMES:
+        os.makedirs(os.path.join(queue_dirpath, dirname), exist_ok=True)
+    msg('Worker: {} on `{}`'.format(worker, queue_dirpath), verbose)
+
+    def _renew(lease_filepath, stop, abort):
+        renew_time = time.monotonic()
+        while not stop.wait(_POLL_INTERVAL):
+            if cancel is not None and cancel.is_set():
+                abort.set()
+            elif time.monotonic() - renew_time > lease / 4:
+                try:
+                    os.utime(lease_filepath)
+                except OSError:
+                    # : reclaimed by someone else: abort the tool runs
+                    abort.set()
+                    break
+                renew_time = time.monotonic()
+
+    num_done = 0
+    last_time = time.time()
+    while True:
+        _queue_reclaim(queue_dirpath, lease)
+        claimed = _queue_claim(queue_dirpath, worker)
+        if claimed is None:
+            if time.time() - last_time > idle \
+                    and not os.listdir(os.path.join(queue_dirpath, 'leased')):
+                break
+            time.sleep(_QUEUE_POLL)
+            continue
+        item_id, lease_filepath = claimed
+        done_filepath = os.path.join(queue_dirpath, 'done', item_id + '.json')
+        with open(lease_filepath, 'rb') as fileobj:
+            item = json.loads(fileobj.read().decode('utf-8'))
+        if not os.path.isfile(done_filepath):
+            stop, abort = threading.Event(), threading.Event()
+            renewer = threading.Thread(
+                target=_renew, args=(lease_filepath, stop, abort),
+                daemon=True)
+            renewer.start()
+            begin_time = time.time()
+            record = dict(
+                index=item['index'], in_filepath=item['in_filepath'],
+                worker=worker, title=None, passed=False, outputs={},
+                errors=[])
+            try:
+                kws = dict(
+                    item['kws'], cancel=abort, verbose=VERB_LVL['none'])
+                result = ismrm_abstract(
+                    item['in_filepath'], kws.pop('out_filepath', None), **kws)
+                record.update(
+                    title=result.title, passed=result.passed,
+                    outputs=result.outputs, errors=[
+                        note for note in result.notes
+                        if note.startswith('E:')])
+            except Exception as e:
+                record['errors'].append('{}: {}'.format(type(e).__name__, e))
+            finally:
+                stop.set()
+                renewer.join()
+            try:
+                # : renewing also confirms that the lease is still held
+                os.utime(lease_filepath)
+                is_held = not abort.is_set()
+            except OSError:
+                is_held = False
+            if not is_held:
+                msg('W: [{:03d}] {}: lease lost, result discarded.'.format(
+                    item['index'], item['in_filepath']), verbose)
+                continue
+            record['elapsed'] = time.time() - begin_time
+            write_atomic(done_filepath, json.dumps(record).encode('utf-8'))
+            num_done += 1
+            msg('{}: [{:03d}] {} ({:.1f}s)'.format(
+                'I' if record['passed'] and not record['errors'] else 'E',
+                item['index'], item['in_filepath'], record['elapsed']),
+                verbose)
+        try:
+            os.remove(lease_filepath)
+        except OSError:
+            pass
+        last_time = time.time()
+    msg('Done: {}'.format(num_done), verbose)
+    return num_done
 
 
 # ======================================================================
-def fix(
+def queue_coordinator(
         in_filepath,
-        out_filepath=None,
-        attachment=None,
-        encoding='utf-8',
-        out_fmt='fix_{in_filename}',
-        force=False,
-        verbose=D_VERB_LVL):
+        queue_dirpath,
+        jobs=1,
+        lease=D_QUEUE_LEASE,
+        cancel=None,
+        verbose=D_VERB_LVL,
+        **_kws):
     """
-    Substitute maths environment standard delimiters with custom defined ones.
+    Validate and export all abstracts of a directory tree through a queue.
+
+    One work item per abstract directory (see `abstract_filepaths()`) is
+    written into the queue (see `queue_submit()`), which is processed by any
+    number of workers (see `queue_worker()`), e.g. started on other nodes
+    with `--worker`. The result records are then aggregated.
+    Only a shared filesystem is required.
 
     Args:
-        in_filepath (str): The input filepath.
-        out_filepath (str): The output filepath.
-        attachment (str): The text to attach to the abstract.
-        encoding (str): The encoding to use.
-        out_fmt (str): The output format if out_filepath is None.
-        force (bool): Force new processing.
-        verbose (int):set the level of verbosity.
+        in_filepath (str): The root directory of the abstracts.
+        queue_dirpath (str): The queue directory.
+        jobs (int): The number of local worker processes to start.
+            If 0, only external workers are used.
+        lease (float): The lease duration in seconds.
+        cancel (threading.Event|None): Cooperative cancellation flag.
+            Only used when processing work items in-process.
+        verbose (int): Set level of verbosity.
+        **_kws: Keyword arguments for `ismrm_abstract()`.
 
     Returns:
-        None.
+        passed (bool): True if all abstracts passed all checks (and were
+            exported without errors).
     """
-    in_dirpath, in_filename = os.path.split(in_filepath)
-    if not out_filepath:
-        out_filepath = out_fmt.format_map(vars())
-    if os.path.dirname(out_filepath) == '':
-        out_filepath = os.path.join(in_dirpath, out_filepath)
-
-    if check_redo([in_filepath, __file__], [out_filepath], force):
-        with open(in_filepath, 'rb') as i_file:
-            stream = i_file.read().decode(encoding)
-            i_file.close()
-
-        replaces = (
-            ('.\n\n', '.' + ' ' * 3 + '\n\n'),
-            ('.\n', '.' + ' ' + '\n'),
-            ('\\\\(', '$$$'), ('\\\\)', '$$$'),
-            ('\\\\[', '$$'), ('\\\\]', '$$'),
-        )
-        stream = multi_replace(stream, replaces)
-
-        if attachment:
-            stream += '\n' + attachment + '\n'
-
-        with open(out_filepath, 'wb') as o_file:
-            o_file.write(stream.encode(encoding))
-            o_file.close()
-        msg('Output: {}'.format(out_filepath), verbose, VERB_LVL['lowest'])
+    in_filepaths = abstract_filepaths(in_filepath)
+    msg('Queue: {} ({} abstracts)'.format(queue_dirpath, len(in_filepaths)),
+        verbose)
+    item_ids = queue_submit(queue_dirpath, in_filepaths, _kws)
+    workers = [
+        subprocess.Popen(
+            [sys.executable, __file__, '--worker', queue_dirpath, '--quiet'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL)
+        for _ in range(jobs)]
+    pending = set(item_ids)
+    num_passed = num_failed = 0
+    names = set()
+    try:
+        while pending:
+            for item_id in sorted(pending):
+                done_filepath = os.path.join(
+                    queue_dirpath, 'done', item_id + '.json')
+                if not os.path.isfile(done_filepath):
+                    continue
+                with open(done_filepath, 'rb') as fileobj:
+                    record = json.loads(fileobj.read().decode('utf-8'))
+                os.remove(done_filepath)
+                pending.discard(item_id)
+                names.add(record['worker'])
+                num_passed += record['passed']
+                num_failed += bool(record['errors'])
+                for error in record['errors']:
+                    msg('E: [{:03d}] {}'.format(record['index'], error),
+                        verbose)
+                if record['title'] is not None:
+                    msg('{}: {:64} {:.>6s}'.format(
+                        'I' if record['passed'] else 'E',
+                        '[{:03d}] {}'.format(
+                            record['index'], record['title'])[:64],
+                        'OK' if record['passed'] else 'ERR'), verbose)
+            if pending:
+                _queue_reclaim(queue_dirpath, lease)
+                if workers and all(
+                        worker.poll() is not None for worker in workers):
+                    msg('W: Local workers exited: continuing in-process.',
+                        verbose)
+                    workers = []
+                    queue_worker(
+                        queue_dirpath, lease, 0.0, cancel, VERB_LVL['none'])
+                else:
+                    time.sleep(_QUEUE_POLL)
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.terminate()
+            worker.wait()
+    msg('Workers: {}'.format(len(names)), verbose)
+    if num_failed:
+        msg('Failed: {} export(s)'.format(num_failed), verbose)
+    msg('Passed: {} / {}'.format(num_passed, len(item_ids)), verbose,
+        fmtt='{t.bold}')
+    return num_passed == len(item_ids) and not num_failed
 
 
 # ======================================================================
-def gen_report(
-        lines,
-        tests,
-        title=D_TESTS_TITLE,
-        final=D_TESTS_FINAL,
-        hdr_style=+2,
-        prefix='',
-        suffix='',
-        use_html=False):
+def coalesce(
+        in_filepath,
+        func,
+        wait=False,
+        verbose=D_VERB_LVL):
     """
-    Generate a report of the tests performed.
+    Run a function on an abstract, coalescing concurrent invocations.
+
+    Each invocation first marks the abstract as dirty (unless `wait` is
+    set), then tries to acquire a per-abstract lock.
+    The lock holder keeps running `func` as long as the abstract is dirty,
+    so that any burst of invocations during a run results in at most one
+    follow-up run.
+    Invocations not getting the lock return immediately (or, if `wait` is
+    set, run `func` once the lock holder is done, so that its result is
+    available, e.g. to display the report).
+
+    Locking requires `fcntl` (POSIX only); otherwise, `func` is run
+    without coalescing.
 
     Args:
-        lines (list[str]): A list of text strings with description of tests.
-            This is usually the same as displayed in the terminal.
-        tests (list[bool]): A list of the results of all tests performed.
-        title (str): The title to use for the section heading.
-        final (str): The template string to use for the final test.
-            This is OK only if all tests are OK.
-        hdr_style (int): Determine the style of the header to use.
-            A positive number will use '#'-style heading (valid: 1-6).
-            A negative number will use underlined-style heading (valid: 1-2).
-        prefix (str): String to attach to the report before its content.
-        suffix (str): String to attach to the report after its content.
-        use_html (bool): Insert HTML specific tags for improved export.
+        in_filepath (str): The input file or directory path.
+        func (callable): The function to run. Must not accept arguments.
+        wait (bool): Wait for an in-progress run to complete.
+        verbose (int): Set level of verbosity.
 
     Returns:
-        text (str): The report as valid MarkDown (eventually HTML-enriched).
+        result (Any|None): The result of the last run of `func`.
+            If `func` was run by a concurrent invocation (and `wait` is not
+            set), returns None.
     """
-    text = '\n' * 3
-    # title
-    if hdr_style > 0:
-        i = hdr_style - 1
-        text += str(D_HDR_TOKENS[i]) + title + '\n'
-    elif hdr_style < 0:
-        i = hdr_style + 1
-        text += title + '\n'
-        text += '-' * len(title) + '\n'
-    else:
-        text += title + '\n'
-    # body
-    if use_html:
-        for line, test in zip(lines, tests):
-            if test:
-                attr = 'green'
-            elif test is not None:
-                attr = 'red'
-            else:
-                attr = ''
-            text += '{}- <span class="{}">{}</span>{}\n'.format(
-                prefix, attr, line.replace(' ', '&nbsp;'), suffix)
-    else:
-        text += '\n'.join([prefix + line + suffix for line in lines])
-    text += '\n'
-    # final result
-    if lines:
-        final_test = all([test for test in tests if test is not None])
-        color = 'green' if final_test else 'red'
-        result = 'OK' if final_test else 'ERR'
-        text += '-' * len(lines[-1]) + '\n'
-        text += '<span class="{}">'.format(color) if use_html else ''
-        text += '{:>{n}s}'.format(
-            final.format_map(vars()), n=len(lines[-1]) if not use_html else '')
-        text += '</span>' if use_html else ''
-    return text
+    try:
+        import fcntl
+    except ImportError:
+        return func()
+
+    in_filepath = resolve_input(in_filepath)
+    dirpath, filename = os.path.split(in_filepath)
+    if not os.path.isdir(dirpath):
+        return func()
+    lock_filepath = os.path.join(dirpath, D_LOCK.format(name=filename))
+    dirty_filepath = os.path.join(dirpath, D_DIRTY.format(name=filename))
+
+    result = None
+    if not wait:
+        # : otherwise, `func` is run anyway after acquiring the lock
+        open(dirty_filepath, 'ab').close()
+    with open(lock_filepath, 'ab') as lock_file:
+        blocking = pending = wait
+        while True:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except (IOError, OSError):
+                if not blocking:
+                    msg('I: Run in progress on `{}`: follow-up scheduled.'
+                        .format(in_filepath), verbose)
+                    break
+                msg('I: Run in progress on `{}`: waiting.'.format(
+                    in_filepath), verbose)
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                while pending or os.path.exists(dirty_filepath):
+                    pending = False
+                    try:
+                        os.remove(dirty_filepath)
+                    except (IOError, OSError):
+                        pass
+                    result = func()
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            # : the abstract may have been marked dirty just before unlock
+            if not os.path.exists(dirty_filepath):
+                break
+            blocking = False
+    return result
 
 
 # ======================================================================
@@ -817,205 +6194,261 @@ def ismrm_abstract(
         log=True,
         css=None,
         self_contained=False,
+        preview=True,
+        incremental=False,
+        bib=None,
         encoding='utf-8',
         figs_dpi=72,
         limits=D_LIMITS,
+        timeout=None,
+        retries=D_RETRIES,
+        cancel=None,
+        history_filepath=D_HISTORY_FILEPATH,
         force=False,
         verbose=D_VERB_LVL):
     """
+    Validate and export an abstract, displaying the results.
+
+    This is a thin wrapper around `validate()` and `build()`.
 
     Args:
         in_filepath (str): The input filepath.
         out_filepath (str): The output filepath.
             If None, it will be computed from the input file.
         export (list[str]): The export format(s).
-            Accepted values are: [html|pdf]
+            Accepted values are: [html|pdf|zip]
         attach (bool): Attach results to output/export file(s).
         backup (bool): Backups before processing.
+        log (bool): Log the output of external tools.
         css (list[str]): Specify the CSS sources.
         self_contained (bool): Specify if HTML export is self-contained.
+        preview (bool): Use preview-resolution figures in exports.
+        incremental (bool): Render the HTML export section by section.
+        bib (str|None): The BibTeX filepath to resolve citations against.
         figs_dpi (float): Resolution of the figures in exports.
         encoding (str): The encoding to use.
-        limits (dict): Limits to be used for testing.
+        limits (dict|str): Limits or rules to be used for testing.
             Defaults to ISMRM 2019 Montreal abstracts.
+        timeout (float|None): Timeout of each external tool in seconds.
+            If None, the tool-specific defaults from `D_TIMEOUT` are used.
+        retries (int): Max number of retries for transient tool failures.
+        cancel (threading.Event|None): Cooperative cancellation flag.
+            If set, in-flight external tool runs are aborted.
+        history_filepath (str|None): The stage timings history filepath.
+            If None, no timings are recorded.
         force (bool): Force new processing.
         verbose (int):set the level of verbosity.
 
     Returns:
-        None.
+        result (Result): The validation and build result.
+
+    Raises:
+        IOError: If the input file does not exist.
+        ValueError: If the input file cannot be parsed.
     """
+    result = validate(in_filepath, limits, encoding, bib)
+    msg('Input: {}'.format(result.document.filepath), verbose)
 
-    export = [s.lower() for s in export]
+    # :: title
+    msg(': {}'.format(D_TESTS_TITLE.format_map(vars())), verbose,
+        fmtt='{t.bold}{t.blue}')
+    title = result.title
+    msg(': {:<76s}{}'.format(
+        title[:76] if len(title) < 76 else title[:73],
+        '...' if len(title) > 76 else ''), verbose)
+    for check in result.checks:
+        msg(check.text, verbose)
 
-    def _test_pass(cond, text, test_list, attach_list):
-        if cond:
-            mode, res = 'I', 'OK'
-        elif cond is None:
-            mode, res = GLIPH, ' '
-        else:
-            mode, res = 'E', 'ERR'
-        text = '{}: {:64} {:.>6s}'.format(mode, text, res)
-        msg(text)
-        test_list.append(cond)
-        attach_list.append(text)
+    # :: final test
+    color = 'green' if result.passed else 'red'
+    result_str = 'OK' if result.passed else 'ERR'
+    msg('{:^{n}s}'.format(D_TESTS_FINAL.format(result=result_str),
+                          n=len(result.checks[-1].text)), verbose,
+        fmtt='{{t.bold}}{{t.{color}}}'.format(color=color))
 
-    tests = []
-    attaches = []
+    result = build(
+        result, out_filepath, export=export, attach=attach, backup=backup,
+        log=log, css=css, self_contained=self_contained, preview=preview,
+        incremental=incremental, bib=bib, encoding=encoding,
+        figs_dpi=figs_dpi, timeout=timeout, retries=retries, cancel=cancel,
+        history_filepath=history_filepath, force=force, verbose=verbose)
+    for note in result.notes:
+        msg(note, verbose)
+    return result
 
-    if os.path.isfile(in_filepath):
-        in_filepath = os.path.realpath(in_filepath)
-    elif os.path.isdir(in_filepath):
-        dirpath = os.path.realpath(in_filepath)
-        in_filepath = os.path.join(
-            dirpath, os.path.basename(dirpath) + '.md')
-    if not os.path.isfile(in_filepath):
-        msg('File `{}` not found.'.format(in_filepath))
-        exit(1)
-    msg('Input: {}'.format(in_filepath))
 
-    if backup:
-        args, is_valid = which(TOOLS['vcs'].format_map(vars()))
-        ret_code, p_stdout, p_stderr = execute(
-            args, log=D_LOG, verbose=verbose)
-        if ret_code == 0:
-            msg('I: Your VCS has been updated.')
-        else:
-            reason = '(Returned: {})'.format(ret_code) \
-                if is_valid else '(`{}` not found)'.format(args[0])
-            msg('W: VCS backup failed {}.'.format(reason))
+# ======================================================================
+class _FrameWriter(object):
+    """
+    Text stream sending everything written as frames over a socket.
 
-    # :: title
-    msg(': {}'.format(D_TESTS_TITLE.format_map(vars())),
-        fmtt='{t.bold}{t.blue}')
+    Each frame is: channel (1 byte), length (4 bytes, big-endian), data.
+    If the peer goes away, further output is silently discarded.
+    """
+
+    def __init__(self, conn, channel, encoding='utf-8'):
+        self.conn = conn
+        self.channel = channel
+        self.encoding = encoding
+        self.is_connected = True
+
+    def write(self, text):
+        if text and self.is_connected:
+            data = text.encode(self.encoding, 'replace')
+            try:
+                self.conn.sendall(
+                    _DAEMON_FRAME.pack(self.channel, len(data)) + data)
+            except (IOError, OSError):
+                self.is_connected = False
+        return len(text)
 
-    # :: word count
-    blocks, num_words_total, num_words_full = word_count(
-        in_filepath, skip_sections=D_SKIP_SECTIONS, encoding=encoding)
+    def flush(self):
+        pass
+
+    def isatty(self):
+        return False
+
+
+# ======================================================================
+def run_main(argv=None):
+    """
+    Run the command-line interface, returning its exit code.
+
+    Args:
+        argv (list[str]|None): The command-line arguments.
+            If None, `sys.argv[1:]` is used.
 
+    Returns:
+        code (int): The exit code.
+    """
     try:
-        title = blocks[0]['title']
-    except IndexError:
-        raise ValueError('Could not parse file (syntax error or empty?)')
-    msg(': {:<76s}{}'.format(
-        title[:76] if len(title) < 76 else title[:73],
-        '...' if len(title) > 76 else ''))
-
-    txt = '{:<48s}  {:>18s}'.format(
-        'Word Count Total ({})'.format(GLIPH),
-        '{:>8} / {:<7}'.format(num_words_total, limits['wc_tot']))
-    _test_pass(num_words_total <= limits['wc_tot'], txt, tests, attaches)
-
-    num_figure_captions = 0
-    for block in blocks:
-        if block['num_words']:
-            gliph, limit, condition = '', 0, None
-            if block['title'] == 'Synopsis':
-                condition = block['num_words'] <= limits['wc_synopsis']
-                limit = limits['wc_synopsis']
-            elif block['title'].startswith('Figure'):
-                num_figure_captions += 1
-                condition = block['num_words'] <= limits['wc_fig']
-                limit = limits['wc_fig']
-            elif not block['skip']:
-                gliph = limit = GLIPH
-            txt = '{:<48s}  {:>18s}'.format(
-                'Word Count: {}{}'.format(block['title'], gliph),
-                '{:>8} / {:<7}'.format(
-                    block['num_words'], limit))
-            _test_pass(condition, txt, tests, attaches)
-
-    figs = find_figures(in_filepath, encoding=encoding)
-    figs_caps = [(len(figs), 'figures'), (num_figure_captions, 'captions')]
-    for n, label in figs_caps:
-        txt = '{:<48s}  {:>18s}'.format(
-            'Number of {}'.format(label),
-            '{:>8} / {:<7}'.format(n, limits['n_figs']))
-        _test_pass(n <= limits['n_figs'], txt, tests, attaches)
-    txt = ''.format('Matching number of figures and captions...')
-    txt = '{:<48s}  {:>18s}'.format(
-        'Matching number of figures and captions',
-        '{:>8} {} {:<7}'.format(
-            len(figs), '=' if len(figs) == num_figure_captions else '≠',
-            num_figure_captions))
-    _test_pass(len(figs) == num_figure_captions, txt, tests, attaches)
-
-    for fig in figs:
-        fig_filepath = os.path.expanduser(os.path.realpath(fig))
-        if os.path.isfile(fig_filepath):
-            fig_size = os.path.getsize(fig_filepath)
-            txt_fig = '{:>8} / {:<7}'.format(
-                *['{:.1f} {}'.format(n / 1e6, 'MB')
-                  for n in (fig_size, limits['fig_size'])])
-        else:
-            fig_size = -1
-            txt_fig = 'NOT FOUND!'
-        txt = '{:<48s}  {:>18s}'.format('"{:s}"'.format(fig[:46]), txt_fig)
-        _test_pass(0 <= fig_size <= limits['fig_size'], txt, tests,
-                   attaches)
+        main(argv)
+    except SystemExit as e:
+        if e.code is None or isinstance(e.code, int):
+            return e.code or 0
+        print(e.code, file=sys.stderr)
+        return 1
+    except Exception:
+        import traceback
+        traceback.print_exc()
+        return 1
+    return 0
 
-    # :: final test
-    final_test = all([test for test in tests if test is not None])
-    color = 'green' if final_test else 'red'
-    result = 'OK' if final_test else 'ERR'
-    msg('{:^{n}s}'.format(D_TESTS_FINAL.format_map(vars()),
-                          n=len(attaches[-1])),
-        fmtt='{{t.bold}}{{t.{color}}}'.format(color=color))
 
-    # :: generate fixed version
-    fix(in_filepath, out_filepath,
-        gen_report(attaches, tests) if attach else '', encoding,
-        force=force, verbose=verbose)
+# ======================================================================
+def _serve_request(conn):
+    """
+    Run a single client request in the daemon.
 
-    # :: export to HTML and PDF
-    if 'html' in export or 'pdf' in export:
-        if css is None:
-            if check_redo([__file__], [D_CSS_FILEPATH], force):
-                with open(D_CSS_FILEPATH, 'wb') as fileobj:
-                    fileobj.write(D_CSS_FILECONTENT.encode(encoding))
-                msg('W: CSS `{}` may have been overwritten.'.format(
-                    D_CSS_FILEPATH))
-            css = D_CSS + \
-                  [D_CSS_FILEPATH] if D_CSS_FILEPATH not in D_CSS else []
-        css_str = ' '.join([_MD2HTML_MULTI_CSS + item for item in css])
-        msg('CSS: {}'.format(css))
+    The request is a JSON line with the command-line arguments (`argv`), the
+    working directory (`cwd`) and the environment (`env`) of the client.
+    The output is streamed back as `o` (stdout) and `e` (stderr) frames,
+    followed by an `x` frame with the exit code.
 
-        html_filepath = os.path.splitext(in_filepath)[0] + '.htm'
-        self_contained_str = '--self-contained' if self_contained else ''
-        if check_redo([in_filepath, __file__], [html_filepath], force):
-            with open(in_filepath, 'rb') as fileobj:
-                in_pipe = fileobj.read().decode(encoding)
-            if attach:
-                in_pipe += gen_report(attaches, tests, use_html=True)
-            args, is_valid = which(TOOLS['md2html'].format_map(vars()))
-            if is_valid:
-                ret_code, p_stdout, p_stderr = execute(
-                    args, in_pipe, log=D_LOG, verbose=verbose)
-                if ret_code == 0:
-                    with open(html_filepath, 'wb') as fileobj:
-                        fileobj.write(p_stdout.encode(encoding))
-                    msg('HTML: {}'.format(html_filepath))
-                else:
-                    msg('E: No HTML was produced.')
-            else:
-                msg('W: cannot export HTML without `{}`.'.format(args[0]))
+    Args:
+        conn (socket.socket): The client connection.
 
-        # export to PDF
-        if 'pdf' in export:
-            pdf_filepath = os.path.splitext(in_filepath)[0] + '.pdf'
-            in_filepaths = [html_filepath, __file__] + \
-                           [item for item in css if not '://' in item]
-            out_filepaths = [pdf_filepath]
-            if check_redo(in_filepaths, out_filepaths, force):
-                args, is_valid = which(TOOLS['html2pdf'].format_map(vars()))
-                if is_valid:
-                    ret_code, p_stdout, p_stderr = execute(
-                        args, log=D_LOG, verbose=verbose)
-                    if ret_code == 0:
-                        msg('PDF: {}'.format(pdf_filepath))
-                    else:
-                        msg('E: No PDF was produced.')
-                else:
-                    msg('W: cannot export PDF without `{}`.'.format(args[0]))
+    Returns:
+        None.
+    """
+    conn.settimeout(_PROBE_TIMEOUT)
+    with conn.makefile('rb') as fileobj:
+        request = json.loads(fileobj.readline().decode('utf-8'))
+    conn.settimeout(None)
+    cwd, environ = os.getcwd(), dict(os.environ)
+    try:
+        os.chdir(request['cwd'])
+        os.environ.clear()
+        os.environ.update(request['env'])
+        with contextlib.redirect_stdout(_FrameWriter(conn, b'o')), \
+                contextlib.redirect_stderr(_FrameWriter(conn, b'e')):
+            code = run_main(request['argv'])
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(environ)
+    data = str(code).encode('ascii')
+    conn.sendall(_DAEMON_FRAME.pack(b'x', len(data)) + data)
+
+
+# ======================================================================
+def serve(
+        socket_filepath=D_DAEMON_SOCKET,
+        idle=D_DAEMON_IDLE,
+        verbose=D_VERB_LVL):
+    """
+    Run the resident daemon, serving command-line requests.
+
+    Requests are served one at a time by the same interpreter, so that the
+    module-level caches (parsed documents, compiled rules, tool resolutions
+    and toolchain probes) stay warm across invocations.
+    Requests are sent by the thin client (`ismrm_client.py`).
+
+    Only one daemon runs per socket (guarded by a lock file).
+    The daemon exits after `idle` seconds without requests, or as soon as
+    this script is modified (the pending request is then closed without
+    reply, so that the client falls back to in-process execution).
+
+    Requires `fcntl` and Unix domain sockets (POSIX only).
+
+    Args:
+        socket_filepath (str): The Unix domain socket filepath.
+        idle (float|None): Max seconds without requests before exiting.
+            If None, the daemon never exits on its own.
+        verbose (int): Set level of verbosity.
+
+    Returns:
+        served (int|None): The number of requests served.
+            If another daemon is already running, returns None.
+    """
+    import fcntl
+
+    def _stamp():
+        stat = os.stat(__file__)
+        return stat.st_mtime_ns, stat.st_size
+
+    dirpath = os.path.dirname(socket_filepath)
+    if dirpath and not os.path.isdir(dirpath):
+        os.makedirs(dirpath)
+    num_served = 0
+    with open(socket_filepath + '.lock', 'ab') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            msg('I: Daemon already running on `{}`.'.format(socket_filepath),
+                verbose)
+            return None
+        if os.path.exists(socket_filepath):
+            os.remove(socket_filepath)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)  # only the current user may connect
+        try:
+            server.bind(socket_filepath)
+        finally:
+            os.umask(umask)
+        server.listen(16)
+        server.settimeout(idle)
+        stamp = _stamp()
+        msg('I: Daemon listening on `{}`.'.format(socket_filepath), verbose)
+        try:
+            while True:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    break
+                with conn:
+                    if _stamp() != stamp:
+                        msg('I: Script modified: exiting.', verbose)
+                        break
+                    try:
+                        _serve_request(conn)
+                    except (IOError, OSError, ValueError, KeyError) as e:
+                        msg('W: Request failed: {}'.format(e), verbose)
+                num_served += 1
+        finally:
+            server.close()
+            os.remove(socket_filepath)
+    return num_served
 
 
 # ======================================================================
@@ -1060,7 +6493,7 @@ def handle_arg():
         '-x', '--export', metavar='EXT',
         nargs='*',
         default=('html', 'pdf'),
-        help='set export format(s) [%(default)s]')
+        help='set export format(s): html, pdf, zip [%(default)s]')
     arg_parser.add_argument(
         '-a', '--attach',
         action='store_false',
@@ -1081,18 +6514,125 @@ def handle_arg():
         '-s', '--self-contained',
         action='store_true',
         help='toggle if HTML export should be self contained [%(default)s]')
+    arg_parser.add_argument(
+        '-p', '--preview',
+        action='store_false',
+        help='toggle preview-resolution figures in HTML/PDF export'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '-I', '--incremental',
+        action='store_true',
+        help='toggle rendering only the changed sections in HTML export'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '-L', '--bib', metavar='FILE',
+        default=None,
+        help='set the BibTeX file to resolve `[@key]` citations against'
+             ' [%(default)s]')
     arg_parser.add_argument(
         '-e', '--encoding', metavar='ENCODING',
         default='utf-8',
         help='set the encoding to use [%(default)s]')
+    arg_parser.add_argument(
+        '-R', '--rules', metavar='FILE',
+        default=None,
+        help='set the JSON rule file with the checks to use (None for the'
+             ' built-in limits) [%(default)s]')
+    arg_parser.add_argument(
+        '-t', '--timeout', metavar='SECONDS',
+        type=float, default=None,
+        help='set the timeout of each external tool (None for tool defaults)'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '-r', '--retries', metavar='N',
+        type=int, default=D_RETRIES,
+        help='set the retries for transient external tool failures'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '-B', '--bundle', metavar='DELIMITER',
+        nargs='?', const='', default=None,
+        help='treat input as a multi-abstract bundle, split at top-level'
+             ' headers or at DELIMITER lines [%(default)s]')
+    arg_parser.add_argument(
+        '-u', '--resume',
+        action='store_true',
+        help='resume a bundle run, skipping the stages already completed'
+             ' with the same inputs [%(default)s]')
+    arg_parser.add_argument(
+        '-Q', '--queue', metavar='DIR',
+        default=None,
+        help='process the abstract directories of the input through a work'
+             ' queue in DIR (on a shared filesystem) [%(default)s]')
+    arg_parser.add_argument(
+        '--worker', metavar='DIR',
+        default=None,
+        help='run a worker for the work queue in DIR [%(default)s]')
+    arg_parser.add_argument(
+        '-j', '--jobs', metavar='N',
+        type=int, default=1,
+        help='set the number of parallel jobs [%(default)s]')
+    arg_parser.add_argument(
+        '-n', '--explain',
+        action='store_true',
+        help='explain what would be rebuilt, without running [%(default)s]')
+    arg_parser.add_argument(
+        '--history', metavar='N',
+        type=int, nargs='?', const=0, default=None,
+        help='show the stage timings over the last N runs (0 for all)'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '--usage',
+        action='store_true',
+        help='show the resource usage of the external tools (from logs)'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '--toolchain',
+        action='store_true',
+        help='probe and show the external tools (use -f to refresh)'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '--wc-history', metavar='N',
+        type=int, nargs='?', const=0, default=None,
+        help='show the word counts over the last N git revisions (0 for all)'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '--wc-diff', metavar='REV',
+        nargs=2, default=None,
+        help='show the word count differences between two git revisions'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '-A', '--analytics', metavar='NPZ',
+        nargs='?', const='', default=None,
+        help='show the statistics of a corpus of abstracts (input directory'
+             ' or .npz), optionally saving its columns to NPZ [%(default)s]')
+    arg_parser.add_argument(
+        '-D', '--duplicates', metavar='THRESHOLD',
+        type=float, nargs='?', const=D_DUP_THRESHOLD, default=None,
+        help='show the near-duplicate abstracts of a corpus (input directory)'
+             ' with similarity above THRESHOLD [%(default)s]')
+    arg_parser.add_argument(
+        '-w', '--wait',
+        action='store_true',
+        help='wait for an in-progress run on the same abstract to complete'
+             ' [%(default)s]')
+    arg_parser.add_argument(
+        '--benchmark', metavar='SIZE',
+        type=int, nargs='?', const=D_BENCH_SIZE, default=None,
+        help='benchmark the Markdown scanners on pathological inputs of'
+             ' about SIZE characters [%(default)s]')
+    arg_parser.add_argument(
+        '--daemon',
+        action='store_true',
+        help='run as a resident daemon serving `ismrm_client.py` requests'
+             ' [%(default)s]')
     return arg_parser
 
 
 # ======================================================================
-def main():
+def main(argv=None):
     # :: handle program parameters
     arg_parser = handle_arg()
-    args = arg_parser.parse_args()
+    args = arg_parser.parse_args(argv)
     # fix verbosity in case of 'quiet'
     if args.quiet:
         args.verbose = VERB_LVL['none']
@@ -1106,7 +6646,76 @@ def main():
 
     kws = vars(args)
     kws.pop('quiet')
-    ismrm_abstract(**kws)
+    modes = dict((name, kws.pop(name)) for name in _MODE_ARGS)
+    rules = kws.pop('rules')
+    if rules:
+        kws['limits'] = rules
+    try:
+        with cancellation() as cancel:
+            kws['cancel'] = cancel
+            if modes['bundle'] is not None:
+                ismrm_bundle(
+                    delimiter=modes['bundle'] or None, jobs=modes['jobs'],
+                    resume=modes['resume'], **kws)
+            elif modes['queue'] is not None:
+                queue_coordinator(
+                    queue_dirpath=modes['queue'], jobs=modes['jobs'], **kws)
+            elif modes['worker'] is not None:
+                queue_worker(
+                    modes['worker'], cancel=cancel, verbose=args.verbose)
+            elif modes['explain']:
+                explain(
+                    kws['in_filepath'], kws['out_filepath'], kws['export'],
+                    kws['backup'], kws['css'], kws['preview'], kws['bib'],
+                    kws['force'], verbose=args.verbose)
+            elif modes['analytics'] is not None:
+                try:
+                    print_corpus_stats(
+                        kws['in_filepath'], modes['analytics'] or None,
+                        encoding=kws['encoding'], jobs=modes['jobs'],
+                        verbose=args.verbose)
+                except ImportError:
+                    msg('E: analytics require NumPy.', args.verbose)
+                    sys.exit(1)
+            elif modes['duplicates'] is not None:
+                try:
+                    print_duplicates(
+                        kws['in_filepath'], modes['duplicates'],
+                        encoding=kws['encoding'], verbose=args.verbose)
+                except ImportError:
+                    msg('E: duplicate detection requires NumPy.',
+                        args.verbose)
+                    sys.exit(1)
+            elif modes['daemon']:
+                serve(verbose=args.verbose)
+            elif modes['benchmark'] is not None:
+                if not print_benchmark(modes['benchmark'], args.verbose):
+                    sys.exit(1)
+            elif modes['usage']:
+                print_usage_summary(kws['in_filepath'], args.verbose)
+            elif modes['toolchain']:
+                print_toolchain(kws['force'], args.verbose)
+            elif modes['history'] is not None:
+                print_history(last=modes['history'])
+            elif modes['wc_history'] is not None:
+                print_word_count_history(
+                    kws['in_filepath'], modes['wc_history'], kws['encoding'],
+                    args.verbose)
+            elif modes['wc_diff'] is not None:
+                print_word_count_diff(
+                    kws['in_filepath'], *modes['wc_diff'],
+                    encoding=kws['encoding'], verbose=args.verbose)
+            else:
+                coalesce(
+                    kws['in_filepath'],
+                    functools.partial(ismrm_abstract, **kws),
+                    modes['wait'], args.verbose)
+    except (IOError, ValueError) as e:
+        msg('E: {}'.format(e), args.verbose)
+        sys.exit(1)
+    except KeyboardInterrupt:
+        msg('E: Interrupted.', args.verbose)
+        sys.exit(130)
 
     exec_time = datetime.datetime.now() - begin_time
     msg('ExecTime: {}'.format(exec_time), args.verbose, VERB_LVL['debug'])
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Thin client for the ISMRM abstracts checker.
+
+Forward the command-line arguments (with the working directory and the
+environment) to a resident `ismrm_abstract.py --daemon`, and stream back its
+output and exit code.
+If no daemon is running, one is started in the background and the command
+is run in-process.
+
+The arguments are the same as for `ismrm_abstract.py`.
+"""
+
+#    Copyright (C) 2015-2018 Riccardo Metere <riccardo@metere.it>
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# ======================================================================
+# :: Python Standard Library Imports
+# (only lightweight modules: startup time is the point of this client)
+import os  # Miscellaneous operating system interfaces
+import sys  # System-specific parameters and functions
+import json  # JSON encoder and decoder
+import socket  # Low-level networking interface
+import struct  # Interpret bytes as packed binary data
+import subprocess  # Subprocess management
+
+# ======================================================================
+# :: must match `D_DAEMON_SOCKET` and `_DAEMON_FRAME` in `ismrm_abstract.py`
+D_DAEMON_SOCKET = os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or os.path.join(
+        os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache')),
+        'ismrm_abstract'),
+    'ismrm_abstract.sock')
+_DAEMON_FRAME = struct.Struct('>cI')  # channel, length
+
+SCRIPT_FILEPATH = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), 'ismrm_abstract.py')
+
+
+# ======================================================================
+def _recv_exact(
+        conn,
+        size):
+    """
+    Receive exactly the specified number of bytes from a socket.
+
+    Args:
+        conn (socket.socket): The connection.
+        size (int): The number of bytes.
+
+    Returns:
+        data (bytes|None): The data. None if the connection was closed.
+    """
+    chunks = []
+    while size > 0:
+        chunk = conn.recv(min(size, 65536))
+        if not chunk:
+            return None
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+# ======================================================================
+def forward(
+        argv,
+        socket_filepath=D_DAEMON_SOCKET):
+    """
+    Forward a command-line invocation to the resident daemon.
+
+    Args:
+        argv (list[str]): The command-line arguments.
+        socket_filepath (str): The daemon Unix domain socket filepath.
+
+    Returns:
+        code (int|None): The exit code.
+            If no daemon served the request (not running, or exiting before
+            producing any output), returns None.
+    """
+    try:
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    except AttributeError:
+        return None
+    with conn:
+        try:
+            conn.connect(socket_filepath)
+            conn.sendall(json.dumps(dict(
+                argv=argv, cwd=os.getcwd(),
+                env=dict(os.environ))).encode('utf-8') + b'\n')
+        except (IOError, OSError):
+            return None
+        has_output = False
+        while True:
+            header = _recv_exact(conn, _DAEMON_FRAME.size)
+            channel, size = _DAEMON_FRAME.unpack(header) \
+                if header else (None, 0)
+            data = _recv_exact(conn, size) if header else None
+            if data is None:
+                # : the daemon went away
+                return 1 if has_output else None
+            if channel == b'x':
+                return int(data)
+            stream = sys.stdout if channel == b'o' else sys.stderr
+            try:
+                stream.buffer.write(data)
+                stream.flush()
+            except BrokenPipeError:
+                # : e.g. piped into `head`: discard the rest of the output
+                os.dup2(os.open(os.devnull, os.O_WRONLY), stream.fileno())
+                return 1
+            has_output = True
+
+
+# ======================================================================
+def start_daemon(script_filepath=SCRIPT_FILEPATH):
+    """
+    Start the resident daemon in the background.
+
+    Args:
+        script_filepath (str): The `ismrm_abstract.py` filepath.
+
+    Returns:
+        None.
+    """
+    if hasattr(socket, 'AF_UNIX'):
+        subprocess.Popen(
+            [sys.executable, script_filepath, '--daemon', '--quiet'],
+            stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL, cwd=os.path.dirname(script_filepath),
+            start_new_session=True)
+
+
+# ======================================================================
+def main():
+    argv = sys.argv[1:]
+    code = forward(argv)
+    if code is None:
+        start_daemon()
+        sys.path.insert(0, os.path.dirname(SCRIPT_FILEPATH))
+        import ismrm_abstract
+        code = ismrm_abstract.run_main(argv)
+    sys.exit(code)
+
+
+# ======================================================================
+if __name__ == '__main__':
+    main()